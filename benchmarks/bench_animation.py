@@ -0,0 +1,43 @@
+# Write speed (frames per second) and peak memory of the streamed animated glTF export
+# Run from the repository root: python -m benchmarks.bench_animation
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+from modules import gltf
+from benchmarks import common
+
+def synthetic_frames(grid, n_frames):
+    # Bending-like response of a block scaled by a ramped load, one frame at a time
+    x = grid.points[:, 0] / grid.points[:, 0].max()
+    for index in range(n_frames):
+        load = (index + 1) / n_frames
+        displacement = np.zeros((grid.n_points, 3))
+        displacement[:, 2] = -load * 1e-3 * x ** 2
+        yield displacement, load * 250 * x
+
+def main():
+    parser = argparse.ArgumentParser(description="Animated glTF export benchmark")
+    parser.add_argument("--size", type=int, default=50, help="points per block edge")
+    parser.add_argument("--frames", type=int, nargs="+", default=[10, 50, 200])
+    args = parser.parse_args()
+
+    grid = common.box_grid((args.size,) * 3, (0.01, 0.01, 0.01))
+    gltf.surface_topology(grid)
+    output_file = os.path.join(tempfile.mkdtemp(), "animation.glb")
+
+    print(f"{'frames':>8} {'time [s]':>10} {'fps':>8} {'peak [MB]':>10} {'size [MB]':>10}")
+    for n_frames in args.frames:
+        tracemalloc.start()
+        start = time.perf_counter()
+        gltf.write_animated_glb(grid, synthetic_frames(grid, n_frames), n_frames, output_file, scale=lambda max_magnitude: 50.0)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        size = os.path.getsize(output_file) / 1e6
+        print(f"{n_frames:>8} {elapsed:10.2f} {n_frames / elapsed:8.1f} {peak / 1e6:10.1f} {size:10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# Benchmark of the model extent engine against the previous cdist path
+# Run from the repository root: python -m benchmarks.bench_extent
+import argparse
+import numpy as np
+from scipy.spatial.distance import cdist
+from modules import extent
+from benchmarks import common
+
+def synthetic_beam_mesh(n_nodes, seed=0):
+    # Random nodes inside a slender beam-like box (length 1 m, section 26 x 27 mm)
+    rng = np.random.default_rng(seed)
+    return rng.random((n_nodes, 3)) * np.array([1.0, 0.026, 0.027])
+
+def cdist_extent(points):
+    return float(np.max(cdist(points, points)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Model extent benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--cdist-memory-limit", type=float, default=2.0,
+                        help="Skip the cdist path when its distance matrix exceeds this many GB")
+    args = parser.parse_args()
+
+    common.header(("nodes", ">10"), ("cdist [s]", ">12"), ("hull [s]", ">10"), ("bbox [s]", ">10"), ("hull diameter", ">14"), ("bbox diagonal", ">14"))
+    for n_nodes in args.sizes:
+        points = synthetic_beam_mesh(n_nodes)
+        hull_value, hull_time = common.timed(extent.hull_diameter, points)
+        bbox_value, bbox_time = common.timed(extent.bounding_box_diagonal, points)
+
+        matrix_gb = n_nodes ** 2 * 8 / 1e9
+        if matrix_gb <= args.cdist_memory_limit:
+            cdist_value, cdist_time = common.timed(cdist_extent, points)
+            assert np.isclose(cdist_value, hull_value), (cdist_value, hull_value)
+            cdist_report = f"{cdist_time:12.3f}"
+        else:
+            cdist_report = f"{'skip ' + format(matrix_gb, '.0f') + 'GB':>12}"
+
+        print(f"{n_nodes:>10} {cdist_report} {hull_time:10.3f} {bbox_time:10.4f} {hull_value:14.6f} {bbox_value:14.6f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# Benchmark of the cached S-N curve engine against the previous per-call interp1d path
+# Run from the repository root: python -m benchmarks.bench_fatigue_curve
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.interpolate import interp1d
+from modules import fatigue_curve
+from benchmarks import common
+
+def previous_cycles_to_failure(stress_array, sn_curve_file_path):
+    # Previous implementation of damage.calculate_cycles_to_failure
+    sn_data = pd.read_csv(sn_curve_file_path, delimiter=';')
+    stress_values, cycle_values = sn_data['Stress'].values, sn_data['Cycles'].values
+    log_sn_interp = interp1d(np.log10(stress_values), np.log10(cycle_values), kind='linear', fill_value="extrapolate")
+    cycles_to_failure = np.power(10, log_sn_interp(np.log10(stress_array)))
+    max_cycle = max(cycle_values)
+    return [max_cycle if x > max_cycle else x for x in cycles_to_failure]
+
+def main():
+    parser = argparse.ArgumentParser(description="S-N curve benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[40_000, 1_000_000])
+    parser.add_argument("--sn-curve", default="data/raw/sn_curve.csv")
+    args = parser.parse_args()
+    config = {"additional_files": {"sn_curve_file": args.sn_curve}}
+
+    common.header(("nodes", ">10"), ("previous [s]", ">13"), ("cold [s]", ">10"), ("cached [s]", ">11"), ("speedup", ">8"))
+    for n_nodes in args.sizes:
+        # Von Mises stresses spanning the whole curve and beyond its ends
+        stress_array = np.random.default_rng(0).uniform(1, 5000, n_nodes)
+        previous, previous_time = common.timed(previous_cycles_to_failure, stress_array, args.sn_curve)
+
+        fatigue_curve._curves.clear()
+        cycles, cold_time = common.timed(fatigue_curve.cycles_to_failure, stress_array, config)
+        _, cached_time = common.timed(fatigue_curve.cycles_to_failure, stress_array, config)
+        assert np.allclose(cycles, previous)
+
+        print(f"{n_nodes:>10} {previous_time:13.3f} {cold_time:10.3f} {cached_time:11.4f} {previous_time / cached_time:7.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Size and throughput of the field export formats on the result files in data/output
+# Run from the repository root: python -m benchmarks.bench_field_export
+import os
+import shutil
+import argparse
+import tempfile
+import pandas as pd
+from modules import field_export
+from modules.field import ResultField
+from benchmarks import common
+
+def directory_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+
+def main():
+    parser = argparse.ArgumentParser(description="Field export benchmark")
+    parser.add_argument("--output-dir", default="data/output")
+    parser.add_argument("--formats", nargs="+", default=field_export.FIELD_FORMATS)
+    args = parser.parse_args()
+
+    field_files = sorted(file for file in os.listdir(args.output_dir) if file.endswith("_field_data.json"))
+    common.header(("field", "<20"), ("format", "<8"), ("size [kB]", ">10"), ("write [ms]", ">11"), ("read [ms]", ">10"), ("read [MB/s]", ">12"))
+    for field_file in field_files:
+        source = os.path.join(args.output_dir, field_file)
+        result_frame, parse_time = common.timed(pd.read_json, source, orient='records', lines=True)
+        result_data = ResultField.from_dataframe(result_frame)
+        result_detail = result_data.name
+        operation = result_detail.split("_", 1)
+        input_data = {
+            "input_parameters": {"operation": operation, "named_selection": "All Body"},
+            "output_files": {"data_file": {"field_data": "field_data.json"}},
+        }
+
+        print(f"{result_detail:<20} {'source':<8} {os.path.getsize(source) / 1e3:10.0f} {'':>11} {parse_time * 1e3:10.1f} {os.path.getsize(source) / 1e6 / parse_time:12.1f}")
+        for field_format in args.formats:
+            target_dir = tempfile.mkdtemp()
+            input_data["output_files"]["data_file"]["field_format"] = field_format
+            try:
+                path, write_time = common.timed(field_export.export_field, result_data, target_dir, input_data)
+            except ImportError as e:
+                print(f"{result_detail:<20} {field_format:<8} skipped: {e}")
+                continue
+            # Read without memory-mapping so the full data is actually loaded
+            _, read_time = common.timed(field_export.read_field, path, result_detail, mmap=False)
+            size = directory_size(path)
+            print(f"{result_detail:<20} {field_format:<8} {size / 1e3:10.0f} {write_time * 1e3:11.1f} {read_time * 1e3:10.1f} {size / 1e6 / read_time:12.1f}")
+            shutil.rmtree(target_dir)
+
+if __name__ == "__main__":
+    main()
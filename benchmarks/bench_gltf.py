@@ -0,0 +1,54 @@
+# Direct .glb writer against the pv.Plotter glTF export, cold and with the cached surface topology
+# Run from the repository root: python -m benchmarks.bench_gltf
+import os
+import argparse
+import tempfile
+import numpy as np
+import pyvista as pv
+from modules import gltf
+from benchmarks import common
+
+def synthetic_grid(n):
+    # Hexahedral block of n^3 points carrying one scalar field
+    grid = common.box_grid((n, n, n), (0.01, 0.01, 0.01))
+    grid["stress_von_mises"] = np.linalg.norm(grid.points, axis=1) * 1e3
+    return grid
+
+def plotter_export(grid, output_file):
+    plotter = pv.Plotter(off_screen=True)
+    plotter.add_mesh(grid)
+    plotter.export_gltf(output_file)
+    plotter.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Direct glTF export benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 50, 80])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    output_dir = tempfile.mkdtemp()
+    common.header(("points", ">10"), ("path", "<16"), ("time [ms]", ">10"), ("size [MB]", ">10"))
+    for n in args.sizes:
+        grid = synthetic_grid(n)
+        paths = {
+            "plotter gltf": os.path.join(output_dir, "plotter.gltf"),
+            "glb cold": os.path.join(output_dir, "direct.glb"),
+            "glb warm": os.path.join(output_dir, "direct.glb"),
+            "glb quantized": os.path.join(output_dir, "quantized.glb"),
+        }
+        timings = {}
+        try:
+            _, timings["plotter gltf"] = common.timed(plotter_export, grid, paths["plotter gltf"])
+        except Exception as e:
+            print(f"{grid.n_points:>10} {'plotter gltf':<16} unavailable ({e})")
+        gltf._topologies.clear()
+        _, timings["glb cold"] = common.timed(gltf.write_glb, grid, paths["glb cold"])
+        # Later exports of the same mesh only rewrite positions and colors
+        timings["glb warm"] = min(common.timed(gltf.write_glb, grid, paths["glb warm"])[1] for _ in range(args.repeat))
+        timings["glb quantized"] = min(common.timed(gltf.write_glb, grid, paths["glb quantized"], quantize=True)[1] for _ in range(args.repeat))
+        for label, elapsed in timings.items():
+            size = os.path.getsize(paths[label]) / 1e6
+            print(f"{grid.n_points:>10} {label:<16} {elapsed * 1e3:10.1f} {size:10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Replay of an IoT load recording through the ingestion pipeline: throughput and end-to-end latency per batch size
+# Run from the repository root: python -m benchmarks.bench_ingest
+# The file replay reads as fast as the pipeline accepts; the broker replay publishes at a fixed rate
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import numpy as np
+from modules import utility, ingest, miner
+
+class LinearTwin:
+    # Twin stand-in whose stress snapshot scales with the force, like a linear static TBROM
+    def __init__(self, n_points, rng):
+        self.points = rng.random((n_points, 3))
+        self.unit_stress = rng.standard_normal((n_points, 6)) * 0.01
+        self.force = 3000.0
+        self.outputs = {}
+
+    def initialize_evaluation(self, parameters=None, inputs=None, field_inputs=None):
+        self.force = (inputs or {}).get("Force_Magnitude", self.force)
+
+    def generate_snapshot(self, rom_name, on_disk=False, named_selection=None):
+        return (self.unit_stress * self.force).ravel()
+
+    def generate_points(self, rom_name, on_disk=False, named_selection=None):
+        return self.points.ravel()
+
+def recording(n_readings, rng):
+    # Sinusoidal load with noise inside the input bounds, one JSON line per reading
+    t = np.arange(n_readings) * 0.01
+    force = 3950 + 900 * np.sin(2 * np.pi * 0.5 * t) + rng.normal(0, 20, n_readings)
+    return [json.dumps({"timestamp": float(stamp), "Force_Magnitude": float(value)}) + "\n" for stamp, value in zip(t, force)]
+
+def pipeline(config, input_data, twin, state_dir, batch_size):
+    unit_vm, _ = miner.unit_von_mises(twin, "SSB_bench", None, input_data, "Force_Magnitude")
+    accumulator = miner.DamageAccumulator(unit_vm, config, state_dir)
+    evaluator = ingest.BatchEvaluator(config, input_data, twin, "SSB_bench", None, accumulator=accumulator, load_input="Force_Magnitude")
+    return ingest.IngestPipeline(config, evaluator, lambda record: None, batch_size=batch_size)
+
+async def replay_broker(pipe, lines, rate):
+    broker = ingest.LocalBroker()
+    source = ingest.broker_source(broker, "twin/readings")
+
+    async def publish():
+        # Wait for the subscription, then publish on a fixed schedule
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        for index, line in enumerate(lines):
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await broker.publish("twin/readings", line)
+        await broker.close("twin/readings")
+
+    publisher = asyncio.create_task(publish())
+    stats = await pipe.run([source])
+    await publisher
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion replay benchmark")
+    parser.add_argument("--readings", type=int, default=3000)
+    parser.add_argument("--points", type=int, default=20_000, help="ROM points of the twin stand-in")
+    parser.add_argument("--rate", type=float, default=1000.0, help="publishing rate of the broker replay [readings/s]")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128])
+    args = parser.parse_args()
+
+    config = utility.load_config("config.yaml")
+    config["reduced_basis"] = {"enabled": False}
+    input_data = {
+        "twin_inputs": {"rom_inputs": {"Force_Magnitude": 3000.0}},
+        "input_parameters": {"operation": ["stress", "von_mises"], "named_selection": "All Body"},
+    }
+    rng = np.random.default_rng(0)
+    twin = LinearTwin(args.points, rng)
+    lines = recording(args.readings, rng)
+    work_dir = tempfile.mkdtemp()
+    recording_file = os.path.join(work_dir, "readings.jsonl")
+    with open(recording_file, "w") as f:
+        f.writelines(lines)
+
+    print(f"{args.readings} readings, {args.points} ROM points, broker publishing at {args.rate:.0f} readings/s")
+    print(f"{'source':<8} {'batch':>6} {'batches':>8} {'readings/s':>11} {'p50 [ms]':>9} {'p95 [ms]':>9} {'p99 [ms]':>9}")
+    for source in ("file", "broker"):
+        for batch_size in args.batch_sizes:
+            state_dir = os.path.join(work_dir, f"state_{source}_{batch_size}")
+            pipe = pipeline(config, input_data, twin, state_dir, batch_size)
+            if source == "file":
+                stats = asyncio.run(pipe.run([ingest.file_source(recording_file)]))
+            else:
+                stats = asyncio.run(replay_broker(pipe, lines, args.rate))
+            latency = stats["latency_ms"]
+            print(f"{source:<8} {batch_size:>6} {stats['batches']:>8} {stats['readings_per_s']:11.0f} "
+                  f"{latency['p50']:9.1f} {latency['p95']:9.1f} {latency['p99']:9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Benchmark of the vectorized stress invariant engine against the previous per-row loop
+# Run from the repository root: python -m benchmarks.bench_invariants
+import argparse
+import numpy as np
+from modules import invariants
+from benchmarks import common
+
+def loop_von_mises(stress_array):
+    # Previous implementation of stress.calculate_von_mises
+    von_mises_stresses = []
+    for stress in stress_array:
+        sigma_xx, sigma_yy, sigma_zz, sigma_xy, sigma_yz, sigma_zx = stress
+        von_mises = np.sqrt(
+            0.5 * (
+                (sigma_xx - sigma_yy) ** 2 +
+                (sigma_yy - sigma_zz) ** 2 +
+                (sigma_zz - sigma_xx) ** 2 +
+                6 * (sigma_xy ** 2 + sigma_yz ** 2 + sigma_zx ** 2)
+            )
+        )
+        von_mises_stresses.append(von_mises)
+    return np.array(von_mises_stresses)
+
+def synthetic_stress_field(n_nodes, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(scale=50.0, size=n_nodes * 6)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress invariant benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[40_000, 1_000_000, 10_000_000])
+    parser.add_argument("--loop-limit", type=int, default=1_000_000,
+                        help="Largest field timed with the Python loop, larger ones are extrapolated")
+    args = parser.parse_args()
+
+    common.header(("nodes", ">10"), ("loop vm [s]", ">12"), ("vm [s]", ">9"), ("all f64 [s]", ">12"), ("all f32 [s]", ">12"), ("speedup vm", ">11"))
+    for n_nodes in args.sizes:
+        field = synthetic_stress_field(n_nodes)
+
+        loop_nodes = min(n_nodes, args.loop_limit)
+        loop_field = invariants.as_components(field)[:loop_nodes]
+        loop_vm, loop_time = common.timed(loop_von_mises, loop_field)
+        loop_time *= n_nodes / loop_nodes
+        estimated = "~" if loop_nodes < n_nodes else " "
+
+        vm, vm_time = common.timed(invariants.stress_invariants, field, ["von_mises"])
+        assert np.allclose(vm["von_mises"][:loop_nodes], loop_vm)
+        _, all_time = common.timed(invariants.stress_invariants, field)
+        _, all32_time = common.timed(invariants.stress_invariants, field, dtype=np.float32)
+
+        print(f"{n_nodes:>10} {estimated}{loop_time:11.3f} {vm_time:9.3f} {all_time:12.3f} {all32_time:12.3f} {loop_time / vm_time:10.0f}x")
+
+if __name__ == "__main__":
+    main()
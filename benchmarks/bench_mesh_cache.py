@@ -0,0 +1,63 @@
+# Cold (parse and write the bundle) and warm (memory-mapped, zero-copy grid) mesh load times
+# Run from the repository root: python -m benchmarks.bench_mesh_cache [--rst data/raw/file.rst]
+# Without an RST (or without DPF), a synthetic grid read from .vtu stands in for the RST parsing
+import os
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pyvista as pv
+from modules import mesh_cache, utility
+from benchmarks import common
+
+def synthetic_rst(output_dir, n):
+    # Hexahedral block written as .vtu, read back by the stand-in extract_mesh
+    grid = common.box_grid((n, n, n), (1.0, 1.0, 1.0))
+    rst_file = os.path.join(output_dir, "synthetic.vtu")
+    grid.save(rst_file)
+
+    class SyntheticMesh:
+        available_named_selections = []
+
+    def extract_mesh(rst_file):
+        return SyntheticMesh(), pv.read(rst_file), "mm"
+    return rst_file, extract_mesh
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesh cache benchmark")
+    parser.add_argument("--rst", default=None, help="RST file to parse through DPF")
+    parser.add_argument("--size", type=int, default=100, help="points per edge of the synthetic block")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    cache_dir = os.path.join(work_dir, "cache")
+    if args.rst:
+        rst_file = args.rst
+    else:
+        rst_file, utility.extract_mesh = synthetic_rst(work_dir, args.size)
+
+    (_, grid, unit), parse_time = common.timed(utility.extract_mesh, rst_file)
+    print(f"mesh: {grid.n_points} points, {grid.n_cells} cells, unit {unit}")
+    common.header(("load", "<28"), ("time [ms]", ">10"))
+    print(f"{'parse (no cache)':<28} {parse_time * 1e3:10.1f}")
+
+    _, cold = common.timed(mesh_cache.load_mesh, rst_file, cache_dir)
+    print(f"{'cold (parse + bundle)':<28} {cold * 1e3:10.1f}")
+
+    warm_times, touch_times = [], []
+    for _ in range(args.repeat):
+        # A new run: nothing in memory but the bundle on disk
+        mesh_cache._meshes.clear()
+        (_, warm_grid, _), warm = common.timed(mesh_cache.load_mesh, rst_file, cache_dir)
+        _, touch = common.timed(lambda: float(np.asarray(warm_grid.points).sum()) + warm_grid.n_cells)
+        warm_times.append(warm)
+        touch_times.append(touch)
+    print(f"{'warm (mmap, zero-copy)':<28} {min(warm_times) * 1e3:10.1f}")
+    print(f"{'first full read of points':<28} {min(touch_times) * 1e3:10.1f}")
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(cache_dir) for name in names)
+    print(f"bundle size: {size / 1e6:.1f} MB")
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# Memory, export size and accuracy of the float32 precision policy against float64
+# Run from the repository root: python -m benchmarks.bench_precision
+# Every precision runs in its own process from a cached mesh bundle and a cached projection operator, like a warm run;
+# peak RSS is the growth of the process peak during the evaluation (reset through /proc on Linux),
+# mesh and fields are the arrays VTK holds
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from modules import utility, precision, projection, stress, damage, field_export, mesh_cache, tracing
+from benchmarks import common
+
+PRECISIONS = ("float64", "float32")
+
+class SnapshotTwin:
+    # Evaluated twin reduced to a fixed point cloud and a smooth stress snapshot in MPa, new float64 arrays on every call like pytwin
+    def __init__(self, n_points, seed=0):
+        rng = np.random.default_rng(seed)
+        self.points = rng.random((n_points, 3))
+        waves, phases = rng.uniform(1, 4, (3, 6)), rng.uniform(0, 2 * np.pi, 6)
+        self.snapshot = 60 * np.sin(2 * np.pi * self.points @ waves + phases)
+        self.outputs = {}
+
+    def generate_points(self, rom_name, on_disk=False, named_selection=None):
+        return self.points.ravel().copy()
+
+    def generate_snapshot(self, rom_name, on_disk=False, named_selection=None):
+        return self.snapshot.ravel().copy()
+
+def settings(dtype):
+    config = utility.load_config("config.yaml")
+    config["reduced_basis"] = {"enabled": False}
+    config["precision"] = {"dtype": dtype}
+    input_data = {
+        "input_parameters": {"operation": ["stress", "von_mises"], "named_selection": "All Body"},
+        "output_files": {"data_file": {"field_data": "field_data.json", "field_format": "json"}},
+    }
+    return config, input_data
+
+def reset_peak_rss():
+    # Restart the peak RSS of the process from its current RSS (Linux), elsewhere the peak since start is kept
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 1024
+    except (OSError, StopIteration):
+        return tracing.peak_rss_mb()
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmRSS")) / 1024
+    except (OSError, StopIteration):
+        return tracing.peak_rss_mb()
+
+def directory_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+
+def prepare(args, work_dir):
+    # Mesh bundle of a 1 m cube meshed in mm and the projection operator of every precision
+    spacing = 1000.0 / (args.nodes - 1)
+    grid = common.box_grid((args.nodes,) * 3, (spacing,) * 3)
+    grid.points = utility.convert_to_meters(np.asarray(grid.points, dtype=float), "mm")
+    twin = SnapshotTwin(args.rom_points)
+    for dtype in PRECISIONS:
+        config, _ = settings(dtype)
+        bundle_dir = os.path.join(work_dir, "mesh", dtype)
+        mesh_cache.write_bundle(bundle_dir, grid, "mm", {}, float_dtype=precision.float_dtype(config), index_dtype=precision.index_dtype(config))
+        points = precision.as_float(twin.points, config)
+        projection.projection_operator(mesh_cache.CachedMesh(bundle_dir).grid.points, points, cache_dir=work_dir)
+    return grid.n_points
+
+def evaluate(config, input_data, twin, bundle_dir, cache_dir):
+    # Mesh, snapshot, von Mises and damage, and the projection of both results
+    grid = mesh_cache.CachedMesh(bundle_dir).grid
+    outfield, points = utility.get_result(twin, "SSB_bench", config=config)
+    von_mises = stress.get_result(config, utility.operation_input(input_data, ["stress", "von_mises"]), outfield, points)
+    fatigue_damage = damage.get_result(config, utility.operation_input(input_data, ["fatigue", "damage"]), outfield, points)
+    result_mesh = utility.project_results_on_mesh({"SSB_bench": [von_mises, fatigue_damage]}, grid, cache_dir=cache_dir)
+    return grid, von_mises, fatigue_damage, result_mesh
+
+def export_size(results, input_data, output_dir, field_format):
+    # Bytes written by the field exports of the results
+    size = 0
+    format_dir = os.path.join(output_dir, field_format)
+    os.makedirs(format_dir, exist_ok=True)
+    for result in results:
+        operation_input = utility.operation_input(input_data, result.name.split("_", 1))
+        operation_input["output_files"]["data_file"]["field_format"] = field_format
+        size += directory_size(field_export.export_field(result, format_dir, operation_input))
+    return size
+
+def measure(dtype, rom_points, formats, work_dir):
+    config, input_data = settings(dtype)
+    twin = SnapshotTwin(rom_points)
+    reset_peak_rss()
+    rss = current_rss_mb()
+    start = time.perf_counter()
+    grid, von_mises, fatigue_damage, result_mesh = evaluate(config, input_data, twin, os.path.join(work_dir, "mesh", dtype), work_dir)
+    elapsed = time.perf_counter() - start
+    peak_growth = peak_rss_mb() - rss
+    sizes = {}
+    for field_format in formats:
+        try:
+            sizes[field_format] = export_size([von_mises, fatigue_damage], input_data, os.path.join(work_dir, dtype), field_format)
+        except ImportError:
+            sizes[field_format] = None
+    mesh = sum(np.asarray(array).nbytes for array in (grid.points, mesh_cache.cell_connectivity(grid), mesh_cache.cell_offsets(grid)))
+    fields = {name: np.asarray(result_mesh[name]) for name in (von_mises.name, fatigue_damage.name)}
+    return {
+        "peak_rss_mb": peak_growth, "time_s": elapsed, "mesh_mb": mesh / 1e6, "sizes": sizes,
+        "fields_mb": sum(values.nbytes for values in fields.values()) / 1e6,
+        "von_mises": von_mises.values, "damage": fatigue_damage.values, "projected": fields,
+    }
+
+def errors(values, reference, floor=0.0):
+    # Largest error relative to the reference value over the points above floor * max, largest error relative to the max,
+    # and the points off by more than 1e-3 of the max (nearest ROM points swapped by float32 coordinates on near ties)
+    reference = np.atleast_1d(np.asarray(reference, dtype=float))
+    values = np.atleast_1d(np.asarray(values, dtype=float))
+    scale = np.abs(reference).max()
+    error = np.abs(values - reference)
+    keep = np.abs(reference) >= floor * scale
+    return float(np.max(error[keep] / np.abs(reference[keep]))), float(error.max() / scale), int((error > 1e-3 * scale).sum())
+
+def main():
+    parser = argparse.ArgumentParser(description="Precision policy benchmark")
+    parser.add_argument("--nodes", type=int, default=100, help="mesh nodes per side of the structured test mesh")
+    parser.add_argument("--rom-points", type=int, default=500_000)
+    parser.add_argument("--formats", nargs="+", default=["json", "hdf5"])
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    n_nodes = prepare(args, work_dir)
+    runs = {}
+    for dtype in PRECISIONS:
+        # A fresh process per precision, the peak RSS of one run does not hide the other
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            runs[dtype] = executor.submit(measure, dtype, args.rom_points, args.formats, work_dir).result()
+    shutil.rmtree(work_dir)
+
+    print(f"{n_nodes} mesh nodes, {args.rom_points} ROM points")
+    print(f"{'precision':<10} {'peak rss [MB]':>14} {'mesh [MB]':>10} {'fields [MB]':>12} {'time [s]':>9} "
+          + " ".join(f"{field_format + ' [MB]':>11}" for field_format in args.formats))
+    for dtype, run in runs.items():
+        sizes = " ".join(f"{run['sizes'][field_format] / 1e6:11.1f}" if run['sizes'][field_format] is not None else f"{'-':>11}" for field_format in args.formats)
+        print(f"{dtype:<10} {run['peak_rss_mb']:14.1f} {run['mesh_mb']:10.1f} {run['fields_mb']:12.1f} {run['time_s']:9.2f} {sizes}")
+
+    # Accuracy of float32 against float64, relative errors of damage over the points above 1e-6 of its max
+    full, compact = runs["float64"], runs["float32"]
+    vm_name, damage_name = list(full["projected"])
+    rows = [
+        ("von Mises at ROM points", compact["von_mises"], full["von_mises"], 1e-3),
+        ("max von Mises", compact["von_mises"].max(), full["von_mises"].max(), 0.0),
+        ("damage at ROM points", compact["damage"], full["damage"], 1e-6),
+        ("max damage", compact["damage"].max(), full["damage"].max(), 0.0),
+        ("projected von Mises", compact["projected"][vm_name], full["projected"][vm_name], 1e-3),
+        ("projected damage", compact["projected"][damage_name], full["projected"][damage_name], 1e-6),
+    ]
+    print(f"{'result':<26} {'max rel err':>12} {'max err / max':>14} {'points > 1e-3':>14}")
+    for label, values, reference, floor in rows:
+        relative, normalized, off = errors(values, reference, floor)
+        print(f"{label:<26} {relative:12.2e} {normalized:14.2e} {off:>14}")
+
+if __name__ == "__main__":
+    main()
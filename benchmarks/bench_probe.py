@@ -0,0 +1,62 @@
+# Latency of virtual-sensor probes against evaluating every suboperation on the whole field
+# Run from the repository root: python -m benchmarks.bench_probe
+import time
+import argparse
+import tempfile
+import numpy as np
+from modules import utility, probe, stress
+
+class SnapshotTwin:
+    # Evaluated twin reduced to what the probe reads: a fixed point cloud and one stress snapshot
+    def __init__(self, n_points, rng):
+        self.points = rng.random((n_points, 3))
+        self.snapshot = rng.standard_normal((n_points, 6)) * 100
+        self.outputs = {}
+
+    def generate_points(self, rom_name, on_disk=False, named_selection=None):
+        return self.points.ravel()
+
+    def generate_snapshot(self, rom_name, on_disk=False, named_selection=None):
+        return self.snapshot.ravel()
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual-sensor probe benchmark")
+    parser.add_argument("--points", type=int, default=200_000, help="ROM points")
+    parser.add_argument("--queries", type=int, nargs="+", default=[10, 1_000, 10_000])
+    args = parser.parse_args()
+
+    config = utility.load_config("config.yaml")
+    config["reduced_basis"] = {"enabled": False}
+    input_data = {"input_parameters": {"operation": ["stress", "von_mises"], "named_selection": "All Body"}}
+    rng = np.random.default_rng(0)
+    twin = SnapshotTwin(args.points, rng)
+    cache_dir = tempfile.mkdtemp()
+
+    start = time.perf_counter()
+    probe.probe_index(twin, "SSB_bench", None, cache_dir=cache_dir)
+    build_ms = (time.perf_counter() - start) * 1e3
+    start = time.perf_counter()
+    probe.point_tree(twin.points, cache_dir=cache_dir)
+    load_ms = (time.perf_counter() - start) * 1e3
+    print(f"{args.points} ROM points: KD-tree built in {build_ms:.1f} ms, reloaded from cache in {load_ms:.1f} ms")
+
+    # Baseline: every stress suboperation over the whole field, as the full pipeline computes them, then a lookup
+    suboperations = config["available_operations"]["stress"]["suboperations"]
+    start = time.perf_counter()
+    full = {sub: stress.get_result(config, utility.operation_input(input_data, ["stress", sub]), twin.snapshot, twin.points).values for sub in suboperations}
+    full_ms = (time.perf_counter() - start) * 1e3
+
+    print(f"{'queries':>8} {'method':<8} {'probe [ms]':>11} {'full field [ms]':>16} {'max abs err':>12}")
+    for n_queries in args.queries:
+        # Sensors sit on ROM points so nearest and idw can both be checked against the full field
+        sensors = rng.choice(args.points, n_queries, replace=False)
+        coordinates = twin.points[sensors]
+        for method in probe.PROBE_METHODS:
+            start = time.perf_counter()
+            probed = probe.probe(config, input_data, twin, "SSB_bench", None, coordinates, operations=["stress"], method=method)
+            probe_ms = (time.perf_counter() - start) * 1e3
+            error = max(float(np.abs(probed["values"][f"stress_{sub}"] - full[sub][sensors]).max()) for sub in suboperations)
+            print(f"{n_queries:>8} {method:<8} {probe_ms:11.2f} {full_ms:16.2f} {error:12.2e}")
+
+if __name__ == "__main__":
+    main()
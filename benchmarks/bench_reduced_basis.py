@@ -0,0 +1,79 @@
+# Reduced-basis reconstruction of TBROM fields against the twin snapshot path, on a synthetic TBROM
+# Run from the repository root: python -m benchmarks.bench_reduced_basis
+# pytwin's own TbRom rebuilds the reference snapshot, every reconstruction is checked against it
+import os
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+from modules import reduced_basis
+from benchmarks import common
+
+def write_tbrom(tbrom_dir, n_points, n_modes, dimension, transformation, named_selections, rng):
+    # Resource directory of a TBROM with a random basis, in the layout the twin runtime extracts
+    field_dir = os.path.join(tbrom_dir, reduced_basis.OUTPUT_FIELD_DIR)
+    os.makedirs(field_dir, exist_ok=True)
+    n_values = n_points * dimension
+    with open(os.path.join(tbrom_dir, reduced_basis.PROPERTIES_FILE), "w") as f:
+        json.dump({"productVersion": "SVDTools", "fields": {"outField": {
+            "fieldType": "binaryOutputField", "nbDof": n_values, "nbModes": n_modes, "transformation": transformation}}}, f)
+    with open(os.path.join(field_dir, reduced_basis.SETTINGS_FILE), "w") as f:
+        json.dump({"name": "stress", "unit": "Pa", "dimensionality": [dimension], "location": "nodal",
+                   "namedSelections": named_selections}, f)
+    with open(os.path.join(field_dir, reduced_basis.BASIS_FILE), "wb") as f:
+        f.write(b"basis".ljust(16, b"\0"))
+        np.array([n_values, n_modes], dtype=np.uint64).tofile(f)
+        for _ in range(n_modes):
+            rng.standard_normal(n_values).tofile(f)
+    with open(os.path.join(field_dir, reduced_basis.POINTS_FILE), "wb") as f:
+        np.array([n_points * 3], dtype=np.uint64).tofile(f)
+        rng.random((n_points, 3)).tofile(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Reduced-basis reconstruction benchmark")
+    parser.add_argument("--points", type=int, default=200_000)
+    parser.add_argument("--modes", type=int, default=20)
+    parser.add_argument("--dimension", type=int, default=6)
+    parser.add_argument("--sensors", type=int, default=10, help="monitored points of the virtual-sensor query")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    from pytwin.evaluate.tbrom import TbRom
+
+    rng = np.random.default_rng(0)
+    tbrom_dir = tempfile.mkdtemp()
+    # One named selection given as a range, the way settings.json compresses contiguous ids
+    selection_end = args.points // 10
+    write_tbrom(tbrom_dir, args.points, args.modes, args.dimension, {"function": "min", "minValue": 1.5},
+                {"Weld": [0, -1, selection_end, selection_end + 7]}, rng)
+    outputs = {f"outField_mode_{mode}": float(value) for mode, value in enumerate(rng.standard_normal(args.modes), 1)}
+
+    # Reference: what generate_snapshot costs, the full field update of every evaluation and the extraction
+    tbrom = TbRom("SSB_bench", tbrom_dir)
+    tbrom._outmcs = dict(outputs)
+    tbrom._hasoutmcs = True
+    def twin_snapshot(named_selection=None):
+        tbrom._update_output_field()
+        return np.asarray(tbrom._generate_snapshot(False, None, named_selection))
+
+    start = time.perf_counter()
+    basis = reduced_basis.ReducedBasis(tbrom_dir, "SSB_bench", outputs)
+    load_ms = (time.perf_counter() - start) * 1e3
+    sensors = np.sort(rng.choice(args.points, args.sensors, replace=False))
+
+    cases = [
+        ("full field", lambda: twin_snapshot(), lambda: basis.snapshot(outputs)),
+        ("named selection", lambda: twin_snapshot("Weld"), lambda: basis.snapshot(outputs, "Weld")),
+        (f"{args.sensors} sensors", lambda: twin_snapshot()[sensors], lambda: basis.field(basis.coefficients(outputs), sensors)),
+    ]
+    print(f"{args.points} points, {args.modes} modes, {args.dimension} components, basis opened in {load_ms:.1f} ms")
+    common.header(("query", "<18"), ("twin [ms]", ">10"), ("basis [ms]", ">11"), ("speedup", ">8"), ("max abs err", ">12"))
+    for name, twin_func, basis_func in cases:
+        expected, twin_s = common.timed(twin_func, repeat=args.repeat)
+        actual, basis_s = common.timed(basis_func, repeat=args.repeat)
+        assert actual.shape == expected.shape, f"{name}: shape {actual.shape} instead of {expected.shape}"
+        error = float(np.abs(actual - expected).max())
+        print(f"{name:<18} {twin_s * 1e3:10.2f} {basis_s * 1e3:11.3f} {twin_s / basis_s:7.0f}x {error:12.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# Peak memory and latency of the ResultField container against the previous DataFrame path
+# Run from the repository root: python -m benchmarks.bench_result_field
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+from modules import stress, utility
+from modules.field import ResultField
+
+INPUT_DATA = {"input_parameters": {"operation": ["stress", "xz"], "named_selection": "All Body"}}
+
+def dataframe_path(outfield, points):
+    # Previous stress.get_result followed by the conversion in project_result_on_mesh
+    results = utility.unflatten_vector(outfield, 6)
+    loc_xyz = utility.unflatten_vector(points, 3)
+    result_data = pd.DataFrame({"x": loc_xyz[:, 0], "y": loc_xyz[:, 1], "z": loc_xyz[:, 2], "stress_xz": results[:, 5]})
+    nd_result_data = result_data.values[:, :].astype(float)
+    return nd_result_data[:, :3], nd_result_data[:, 3]
+
+def field_path(outfield, points):
+    result_data = stress.get_result(None, INPUT_DATA, outfield, points)
+    return np.asarray(result_data.points, dtype=float), np.asarray(result_data.values, dtype=float)
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Result container benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[40_000, 5_000_000])
+    args = parser.parse_args()
+
+    print(f"{'points':>10} {'path':<10} {'peak [MB]':>10} {'time [ms]':>10}")
+    for n_points in args.sizes:
+        rng = np.random.default_rng(0)
+        outfield = rng.normal(size=(n_points, 6))
+        points = rng.random((n_points, 3))
+        for label, func in (("dataframe", dataframe_path), ("field", field_path)):
+            peak, elapsed = measure(func, outfield, points)
+            print(f"{n_points:>10} {label:<10} {peak / 1e6:10.1f} {elapsed * 1e3:10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Result pipeline run one stage after another against the scheduler, with threads only and with process stages
+# Run from the repository root: python -m benchmarks.bench_scheduler
+# Twin initialization, mesh reading, the displacement twin and the 3d export are stand-ins sleeping for their usual
+# duration (native code releasing the GIL); operations, scripts and field exports run the repository code
+import time
+import argparse
+import tempfile
+from functools import partial
+import numpy as np
+from modules import utility, scheduler, stress, field_export
+
+def io_stage(seconds, value=None):
+    # Stand-in of a stage spent in native code or waiting on files
+    def run(*inputs):
+        time.sleep(seconds)
+        return value
+    return run
+
+def operation(config, operation_input, snapshot):
+    # Module-level so the stage can be pickled to a worker process
+    return stress.get_result(config, operation_input, *snapshot)
+
+def pipeline(config, input_data, snapshot, points, suboperations, process_stages, output_dir):
+    settings = {"thread_workers": 4, "process_workers": 2, "process_stages": process_stages}
+    graph = scheduler.StageGraph()
+    graph.add("twin initialization", io_stage(0.3), outputs=["twin"])
+    graph.add("mesh extraction", io_stage(0.4), outputs=["mesh"])
+    graph.add("named selections", io_stage(0.02), inputs=["twin", "mesh"], outputs=["scoping"])
+    graph.add("snapshot generation", io_stage(0.05, (snapshot, points)), inputs=["scoping"], outputs=["snapshot"])
+    graph.add("displacement result", io_stage(0.3), inputs=["scoping"], outputs=["displacement"])
+    previous_export = []
+    for sub in suboperations:
+        operation_input = utility.operation_input(input_data, ["stress", sub])
+        graph.add(f"{sub} operation", partial(operation, config, operation_input), inputs=["snapshot"], outputs=[f"result:{sub}"],
+                  executor=scheduler.executor_for("operation", settings))
+        graph.add(f"{sub} scripts", partial(utility.run_script, operation_input, config), inputs=[f"result:{sub}"],
+                  outputs=[f"scripts:{sub}"], executor=scheduler.executor_for("scripts", settings))
+        graph.add(f"{sub} field export", lambda result, *previous, operation_input=operation_input: field_export.export_field(result, output_dir, operation_input),
+                  inputs=[f"result:{sub}"] + previous_export, outputs=[f"export:{sub}"])
+        previous_export = [f"export:{sub}"]
+    graph.add("projection", io_stage(0.15), inputs=[f"result:{sub}" for sub in suboperations], outputs=["result_mesh"])
+    graph.add("deflection", io_stage(0.02), inputs=["result_mesh", "displacement"], outputs=["deflected_mesh"])
+    graph.add("3d export", io_stage(0.2), inputs=["deflected_mesh"], outputs=["3d_export"], executor="main")
+    return graph, settings
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage scheduler benchmark")
+    parser.add_argument("--points", type=int, default=500_000, help="ROM points")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    config = utility.load_config("config.yaml")
+    input_data = {
+        "input_parameters": {"operation": ["stress", "von_mises"], "named_selection": "All Body"},
+        "output_files": {"scripts": ["obtain_max_min", "field_statistics"], "data_file": {"field_format": "npy"}},
+    }
+    rng = np.random.default_rng(0)
+    points = rng.random((args.points, 3))
+    snapshot = rng.standard_normal((args.points, 6)) * 100
+    suboperations = config["available_operations"]["stress"]["suboperations"]
+    output_dir = tempfile.mkdtemp()
+
+    print(f"{args.points} ROM points, {len(suboperations)} stress operations, best of {args.repeat}")
+    print(f"{'mode':<22} {'wall [s]':>9} {'stage sum [s]':>14} {'critical path [s]':>18} {'speedup':>8}")
+    serial = None
+    modes = (("serial", 1, []), ("threads", 4, []), ("process scripts", 4, ["scripts"]), ("process operations", 4, ["operation", "scripts"]))
+    for mode, workers, process_stages in modes:
+        best = None
+        for _ in range(args.repeat):
+            graph, settings = pipeline(config, input_data, snapshot, points, suboperations, process_stages, output_dir)
+            graph.run(thread_workers=workers, process_workers=settings["process_workers"])
+            report = graph.critical_path()
+            if best is None or report["wall_s"] < best["wall_s"]:
+                best = report
+        serial = serial or best["wall_s"]
+        print(f"{mode:<22} {best['wall_s']:9.3f} {best['stage_sum_s']:14.3f} {best['critical_path_s']:18.3f} {serial / best['wall_s']:7.2f}x")
+    print(f"critical path: {' -> '.join(best['stages'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Startup cost of the CLI: -X importtime breakdown, time to a validated input, and an import budget check
+# Run from the repository root: python -m benchmarks.bench_startup
+# Exits with a non-zero status when importing the CLI pulls in a heavy backend or exceeds the budget
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Backends that must only load in the stages that need them
+HEAVY_MODULES = ["ansys.dpf", "pytwin", "pyvista", "vtk", "vtkmodules"]
+
+VALIDATE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+from modules import utility
+config = utility.load_config('config.yaml')
+input_data = utility.load_json('data/input/input_data.json')
+utility.validate_parameters(input_data, config)
+elapsed = time.perf_counter() - start
+print(json.dumps({"validated_ms": elapsed * 1e3, "modules": sorted(sys.modules)}))
+"""
+
+def import_times(main_dir):
+    # (self, cumulative, module) in microseconds from -X importtime
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=main_dir, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI startup benchmark")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="import time budget of the CLI")
+    args = parser.parse_args()
+    main_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    rows = import_times(main_dir)
+    total_ms = next(cumulative for _, cumulative, name in rows if name == "main") / 1e3
+    print(f"{'module':<48} {'self [ms]':>10} {'cumulative [ms]':>16}")
+    for self_us, cumulative_us, name in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"{name:<48} {self_us / 1e3:10.1f} {cumulative_us / 1e3:16.1f}")
+    print(f"import main: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    result = subprocess.run([sys.executable, "-c", VALIDATE], cwd=main_dir, capture_output=True, text=True, check=True)
+    validated = json.loads(result.stdout.strip().splitlines()[-1])
+    print(f"config loaded and inputs validated: {validated['validated_ms']:.1f} ms")
+
+    failures = []
+    loaded = [name for name in validated["modules"] if any(name == heavy or name.startswith(heavy + ".") for heavy in HEAVY_MODULES)]
+    if loaded:
+        failures.append(f"heavy backends imported before any stage needs them: {', '.join(sorted(set(name.split('.')[0] for name in loaded)))}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK: startup within budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# Vertex counts, file sizes and preparation time of the surface levels of detail against the full grid
+# Run from the repository root: python -m benchmarks.bench_vis_mesh
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pyvista as pv
+from modules import vis_mesh
+from benchmarks import common
+
+def main():
+    parser = argparse.ArgumentParser(description="Visualization mesh level of detail report")
+    parser.add_argument("--size", type=int, default=60, help="points per block edge")
+    parser.add_argument("--reductions", type=float, nargs="+", default=[0.0, 0.5, 0.9, 0.97])
+    args = parser.parse_args()
+
+    grid = common.box_grid((args.size,) * 3, (0.01, 0.01, 0.01))
+    grid["stress_von_mises"] = np.linalg.norm(grid.points, axis=1) * 1e3
+    output_dir = tempfile.mkdtemp()
+
+    # Baseline: the volumetric grid as the Plotter exports it today
+    try:
+        plotter = pv.Plotter(off_screen=True)
+        plotter.add_mesh(grid)
+        plotter.export_gltf(os.path.join(output_dir, "volume.gltf"))
+        plotter.close()
+        size = os.path.getsize(os.path.join(output_dir, "volume.gltf")) / 1e6
+        print(f"volume: {grid.n_points} vertices, {size:.2f} MB")
+    except Exception as e:
+        print(f"volume: unavailable ({e})")
+
+    vis_mesh.print_lod_report(vis_mesh.lod_report(grid, args.reductions, output_dir))
+
+    # Levels are cached, later exports only slice the current positions and fields
+    start = time.perf_counter()
+    vis_mesh.visualization_mesh(grid, args.reductions[-1])
+    print(f"cached level preparation: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+# Helpers shared by the benchmarks
+import time
+import pyvista as pv
+
+def timed(func, *args, repeat=1, **kwargs):
+    # Value of the last call and the mean wall time of one call in seconds
+    start = time.perf_counter()
+    for _ in range(repeat):
+        value = func(*args, **kwargs)
+    return value, (time.perf_counter() - start) / repeat
+
+def header(*columns):
+    # Table header of (title, format spec) columns, the rows are printed with the same widths
+    print(" ".join(f"{title:{spec}}" for title, spec in columns))
+
+def box_grid(dimensions, spacing):
+    # Unstructured grid of a block of hexahedra, ImageData was named UniformGrid before PyVista 0.43
+    if hasattr(pv, "ImageData"):
+        image = pv.ImageData(dimensions=dimensions, spacing=spacing)
+    else:
+        image = pv.UniformGrid(dimensions, spacing)
+    return image.cast_to_unstructured_grid()
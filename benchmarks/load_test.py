@@ -0,0 +1,75 @@
+# Load test for the twin service (service.py) running locally
+# Run from the repository root: python -m benchmarks.load_test --requests 200 --concurrency 8
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import yaml
+
+async def post(path, payload, host=None, port=None, socket_path=None):
+    if socket_path:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps(payload).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {host or 'localhost'}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    return status, json.loads(payload)
+
+def random_rom_inputs(config, rng):
+    # Random twin inputs within the bounds declared in config.yaml
+    return {
+        name: rng.uniform(bounds["minimum_value"], bounds["maximum_value"])
+        for name, bounds in (config.get("inputs") or {}).items()
+    }
+
+async def run(args, config):
+    rng = random.Random(args.seed)
+    requests = [{"rom_inputs": random_rom_inputs(config, rng)} for _ in range(args.requests)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, statuses = [], {}
+
+    async def worker(request):
+        async with semaphore:
+            start = time.perf_counter()
+            status, _ = await post("/evaluate", request, args.host, args.port, args.socket)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(request) for request in requests))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"requests: {args.requests}, concurrency: {args.concurrency}, statuses: {statuses}")
+    print(f"throughput: {args.requests / elapsed:.1f} req/s")
+    for label, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+        print(f"{label}: {latencies[int(q * (len(latencies) - 1))]:.1f} ms")
+    print(f"max: {latencies[-1]:.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Twin service load test")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", default=None)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    main_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(main_dir, 'config.yaml'), 'r') as file:
+        config = yaml.safe_load(file)
+    asyncio.run(run(args, config))
+
+if __name__ == "__main__":
+    main()
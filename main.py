@@ -1,6 +1,16 @@
 import os
+import json
 import importlib
+from functools import partial
 from modules import utility
+from modules.context import RunContext
+from modules import memo
+
+def run_stages(context, graph, settings):
+    # Run a stage graph, every stage traced, and keep its critical path for the timing summary
+    values = graph.run(thread_workers=settings['thread_workers'], process_workers=settings['process_workers'], trace=context.stage)
+    context.critical_paths.append(graph.critical_path())
+    return values
 
 def main():
     # Load configuration
@@ -22,97 +32,250 @@ def main():
         print(e)
         exit(1)  # Stop the script with a non-zero exit code
     
-    # Initiate twin from twin file
-    print("++ Initializing the Twin")
-    twin_file, tbrom_name = utility.twin_file_handler(input_data, config, file_dir) 
-    twin_file_dir = os.path.join(file_dir, twin_file)
-    twin_model, tbroms = utility.initiate_twin(input_data, twin_file_dir)
-    rom_name = tbrom_name
-    twin_outputs = twin_model.outputs
+    # Artifacts shared by every stage of this run
+    context = RunContext(config, input_data, file_dir)
     
-    # Load the rst file and extract the mesh
-    print("++ Reading the FEA mesh")
-    rst_file = input_data['input_files']['rst_file']
-    rst_file_dir =  os.path.join(os.path.dirname(__file__), rst_file)
-    mesh, grid, mesh_unit = utility.extract_mesh(rst_file_dir)
+    # Inputs within the tolerance of the previous run return its exports at once
+    memo_run = memo.memo_settings(config)['enabled'] and context.cache_dir() and not any(input_data.get(mode) for mode in ("sweep", "load_history", "animation", "ingest"))
+    if memo_run:
+        run_key = memo.run_key(input_data, config, file_dir)
+        exports = memo.recall_run(context.cache_dir(), run_key)
+        if exports:
+            print("++ Inputs unchanged within tolerance, reusing the previous exports")
+            for path in exports:
+                print(f"Reused {path}")
+            return
     
-    # Obtain named selection scoping mesh 
-    print("++ Obtaining named selections")
+    # Operations sharing a TBROM are grouped so each snapshot is generated once
+    operations = utility.operation_list(input_data)
+    operation_groups = utility.group_operations(operations, config)
+    
+    # Stages run as a DAG, the mesh is read while the twins initialize
+    from modules import scheduler
+    scheduler_settings = scheduler.scheduler_settings(config)
+    print("++ Initializing the Twin and reading the FEA mesh")
+    def initialize_twins():
+        twins = {}
+        twin_outputs = {}
+        for tbrom_name, group in operation_groups.items():
+            group_input = utility.operation_input(input_data, group[0])
+            twin_file, rom_name = utility.twin_file_handler(group_input, config, file_dir) 
+            twin_file_dir = os.path.join(file_dir, twin_file)
+            twin_model, tbroms = context.twin(twin_file_dir)
+            twins[tbrom_name] = (twin_model, rom_name, twin_file_dir)
+            twin_outputs.update(twin_model.outputs)
+        return twins, twin_outputs
     
-    named_selections_twin, named_selections_fea = utility.named_selections(twin_model, rom_name, mesh)
+    # Obtain named selection scoping mesh 
+    def resolve_scopings(twins, mesh_artifacts):
+        return {tbrom_name: context.scoping(twin_model, rom_name)[0] for tbrom_name, (twin_model, rom_name, twin_file_dir) in twins.items()}
     
+    setup = scheduler.StageGraph()
+    setup.add("twin initialization", initialize_twins, outputs=["twins", "twin_outputs"])
+    setup.add("mesh extraction", context.mesh, outputs=["mesh"])
+    setup.add("named selections", resolve_scopings, inputs=["twins", "mesh"], outputs=["scopings"])
+    values = run_stages(context, setup, scheduler_settings)
+    twins, twin_outputs, scopings = values["twins"], values["twin_outputs"], values["scopings"]
+    mesh, grid, mesh_unit = values["mesh"]
     named_selection = input_data['input_parameters']['named_selection']
-    if named_selection == "All Body":
-        scoping = None
-        nstwin, nsfea, mesh = utility.scoping(named_selections_twin, named_selections_fea, mesh, scoping=scoping)
-        scoping_twin = None
-        scoping_fea = None
-    else: 
-        scoping = input_data['input_parameters']['named_selection']
-        nstwin, nsfea, mesh = utility.scoping(named_selections_twin, named_selections_fea, mesh, scoping=scoping)
-        scoping_twin = named_selections_twin[nstwin]
-        scoping_fea = named_selections_fea[nsfea]
 
-    grid.points = utility.convert_to_meters(grid.points, mesh_unit)    
-    result_unit = utility.get_unit(input_data, config)
-    
-    # Perform operations based on config
-    operation, result_type = input_data["input_parameters"]["operation"]
-    outfields, points = utility.get_result(twin_model, rom_name, scoping_twin=scoping_twin)
-    
-    operation_config = config["available_operations"].get(operation)
-    if not operation_config:
-        raise ValueError(f"Operation {operation} is not available in the config.")
-    
-    module_name = operation_config["module"]
-    module_method = operation_config["method"]
-    
-    # Dynamically import the module based on operation
-    module = importlib.import_module(f"modules.{module_name}")
+    # Sweeps, load histories, animations and ingestion evaluate a single operation
+    if any(input_data.get(mode) for mode in ("sweep", "load_history", "animation", "ingest")) and len(operations) > 1:
+        raise ValueError("Sweep, load history, animation and ingest modes support a single operation.")
+    tbrom_name = next(iter(twins))
+    twin_model, rom_name, twin_file_dir = twins[tbrom_name]
+    scoping_twin = scopings[tbrom_name]
+
+    # Evaluate every load case of the sweep input file instead of a single input set
+    sweep_config = input_data.get("sweep")
+    if sweep_config:
+        from modules import sweep
+        print("++ Running input sweep")
+        with context.stage("sweep"):
+            store_path, summary_path = sweep.run_sweep(context, twin_model, rom_name, scoping_twin, twin_file_dir, sweep_config)
+        print(f"Sweep results have been exported to {store_path} and {summary_path}")
+        print("++ Timing summary")
+        context.timing_summary()
+        return
+
+    # Accumulate fatigue damage over a load history instead of a single static snapshot
+    history_config = input_data.get("load_history")
+    if history_config:
+        from modules import miner
+        if operations[0][0] != "fatigue":
+            raise ValueError("A load history can only be evaluated with the 'fatigue' operation.")
+        print("++ Accumulating fatigue damage over the load history")
+        with context.stage("load history"):
+            damage_data, summary = miner.run_load_history(context, twin_model, rom_name, scoping_twin, history_config)
+        summary_path = os.path.join(file_dir, input_data["output_files"]["output_dir"], "fatigue_cumulative_damage_summary.json")
+        with open(summary_path, "w") as f:
+            json.dump(summary, f, indent=4)
+        print(f"Cumulative damage summary has been exported to {summary_path}")
+        print("++ Timing summary")
+        context.timing_summary()
+        return
+
+    # Animate the response to a load sequence in a single glTF instead of one export per input set
+    animation_config = input_data.get("animation")
+    if animation_config:
+        from modules import animation
+        print("++ Exporting load sequence animation")
+        with context.stage("animation"):
+            animation_path = animation.run_animation(context, twin_model, rom_name, scoping_twin, animation_config)
+        print(f"Animation has been exported to {animation_path}")
+        print("++ Timing summary")
+        context.timing_summary()
+        return
+
+    # Evaluate streamed IoT readings in micro-batches instead of the static input set
+    ingest_config = input_data.get("ingest")
+    if ingest_config:
+        from modules import ingest
+        print("++ Ingesting load readings")
+        with context.stage("ingest"):
+            summary_path, stats = ingest.run_ingest(context, twin_model, rom_name, scoping_twin, ingest_config)
+        print(f"{stats['readings']} reading(s) in {stats['batches']} batch(es), {stats['rejected']} rejected, {stats['readings_per_s']:.1f} readings/s")
+        if "latency_ms" in stats:
+            print(f"latency p50 {stats['latency_ms']['p50']:.1f} ms, p95 {stats['latency_ms']['p95']:.1f} ms, p99 {stats['latency_ms']['p99']:.1f} ms")
+        print(f"Summary records have been exported to {summary_path}")
+        print("++ Timing summary")
+        context.timing_summary()
+        return
+
+    # Result pipeline: snapshots -> operations -> projection -> deflection -> visualization -> 3d export,
+    # with the displacement twin, the scripts and the field exports fanned out next to it
+    print("++ Running the result pipeline")
+    from modules import field_export, vis_mesh, fatigue_curve
+    graph = scheduler.StageGraph()
+    operation_inputs = {}
+    scripts_need_masks = utility.scripts_need_masks(input_data, config)
+    previous_export = []
+    output_dir = os.path.join(os.path.dirname(__file__), input_data["output_files"]["output_dir"])
+    for tbrom_name, group in operation_groups.items():
+        twin_model, rom_name, twin_file_dir = twins[tbrom_name]
+        graph.add(f"{tbrom_name} snapshot generation", partial(context.get_result, twin_model, rom_name, scopings[tbrom_name]),
+                  outputs=[f"snapshot:{tbrom_name}", f"points:{tbrom_name}"])
+        # Fatigue operations apply the S-N curve of every named selection through its mask
+        operations_need_masks = fatigue_curve.curves_per_named_selection(config) and any(
+            config["available_operations"].get(operation[0], {}).get("module") == "damage" for operation in group)
+        if scripts_need_masks or operations_need_masks:
+            graph.add(f"{tbrom_name} named selection masks", partial(context.named_selection_masks, twin_model, rom_name, scopings[tbrom_name]),
+                      outputs=[f"masks:{tbrom_name}"])
+        # Stress invariants shared by several operations are derived once from the snapshot
+        derived = utility.derived_quantities(group, config)
+        if derived:
+            from modules import invariants
+            graph.add(f"{tbrom_name} stress invariants", partial(invariants.stress_invariants, quantities=derived),
+                      inputs=[f"snapshot:{tbrom_name}"], outputs=[f"derived:{tbrom_name}"])
+        
+        for operation in group:
+            operation_config = config["available_operations"].get(operation[0])
+            if not operation_config:
+                raise ValueError(f"Operation {operation[0]} is not available in the config.")
+            
+            module_name = operation_config["module"]
+            module_method = operation_config["method"]
+            
+            # Dynamically import the module based on operation
+            module = importlib.import_module(f"modules.{module_name}")
+            
+            # Get the result based on operation
+            get_result = getattr(module, module_method)
+            operation_input = utility.operation_input(input_data, operation)
+            result_name = "_".join(operation)
+            operation_inputs[result_name] = (operation_input, tbrom_name)
+            extra_inputs = {}
+            if operations_need_masks and module_name == "damage":
+                extra_inputs["masks"] = f"masks:{tbrom_name}"
+            if derived and module_name in ("stress", "damage"):
+                extra_inputs["derived"] = f"derived:{tbrom_name}"
+            graph.add(f"{result_name} operation", partial(utility.run_operation, get_result, config, operation_input, tuple(extra_inputs)),
+                      inputs=[f"snapshot:{tbrom_name}", f"points:{tbrom_name}"] + list(extra_inputs.values()), outputs=[f"result:{result_name}"],
+                      executor=scheduler.executor_for("operation", scheduler_settings))
+            
+            # Obtaining max and min value, with the masks of the named selections when a script needs them
+            graph.add(f"{result_name} scripts", partial(utility.run_script, operation_input, config),
+                      inputs=[f"result:{result_name}"] + ([f"masks:{tbrom_name}"] if scripts_need_masks else []),
+                      outputs=[f"scripts:{result_name}"], executor=scheduler.executor_for("scripts", scheduler_settings))
+            
+            # Export in the field format chosen in the input data (legacy JSON lines by default),
+            # exports share the field store of their points so they are written one after another
+            graph.add(f"{result_name} field export", lambda result_data, *previous, operation_input=operation_input: field_export.export_field(result_data, output_dir, operation_input),
+                      inputs=[f"result:{result_name}"] + previous_export, outputs=[f"field_export:{result_name}"])
+            previous_export = [f"field_export:{result_name}"]
     
-    # Get the result based on operation
-    get_result = getattr(module, module_method)
-    result_data = get_result(config, input_data, outfields, points)
+    # Projection of every result on one mesh
+    def project(*results):
+        grouped_results = {}
+        for result_data in results:
+            grouped_results.setdefault(operation_inputs[result_data.name][1], []).append(result_data)
+        return utility.project_results_on_mesh(grouped_results, grid, cache_dir=context.cache_dir())
+    graph.add("projection", project, inputs=[f"result:{name}" for name in operation_inputs], outputs=["result_mesh"])
     
-    # Projection result on mesh
-    print("++ Projecting result on mesh")
-    result_detail = "_".join(input_data["input_parameters"]["operation"])
-    result_mesh, result_load_val = utility.project_result_on_mesh(result_data, grid, result_detail)
-
-    # Deflect mesh from displacement result
-    print("++ Deflecting mesh")
+    # Deflect mesh from displacement result, the displacement twin is evaluated while the operations run;
+    # the deflection filters the displacement by the requested displacement operation (ux, uy, uz), all components otherwise
     main_dir = os.path.dirname(__file__)
-    result_mesh = utility.deflection_handler(input_data, config, main_dir, result_mesh)
+    deflection_operation = next((operation for operation in operations if operation[0] == "displacement"), operations[0])
+    deflection_input = utility.operation_input(input_data, deflection_operation)
+    deflection_inputs = ["result_mesh"]
+    deformation_scale = deflection_input["input_parameters"]["deformation_scale"]
+    if deformation_scale != "Undeformed" and deformation_scale in config["available_deformation_scales"]:
+        from modules import deflect_mesh
+        graph.add("displacement result", partial(deflect_mesh.get_disp_result, deflection_input, main_dir, context=context), outputs=["displacement"])
+        deflection_inputs.append("displacement")
+    graph.add("deflection", lambda result_mesh, *displacement: utility.deflection_handler(deflection_input, config, main_dir, result_mesh, context=context),
+              inputs=deflection_inputs, outputs=["deflected_mesh"])
     
-    # Plot result
-    print("++ Plotting result")
+    # Viewers only see the outer surface, send them the surface at the selected level of detail
+    graph.add("visualization mesh", lambda result_mesh: vis_mesh.prepare(result_mesh, config, input_data, cache_dir=context.cache_dir()),
+              inputs=["deflected_mesh"], outputs=["visual_mesh"])
+    
+    # Plot result, on-screen rendering and VTK exports stay on the main thread
     show_edges = input_data["output_files"]["3d_file"]["show_edges"]
-    utility.plot_result(result_mesh, show_edges)
-
+    graph.add("plotting", lambda visual_mesh: utility.plot_result(visual_mesh, show_edges), inputs=["visual_mesh"], outputs=["plotted"], executor="main")
+    
     # Export to 3d format
-    print("++ Exporting result")
     output_3d_dir = os.path.join(os.path.dirname(__file__), input_data["output_files"]["3d_file"]["output_3d_dir"])
-    utility.export_to_3d_file(result_mesh, output_3d_dir, input_data)
-
-    # Obtaining max and min value
-    print("++ Obtaining max and min value")
-    script_results = utility.run_script(input_data, config, result_data) 
+    graph.add("3d export", lambda visual_mesh, plotted: utility.export_to_3d_file(visual_mesh, output_3d_dir, input_data),
+              inputs=["visual_mesh", "plotted"], outputs=["3d_export"], executor="main")
+    
+    # Vertex count and file size of every level of detail of a surface format, to choose lod_levels and format_lod
+    visualization = vis_mesh.visualization_settings(config)
+    if visualization['lod_report'] and input_data["output_files"]["3d_file"]["output_format"] in visualization['surface_formats']:
+        graph.add("lod report", lambda deflected_mesh: vis_mesh.lod_report(deflected_mesh, visualization['lod_levels'], os.path.join(output_3d_dir, "lod"), cache_dir=context.cache_dir()),
+                  inputs=["deflected_mesh"], outputs=["lod_report"])
+    
+    values = run_stages(context, graph, scheduler_settings)
+    visual_mesh = values["visual_mesh"]
+    print(f"Visualization mesh: {visual_mesh.n_points} vertices, {visual_mesh.n_cells} cells, {os.path.getsize(values['3d_export']) / 1e6:.2f} MB exported")
+    if "lod_report" in values:
+        vis_mesh.print_lod_report(values["lod_report"])
+    exports = [values["3d_export"]]
+    for result_name in operation_inputs:
+        print(f"Result field has been exported to {values[f'field_export:{result_name}']}")
+        exports.append(values[f"field_export:{result_name}"])
+    script_results = {result_name: values[f"scripts:{result_name}"] for result_name in operation_inputs}
+    result_units = {result_name: utility.get_unit(operation_input, config) for result_name, (operation_input, _) in operation_inputs.items()}
     
-    # Export to output_data.jsonW
+    # A single operation keeps the flat output layout
+    if len(operations) == 1:
+        script_results = next(iter(script_results.values()))
+        result_units = next(iter(result_units.values()))
+    
+    # Export to output_data.jsonW, last so the stage timings cover the whole run
     print("++ Exporting to output_data.json")
     output_data_path = os.path.join(os.path.dirname(__file__), input_data["output_files"]["output_dir"], input_data["output_files"]["data_file"]["output_data"])
-    output_path = utility.export_output_data_to_json(output_data_path, result_unit, named_selection, twin_outputs=twin_outputs, output_parameters=script_results)
+    output_path = utility.export_output_data_to_json(output_data_path, result_units, named_selection, twin_outputs=twin_outputs, output_parameters=script_results, timings=dict(context.tracer.summary(), critical_paths=context.critical_paths))
     print(f"DataFrames have been exported to {output_path}")
+    exports.append(output_path)
+    
+    # Remember the exports of these inputs for the next run
+    if memo_run:
+        memo.record_run(context.cache_dir(), run_key, exports)
     
-    # Export to result_field.json
-    print("++ Exporting to result_field.json")
-    output_dir = input_data["output_files"]["output_dir"]
-    field_data_name =  result_detail +"_"+ input_data["output_files"]["data_file"]["field_data"]
-    result_field_path = os.path.join(os.path.dirname(__file__), output_dir, field_data_name)
-   
-    # Export DataFrame to JSON
-    result_data.to_json(result_field_path, orient='records', lines=True)
-    print(f"DataFrames have been exported to {result_field_path}")
+    # Report stage timings and artifact reuse
+    print("++ Timing summary")
+    context.timing_summary()
     
 if __name__ == "__main__":
     main()
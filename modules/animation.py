@@ -0,0 +1,82 @@
+from . import utility, projection, sweep, extent, gltf, precision
+import os
+import numpy as np
+
+def displacement_twin(context):
+    # Displacement twin, TBROM and scoping deforming the animated mesh
+    input_data = context.input_data
+    twin_file_dir = os.path.join(context.main_dir, input_data["input_files"]["twin_file"]["displacement"])
+    twin_model, tbrom_names = context.twin(twin_file_dir)
+    rom_name = tbrom_names[input_data['input_parameters']['rom_index']]
+    scoping_twin, _, _ = context.scoping(twin_model, rom_name)
+    return twin_model, rom_name, scoping_twin
+
+def displacement_filter(input_data):
+    # Displacement components deforming the mesh, as in deflect_mesh.get_deflected_mesh
+    result_type = input_data["input_parameters"]["operation"][1]
+    return {"ux": [0], "uy": [1], "uz": [2]}.get(result_type, [0, 1, 2])
+
+def deformation_scale(context, grid):
+    # Scale factor of the whole sequence from its largest displacement, so frames are comparable
+    config, input_data = context.config, context.input_data
+    deformation_scale = input_data["input_parameters"]["deformation_scale"]
+    if deformation_scale == "Undeformed":
+        return lambda max_magnitude: 0.0
+    if deformation_scale == "True Scale":
+        return lambda max_magnitude: 1.0
+    scale_parameter = {"0.5 Auto": 0.5, "Auto Scale": 1, "2x Auto": 2, "5x Auto": 5}[deformation_scale]
+    max_distance = extent.model_extent(
+        grid.points,
+        mode=config.get("extent_mode", "hull"),
+        rst_file=input_data["input_files"]["rst_file"],
+        named_selection=input_data["input_parameters"]["named_selection"],
+        cache_dir=context.cache_dir(),
+        main_dir=context.main_dir
+    )
+    return lambda max_magnitude: (config["autoscale"] / 100) * (max_distance / max_magnitude) * scale_parameter if max_magnitude else 0.0
+
+def animation_frames(context, cases, twin_model, rom_name, scoping_twin):
+    # Yield (displacement in meters, result) on the mesh nodes for every load case, one case at a time
+    config, input_data = context.config, context.input_data
+    _, grid, _ = context.mesh()
+    disp_model, disp_rom, disp_scoping = displacement_twin(context)
+
+    # ROM points never change between load cases, both operators are built once
+    points = precision.as_float(utility.unflatten_vector(twin_model.generate_points(rom_name, on_disk=False, named_selection=scoping_twin), 3), config)
+    operator = projection.projection_operator(grid.points, points, cache_dir=context.cache_dir())
+    disp_points = precision.as_float(utility.unflatten_vector(disp_model.generate_points(disp_rom, on_disk=False, named_selection=disp_scoping), 3), config)
+    disp_operator = projection.projection_operator(grid.points, disp_points, cache_dir=context.cache_dir())
+    disp_unit = config["available_operations"]["displacement"]["tbrom_units"]
+    components = displacement_filter(input_data)
+
+    for rom_inputs in cases:
+        values = sweep.evaluate_case(twin_model, rom_name, scoping_twin, config, input_data, rom_inputs)
+        if disp_model is not twin_model:
+            disp_model.initialize_evaluation(
+                parameters=input_data['twin_inputs'].get('rom_parameters'),
+                inputs=rom_inputs,
+                field_inputs=input_data['twin_inputs'].get('field_inputs')
+            )
+        disp_field = utility.unflatten_vector(disp_model.generate_snapshot(disp_rom, on_disk=False, named_selection=disp_scoping), 3)
+        filtered = np.zeros_like(disp_field)
+        filtered[:, components] = disp_field[:, components]
+        displacement = utility.convert_to_meters(projection.apply_operator(disp_operator, filtered), disp_unit)
+        yield displacement, projection.apply_operator(operator, values)
+
+def run_animation(context, twin_model, rom_name, scoping_twin, animation_config):
+    # Export the response to a load sequence as one animated .glb
+    config, input_data, main_dir = context.config, context.input_data, context.main_dir
+    cases = sweep.load_input_table(os.path.join(main_dir, animation_config["input_file"]), config)
+    for rom_inputs in cases:
+        utility.validate_rom_inputs(rom_inputs, config)
+
+    _, grid, _ = context.mesh()
+    output_3d_dir = os.path.join(main_dir, input_data["output_files"]["3d_file"]["output_3d_dir"])
+    output_file = os.path.join(output_3d_dir, f"{utility.result_detail(input_data)}_animation.glb")
+    frames = animation_frames(context, cases, twin_model, rom_name, scoping_twin)
+    return gltf.write_animated_glb(
+        grid, frames, len(cases), output_file,
+        fps=animation_config.get("fps", 10),
+        scale=deformation_scale(context, grid),
+        clim=animation_config.get("clim"),
+    )
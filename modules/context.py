@@ -0,0 +1,142 @@
+from . import utility
+from . import memo
+from . import tracing
+from . import scheduler
+from . import precision
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+class RunContext:
+    # Artifact store shared by the stages of one run, so mesh, scoping and twins are computed once
+    def __init__(self, config, input_data, main_dir):
+        self.config = config
+        self.input_data = input_data
+        self.main_dir = main_dir
+        self.artifacts = {}
+        # One lock per artifact, stages running in parallel compute each artifact once
+        self.locks = {}
+        self.timings = []
+        # Critical path of every stage graph run, see scheduler.StageGraph
+        self.critical_paths = []
+        self.tracer = tracing.Tracer.from_config(config, main_dir)
+        self.run_id = time.strftime("%Y%m%dT%H%M%S")
+        self.compute_times = {}
+        self.reuses = {}
+
+    def cache_dir(self):
+        # Directory for cached intermediate data, None when caching is not configured
+        if self.config and self.config.get('cache_dir'):
+            return os.path.join(self.main_dir, self.config['cache_dir'])
+        return None
+
+    def input_key(self):
+        # Twin input set identifying one evaluation
+        return json.dumps(self.input_data.get('twin_inputs'), sort_keys=True)
+
+    @contextmanager
+    def stage(self, name):
+        # Traced stage, the body may record the sizes of the arrays it produced
+        record = None
+        try:
+            with self.tracer.stage(name) as record:
+                yield record
+        finally:
+            if record is not None:
+                self.timings.append((name, record.data["wall_s"]))
+
+    def get(self, key, compute):
+        # Return a stored artifact, computing it on first request
+        with self.locks.setdefault(key, threading.Lock()):
+            if key in self.artifacts:
+                self.reuses[key] = self.reuses.get(key, 0) + 1
+                return self.artifacts[key]
+            start = time.perf_counter()
+            self.artifacts[key] = compute()
+            self.compute_times[key] = time.perf_counter() - start
+            return self.artifacts[key]
+
+    def twin_lock(self, twin_model):
+        # One lock per twin model, generate_snapshot and generate_points change the TBROM state of the twin
+        return self.locks.setdefault(("twin_lock", id(twin_model)), threading.Lock())
+
+    def twin(self, twin_file):
+        # Twin model initialized once per twin file and input set
+        twin_path = os.path.abspath(twin_file)
+        return self.get(("twin", twin_path, self.input_key()), lambda: utility.initiate_twin(self.input_data, twin_path))
+
+    def mesh(self):
+        # FEA mesh and its grid converted to meters
+        def load():
+            rst_file_dir = os.path.join(self.main_dir, self.input_data['input_files']['rst_file'])
+            # Memory-mapped bundle of the parsed RST, the RST itself is only parsed once per content
+            if self.cache_dir():
+                from . import mesh_cache
+                return mesh_cache.load_mesh(rst_file_dir, self.cache_dir(), config=self.config)
+            mesh, grid, mesh_unit = utility.extract_mesh(rst_file_dir)
+            grid.points = utility.convert_to_meters(precision.as_float(grid.points, self.config), mesh_unit)
+            return mesh, precision.compact_cells(grid, self.config), mesh_unit
+        return self.get("mesh", load)
+
+    def scoping(self, twin_model, rom_name):
+        # Twin and FEA named selections of the requested scoping, with the scoped mesh
+        named_selection = self.input_data['input_parameters']['named_selection']
+
+        def resolve():
+            mesh, _, _ = self.mesh()
+            named_selections_twin, named_selections_fea = utility.named_selections(twin_model, rom_name, mesh)
+            if named_selection == "All Body":
+                _, _, scoped_mesh = utility.scoping(named_selections_twin, named_selections_fea, mesh, scoping=None)
+                return None, None, scoped_mesh
+            nstwin, nsfea, scoped_mesh = utility.scoping(named_selections_twin, named_selections_fea, mesh, scoping=named_selection)
+            return named_selections_twin[nstwin], named_selections_fea[nsfea], scoped_mesh
+
+        return self.get(("scoping", rom_name, named_selection), resolve)
+
+    def memo(self):
+        # Snapshot memo of this run, persisted between runs when configured
+        return self.get("memo", lambda: memo.SnapshotMemo.from_config(self.config, cache_dir=self.cache_dir()))
+
+    def get_result(self, twin_model, rom_name, scoping_twin):
+        # Snapshot of the current inputs, through the memo when it is enabled
+        if not memo.memo_settings(self.config)['enabled']:
+            with self.twin_lock(twin_model):
+                return utility.get_result(twin_model, rom_name, scoping_twin=scoping_twin, config=self.config)
+        named_selection = self.input_data['input_parameters']['named_selection']
+        memo_store = self.memo()
+        with self.twin_lock(twin_model):
+            return memo_store.get_result(twin_model, rom_name, self.input_data['twin_inputs'], named_selection, scoping_twin=scoping_twin, config=self.config)
+
+    def named_selection_masks(self, twin_model, rom_name, scoping_twin):
+        # Node masks of the twin named selections over the scoped ROM points
+        def masks():
+            with self.twin_lock(twin_model):
+                return utility.named_selection_masks(twin_model, rom_name, scoping_twin)
+        return self.get(("masks", rom_name, scoping_twin), masks)
+
+    def trace_file(self):
+        # JSON lines of the stage measurements, next to the other outputs
+        return os.path.join(self.main_dir, self.input_data["output_files"]["output_dir"], "stage_timings.jsonl")
+
+    def timing_summary(self):
+        # Print stage timings and the time saved by reusing artifacts, and append the stage trace
+        print(f"{'stage':<32} {'time [s]':>10} {'cpu [s]':>10} {'peak rss [MB]':>14}")
+        for record in self.tracer.records:
+            peak_rss = f"{record['peak_rss_mb']:14.1f}" if record['peak_rss_mb'] is not None else f"{'-':>14}"
+            print(f"{record['stage']:<32} {record['wall_s']:10.3f} {record['cpu_s']:10.3f} {peak_rss}")
+        saved = 0.0
+        for key, count in self.reuses.items():
+            key_saved = count * self.compute_times[key]
+            saved += key_saved
+            label = key if isinstance(key, str) else key[0]
+            print(f"reused {label:<25} {count:>3}x, saved {key_saved:.3f} s")
+        print(f"{'total':<32} {sum(elapsed for _, elapsed in self.timings):10.3f} (saved {saved:.3f} s)")
+        for report in self.critical_paths:
+            scheduler.print_critical_path(report)
+        if "memo" in self.artifacts:
+            stats = self.artifacts["memo"].stats()
+            print(f"memo: {stats['hits']} hit(s), {stats['scaled']} scaled, {stats['misses']} miss(es)")
+        trace_file = self.tracer.write_jsonl(self.trace_file(), run=self.run_id, input_key=self.input_key())
+        print(f"Stage trace has been appended to {trace_file}")
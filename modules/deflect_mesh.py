@@ -1,98 +1,83 @@
-from . import utility, displacement
+from . import utility, extent, projection
+from . import context as run_context
 import os
 import numpy as np
-import pandas as pd
-import pyvista as pv
-from scipy.spatial.distance import cdist
 
 
-def project_result_on_mesh(outfields, points, grid):
+def project_result_on_mesh(outfields, points, grid, cache_dir=None):
     # Project results onto the MAPDL grid
     
-    # Convert imported data into PolyData format
-    wrapped = pv.PolyData(points)  
-    
-    # Add the result data to the PolyData object
-    wrapped["ux"] = outfields[:,0]
-    wrapped["uy"] = outfields[:,1]
-    wrapped["uz"] = outfields[:,2]
-
-    # Map the imported data to MAPDL grid
-    inter_grid = grid.interpolate(
-    wrapped, sharpness=5, radius=0.0001, strategy="closest_point")  # Map the imported data to MAPDL grid
-    
-    # Extract interpolated results for ux, uy, uz
-    interpolated_ux = inter_grid["ux"]
-    interpolated_uy = inter_grid["uy"]
-    interpolated_uz = inter_grid["uz"]
+    # Map ux, uy, uz to the MAPDL grid in one batched product
+    operator = projection.projection_operator(grid.points, points, cache_dir=cache_dir)
+    inter_grid = projection.project_fields(grid, operator, {
+        "ux": outfields[:, 0],
+        "uy": outfields[:, 1],
+        "uz": outfields[:, 2],
+    })
     
     # Combine interpolated results into a single array
-    result_load_val = np.vstack((interpolated_ux, interpolated_uy, interpolated_uz)).T
+    result_load_val = np.vstack((inter_grid["ux"], inter_grid["uy"], inter_grid["uz"])).T
 
     return inter_grid, result_load_val
 
-def get_disp_result(input_data, main_dir):   
+def get_disp_result(input_data, main_dir, context=None):
+    # Displacement result shared through the run context, evaluated once per input set
+    if context is None:
+        context = run_context.RunContext(None, input_data, main_dir)
+    return context.get(("displacement_result", context.input_key()), lambda: evaluate_disp_result(context))
+
+def evaluate_disp_result(context):
     # Initiate twin from twin file
+    input_data = context.input_data
     twin_file = input_data["input_files"]["twin_file"]["displacement"]
-    twin_file_dir = os.path.join(main_dir, twin_file)
-    twin_model, tbrom_names = utility.initiate_twin(input_data, twin_file_dir)
+    twin_file_dir = os.path.join(context.main_dir, twin_file)
+    twin_model, tbrom_names = context.twin(twin_file_dir)
     rom_index = input_data['input_parameters']['rom_index']
     rom_name = tbrom_names[rom_index]
     
-    # Load the rst file and extract the mesh
-    rst_file = input_data['input_files']['rst_file']
-    rst_file_dir =  os.path.join(main_dir, rst_file)
-    mesh, grid, mesh_unit = utility.extract_mesh(rst_file_dir)
-    
-    # Obtain named selection scoping mesh 
-    named_selections_twin, named_selections_fea = utility.named_selections(twin_model, rom_name, mesh)
-    
-    named_selection = input_data['input_parameters']['named_selection']
-    if named_selection == "All Body":
-        scoping = None
-        nstwin, nsfea, mesh = utility.scoping(named_selections_twin, named_selections_fea, mesh, scoping=scoping)
-        scoping_twin = None
-        scoping_fea = None
-    else: 
-        scoping = input_data['input_parameters']['named_selection']
-        nstwin, nsfea, mesh = utility.scoping(named_selections_twin, named_selections_fea, mesh, scoping=scoping)
-        scoping_twin = named_selections_twin[nstwin]
-        scoping_fea = named_selections_fea[nsfea]
-
-    grid.points = utility.convert_to_meters(grid.points, mesh_unit)    
+    # Reuse the mesh and named selection scoping of the run
+    mesh, grid, mesh_unit = context.mesh()
+    scoping_twin, scoping_fea, mesh = context.scoping(twin_model, rom_name)
     
-    # Perform operations based on config
-    outfields, points = utility.get_result(twin_model, rom_name, scoping_twin=scoping_twin)
+    # Perform operations based on config, one snapshot at a time per twin as the operations may share it
+    with context.twin_lock(twin_model):
+        outfields, points = utility.get_result(twin_model, rom_name, scoping_twin=scoping_twin, config=context.config)
 
     # Projection result on mesh
-    result_detail = "_".join(input_data["input_parameters"]["operation"])
-    result_mesh, result_load_val = project_result_on_mesh(outfields, points, grid)
+    result_mesh, result_load_val = project_result_on_mesh(outfields, points, grid, cache_dir=context.cache_dir())
     return result_load_val, result_mesh
 
-def deflection_scale(config, input_data, points, result_field):
+def deflection_scale(config, input_data, points, result_field, main_dir="", cache_dir=None):
     # Calculates the longest distance between any two points in a given array
-    distances = cdist(points, points)
-    max_distance = np.max(distances)
+    max_distance = extent.model_extent(
+        points,
+        mode=config.get("extent_mode", "hull"),
+        rst_file=input_data["input_files"]["rst_file"],
+        named_selection=input_data["input_parameters"]["named_selection"],
+        cache_dir=cache_dir,
+        main_dir=main_dir
+    )
 
-    # Find highes displacement
-    if input_data["input_parameters"]["operation"][0] == "ux":
+    # Find highes displacement, of the requested component or of the displacement norm
+    result_type = input_data["input_parameters"]["operation"][1]
+    if result_type == "ux":
         disp = result_field[:,0]
-    elif input_data["input_parameters"]["operation"][0] == "uy":
+    elif result_type == "uy":
         disp = result_field[:,1]
-    elif input_data["input_parameters"]["operation"][0] == "uz":
+    elif result_type == "uz":
         disp = result_field[:,2]
     else:
         disp = np.linalg.norm(result_field, axis=1)
-    max_magnitude = np.max(disp)
-    result_unit = config["operation_units"]["displacement"]
+    max_magnitude = np.max(np.abs(disp))
+    result_unit = config["available_operations"]["displacement"]["tbrom_units"]
     max_magnitude = utility.convert_to_meters(max_magnitude, result_unit)
 
-    # Calculate scale factor
+    # Calculate scale factor, an undeformed result is not scaled
     percent_def = config["autoscale"]
-    scale_factor = (percent_def/100)*(max_distance/max_magnitude)
+    scale_factor = (percent_def/100)*(max_distance/max_magnitude) if max_magnitude else 0.0
     return scale_factor
 
-def get_deflected_mesh(mesh, config, input_data, outfields, scale_parameter, scale_factor_ow):
+def get_deflected_mesh(mesh, config, input_data, outfields, scale_parameter, scale_factor_ow, main_dir="", cache_dir=None):
     # Filter outfields
     filtered = np.zeros_like(outfields)
     result_type = input_data["input_parameters"]["operation"][1]
@@ -110,9 +95,11 @@ def get_deflected_mesh(mesh, config, input_data, outfields, scale_parameter, sca
     if scale_factor_ow == True:
         scale_factor = 1
     else: 
-        scale_factor = deflection_scale(config, input_data, mesh.points, filtered) * scale_parameter
-    filtered = utility.convert_to_meters(filtered, config["available_operations"]["displacement"]["tbrom_units"])
-    scaled_disp = filtered * scale_factor
-    mesh.points = mesh.points + scaled_disp
+        scale_factor = deflection_scale(config, input_data, mesh.points, filtered, main_dir=main_dir, cache_dir=cache_dir) * scale_parameter
+    # One new array, scaled and converted in place, then added in the precision of the mesh
+    scaled_disp = utility.convert_to_meters(filtered * scale_factor, config["available_operations"]["displacement"]["tbrom_units"])
+    points = np.asarray(mesh.points)
+    points += scaled_disp.astype(points.dtype, copy=False)
+    mesh.points = points
     
     return mesh
\ No newline at end of file
@@ -0,0 +1,128 @@
+import os
+import json
+import numpy as np
+from scipy.spatial import ConvexHull
+
+try:
+    from scipy.spatial import QhullError
+except ImportError:  # scipy < 1.8
+    from scipy.spatial.qhull import QhullError
+
+# In-memory extent cache, keyed by (rst file, mtime, named selection, mode)
+_extent_cache = {}
+
+def bounding_box_diagonal(points):
+    # Diagonal of the axis-aligned bounding box, an upper bound of the diameter
+    points = np.asarray(points)
+    if len(points) == 0:
+        return 0.0
+    return float(np.linalg.norm(points.max(axis=0) - points.min(axis=0)))
+
+def farthest_pair_distance(points, max_bytes=64 << 20):
+    # Exact farthest pair. Two points are at most r_p + r_q apart (r: distance to the bounding box center), so with the
+    # points sorted by decreasing r, a point is only compared with the prefix that can still beat the best pair found.
+    # Elongated parts prune most pairs, round ones (a sphere) stay O(len(points)**2); each block of squared distances
+    # holds at most max_bytes
+    points = np.asarray(points, dtype=float)
+    if len(points) < 2:
+        return 0.0
+    points = points - (points.max(axis=0) + points.min(axis=0)) / 2
+    radius = np.linalg.norm(points, axis=1)
+    order = np.argsort(radius)[::-1]
+    points, radius = points[order], radius[order]
+    squared = radius ** 2
+
+    # Lower bound from a few farthest-point sweeps, usually the diameter already
+    best, index = 0.0, 0
+    for _ in range(3):
+        distances = np.linalg.norm(points - points[index], axis=1)
+        index = int(distances.argmax())
+        best = max(best, float(distances[index]))
+
+    start = 0
+    while start < len(points) and radius[start] + radius[0] > best:
+        # Candidates of the first (largest) row of the block: every point with r > best - r_start
+        candidates = int(np.searchsorted(-radius, radius[start] - best, side='left'))
+        end = min(len(points), start + max(1, max_bytes // (8 * candidates)))
+        # Pairs with a point after the block are compared when that point's block is reached
+        candidates = min(candidates, end)
+        block = squared[start:end, None] + squared[None, :candidates] - 2 * points[start:end] @ points[:candidates].T
+        row, column = np.unravel_index(int(block.argmax()), block.shape)
+        # The exact distance of the block's farthest pair, the expanded form loses digits to cancellation
+        best = max(best, float(np.linalg.norm(points[start + row] - points[column])))
+        start = end
+    return best
+
+def hull_vertices(points):
+    # Reduce the point cloud to its convex hull vertices in O(N log N)
+    points = np.asarray(points, dtype=float)
+    centered = points - points.mean(axis=0)
+    for dim in (3, 2):
+        if dim == 3:
+            projected = centered
+        else:
+            # Planar point sets have no 3D hull, retry in their principal plane
+            _, _, vt = np.linalg.svd(centered[:min(len(centered), 100000)], full_matrices=False)
+            projected = centered @ vt[:2].T
+        try:
+            return points[ConvexHull(projected).vertices]
+        except (QhullError, ValueError):
+            continue
+    # Collinear points: the extremes along the principal axis are the farthest pair
+    _, _, vt = np.linalg.svd(centered[:min(len(centered), 100000)], full_matrices=False)
+    axis = centered @ vt[0]
+    return points[[np.argmin(axis), np.argmax(axis)]]
+
+def hull_diameter(points, max_bytes=64 << 20):
+    # Exact diameter: the farthest pair of a point cloud always lies on its convex hull
+    points = np.asarray(points, dtype=float)
+    if len(points) < 2:
+        return 0.0
+    return farthest_pair_distance(hull_vertices(points), max_bytes)
+
+def compute_extent(points, mode="hull"):
+    if mode == "hull":
+        return hull_diameter(points)
+    elif mode == "bbox":
+        return bounding_box_diagonal(points)
+    else:
+        raise ValueError(f"Invalid extent mode: {mode}. Available modes: 'hull', 'bbox'")
+
+def extent_cache_key(rst_file, named_selection, mode, main_dir=""):
+    # The rst file of the input data is relative to the repository root, not to the working directory
+    rst_path = os.path.abspath(os.path.join(main_dir, rst_file))
+    mtime = os.path.getmtime(rst_path) if os.path.exists(rst_path) else None
+    return f"{rst_path}|{mtime}|{named_selection}|{mode}"
+
+def _load_disk_cache(cache_file):
+    if cache_file and os.path.exists(cache_file):
+        with open(cache_file, 'r') as file:
+            return json.load(file)
+    return {}
+
+def _save_disk_cache(cache_file, disk_cache):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    with open(cache_file, 'w') as file:
+        json.dump(disk_cache, file, indent=4)
+
+def model_extent(points, mode="hull", rst_file=None, named_selection=None, cache_dir=None, main_dir=""):
+    # Longest dimension of the model, cached per rst file and named selection
+    if rst_file is None:
+        return compute_extent(points, mode)
+
+    key = extent_cache_key(rst_file, named_selection, mode, main_dir=main_dir)
+    if key in _extent_cache:
+        return _extent_cache[key]
+
+    cache_file = os.path.join(cache_dir, "extent_cache.json") if cache_dir else None
+    disk_cache = _load_disk_cache(cache_file)
+    if key in disk_cache:
+        _extent_cache[key] = disk_cache[key]
+        return disk_cache[key]
+
+    extent = compute_extent(points, mode)
+    _extent_cache[key] = extent
+    if cache_file:
+        disk_cache[key] = extent
+        _save_disk_cache(cache_file, disk_cache)
+    return extent
@@ -0,0 +1,66 @@
+import os
+import numpy as np
+import pandas as pd
+
+# S-N curves loaded during this run, keyed by (absolute path, modification time)
+_curves = {}
+
+def read_sn_curve(file_path):
+    sn_data = pd.read_csv(file_path, delimiter=';')
+    return sn_data['Stress'].values, sn_data['Cycles'].values
+
+def load_sn_curve(file_path):
+    # Log-log S-N curve sorted by stress, read once per file version
+    key = (os.path.abspath(file_path), os.path.getmtime(file_path))
+    if key not in _curves:
+        stress_values, cycle_values = read_sn_curve(file_path)
+        order = np.argsort(stress_values)
+        _curves[key] = {
+            "log_stress": np.log10(np.asarray(stress_values, dtype=float)[order]),
+            "log_cycles": np.log10(np.asarray(cycle_values, dtype=float)[order]),
+            "max_cycle": float(np.max(cycle_values)),
+        }
+    return _curves[key]
+
+def sn_curve_file(config, named_selection=None):
+    # S-N curve of a named selection, 'sn_curve_file' is either one path or a mapping with a 'default' entry
+    sn_curve_files = config["additional_files"]["sn_curve_file"]
+    if isinstance(sn_curve_files, dict):
+        return sn_curve_files.get(named_selection, sn_curve_files["default"])
+    return sn_curve_files
+
+def curves_per_named_selection(config):
+    # Whether named selections have S-N curves of their own, applied through the named selection masks
+    sn_curve_files = config["additional_files"]["sn_curve_file"]
+    return isinstance(sn_curve_files, dict) and any(name != "default" for name in sn_curve_files)
+
+def log_log_interpolate(log_stress_values, log_stress, log_cycles):
+    # Linear interpolation in log-log space, extrapolated with the end slopes outside the curve
+    log_cycles_values = np.interp(log_stress_values, log_stress, log_cycles)
+    with np.errstate(invalid='ignore'):
+        below = log_stress_values < log_stress[0]
+        above = log_stress_values > log_stress[-1]
+    slope_low = (log_cycles[1] - log_cycles[0]) / (log_stress[1] - log_stress[0])
+    slope_high = (log_cycles[-1] - log_cycles[-2]) / (log_stress[-1] - log_stress[-2])
+    log_cycles_values[below] = log_cycles[0] + slope_low * (log_stress_values[below] - log_stress[0])
+    log_cycles_values[above] = log_cycles[-1] + slope_high * (log_stress_values[above] - log_stress[-1])
+    return log_cycles_values
+
+def evaluate_cycles(stress_array, curve):
+    # Cycles to failure of every point in one array pass, capped at the end of the curve
+    with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+        log_stress_values = np.log10(np.asarray(stress_array, dtype=float))
+        cycles = np.power(10, log_log_interpolate(log_stress_values, curve["log_stress"], curve["log_cycles"]))
+    return np.clip(cycles, None, curve["max_cycle"])
+
+def cycles_to_failure(stress_array, config, named_selection=None, masks=None):
+    # Evaluate the curve of the named selection, or one curve per named selection mask
+    # The log-log interpolation runs in float64, the cycles come back in the precision of the stress
+    dtype = np.result_type(np.asarray(stress_array).dtype, np.float32)
+    stress_array = np.asarray(stress_array, dtype=float)
+    cycles = evaluate_cycles(stress_array, load_sn_curve(sn_curve_file(config, named_selection)))
+    for mask_name, mask in (masks or {}).items():
+        mask_file = sn_curve_file(config, mask_name)
+        if mask_file != sn_curve_file(config, named_selection):
+            cycles[mask] = evaluate_cycles(stress_array[mask], load_sn_curve(mask_file))
+    return cycles.astype(dtype, copy=False)
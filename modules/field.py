@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+class ResultField:
+    # Struct-of-arrays result: views into the twin point and snapshot buffers, no per-operation copies
+    __slots__ = ("points", "values", "name")
+
+    def __init__(self, points, values, name):
+        self.points = points  # (N, 3) coordinates
+        self.values = values  # (N,) result values
+        self.name = name
+
+    @classmethod
+    def from_dataframe(cls, result_data):
+        # Build from the legacy x, y, z, result DataFrame layout
+        name = result_data.columns[3]
+        return cls(result_data[["x", "y", "z"]].to_numpy(), result_data[name].to_numpy(), name)
+
+    @property
+    def x(self):
+        return self.points[:, 0]
+
+    @property
+    def y(self):
+        return self.points[:, 1]
+
+    @property
+    def z(self):
+        return self.points[:, 2]
+
+    @property
+    def columns(self):
+        return ["x", "y", "z", self.name]
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_array(self):
+        # (N, 4) array of x, y, z and the result
+        return np.column_stack([self.points, self.values])
+
+    def to_dataframe(self):
+        # Only needed when the result leaves NumPy for export
+        return pd.DataFrame({"x": self.x, "y": self.y, "z": self.z, self.name: self.values})
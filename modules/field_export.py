@@ -0,0 +1,124 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+FIELD_FORMATS = ["json", "parquet", "npy", "hdf5"]
+
+def store_name(points, named_selection):
+    # Field store shared by every result on the same mesh scoping
+    digest = hashlib.sha1(np.ascontiguousarray(points, dtype=float).tobytes()).hexdigest()[:12]
+    scope = named_selection.replace(" ", "_").lower()
+    return f"fields_{scope}_{digest}"
+
+def _split(result_data):
+    # Coordinates and result column of an operation result, in the precision of the result
+    return np.asarray(result_data.points), result_data.name, np.asarray(result_data.values)
+
+def export_json(result_data, output_dir, result_detail, field_data):
+    # Legacy line-delimited JSON, one record per point, float32 results written with the digits they hold
+    result_field_path = os.path.join(output_dir, result_detail + "_" + field_data)
+    digits = 7 if np.asarray(result_data.values).dtype == np.float32 else 10
+    result_data.to_dataframe().to_json(result_field_path, orient='records', lines=True, double_precision=digits)
+    return result_field_path
+
+def export_npy(points, name, values, store_path):
+    # Raw float32 arrays, ready for np.load(..., mmap_mode='r')
+    os.makedirs(store_path, exist_ok=True)
+    points_path = os.path.join(store_path, "points.npy")
+    if not os.path.exists(points_path):
+        np.save(points_path, points.astype(np.float32))
+    np.save(os.path.join(store_path, f"{name}.npy"), values.astype(np.float32))
+    return store_path
+
+def export_parquet(points, name, values, store_path):
+    # One columnar file per store: x, y, z and one column per field, a field exported again replaces its column
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("The 'parquet' field format requires pyarrow. Install it with 'pip install pyarrow'.")
+    store_file = f"{store_path}.parquet"
+    if os.path.exists(store_file):
+        table = pq.read_table(store_file)
+    else:
+        table = pa.table({"x": points[:, 0], "y": points[:, 1], "z": points[:, 2]})
+    column = pa.array(values)
+    if name in table.column_names:
+        table = table.set_column(table.column_names.index(name), name, column)
+    else:
+        table = table.append_column(name, column)
+    # Written next to the store and moved over it, a reader never sees a partial file
+    temporary_file = f"{store_file}.tmp"
+    pq.write_table(table, temporary_file, compression="zstd")
+    os.replace(temporary_file, store_file)
+    return store_file
+
+def export_hdf5(points, name, values, store_path, chunk_size=65536):
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("The 'hdf5' field format requires h5py. Install it with 'pip install h5py'.")
+    store_file = f"{store_path}.h5"
+    options = {"chunks": True if len(values) < chunk_size else (chunk_size,), "compression": "gzip", "shuffle": True}
+    with h5py.File(store_file, "a") as f:
+        if "points" not in f:
+            f.create_dataset("points", data=points, **dict(options, chunks=True))
+        fields = f.require_group("fields")
+        if name in fields:
+            del fields[name]
+        fields.create_dataset(name, data=values, **options)
+    return store_file
+
+def export_field(result_data, output_dir, input_data):
+    # Export an operation result in the field format chosen in the input data
+    data_file = input_data["output_files"]["data_file"]
+    field_format = data_file.get("field_format", "json")
+    result_detail = "_".join(input_data["input_parameters"]["operation"])
+
+    if field_format == "json":
+        return export_json(result_data, output_dir, result_detail, data_file["field_data"])
+
+    points, name, values = _split(result_data)
+    store_path = os.path.join(output_dir, store_name(points, input_data["input_parameters"]["named_selection"]))
+    if field_format == "npy":
+        return export_npy(points, name, values, store_path)
+    elif field_format == "parquet":
+        return export_parquet(points, name, values, store_path)
+    elif field_format == "hdf5":
+        return export_hdf5(points, name, values, store_path)
+    else:
+        raise ValueError(f"Invalid field format: {field_format}. Available formats: {FIELD_FORMATS}")
+
+def list_fields(store_path):
+    # Names of the fields held by a field store
+    if store_path.endswith(".h5"):
+        import h5py
+        with h5py.File(store_path, "r") as f:
+            return list(f["fields"])
+    if store_path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return [name for name in pq.read_schema(store_path).names if name not in ("x", "y", "z")]
+    names = [os.path.splitext(file)[0] for file in os.listdir(store_path)]
+    return sorted(name for name in set(names) if name != "points")
+
+def read_field(store_path, name=None, mmap=True):
+    # Read the coordinates and one field from any export format, returns (points, values)
+    if store_path.endswith(".json"):
+        result_data = pd.read_json(store_path, orient='records', lines=True)
+        name = name or result_data.columns[3]
+        return result_data[["x", "y", "z"]].to_numpy(), result_data[name].to_numpy()
+
+    name = name or list_fields(store_path)[0]
+    if store_path.endswith(".h5"):
+        import h5py
+        with h5py.File(store_path, "r") as f:
+            return f["points"][:], f["fields"][name][:]
+    if store_path.endswith(".parquet"):
+        # Only the coordinate and field columns are read
+        import pyarrow.parquet as pq
+        table = pq.read_table(store_path, columns=["x", "y", "z", name])
+        points = np.column_stack([table.column(axis).to_numpy() for axis in ("x", "y", "z")])
+        return points, table.column(name).to_numpy()
+    mmap_mode = 'r' if mmap else None
+    return np.load(os.path.join(store_path, "points.npy"), mmap_mode=mmap_mode), np.load(os.path.join(store_path, f"{name}.npy"), mmap_mode=mmap_mode)
@@ -0,0 +1,323 @@
+import os
+import json
+import shutil
+import struct
+import tempfile
+import hashlib
+import numpy as np
+from . import mesh_cache
+
+# glTF component types and buffer view targets
+FLOAT = 5126
+UNSIGNED_INT = 5125
+SHORT = 5122
+BYTE = 5120
+UNSIGNED_BYTE = 5121
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+# Surface topology per mesh and scoping, reused by every export of the same grid
+_topologies = {}
+
+def topology_key(grid):
+    # Topology only depends on the cells, not on the (deflected) point positions
+    digest = hashlib.sha1()
+    digest.update(str(grid.n_points).encode())
+    if hasattr(grid, "celltypes"):
+        digest.update(np.ascontiguousarray(grid.celltypes).tobytes())
+        digest.update(np.ascontiguousarray(mesh_cache.cell_connectivity(grid)).tobytes())
+    else:
+        # Surface meshes carry their topology in the faces array
+        digest.update(np.ascontiguousarray(grid.faces).tobytes())
+    return digest.hexdigest()
+
+def surface_topology(grid):
+    # Outer surface triangulated once: grid point ids of the surface vertices and the triangle indices
+    key = topology_key(grid)
+    if key not in _topologies:
+        surface = grid.extract_surface(pass_pointid=True).triangulate()
+        point_ids = np.asarray(surface.point_data["vtkOriginalPointIds"], dtype=np.int64)
+        triangles = np.asarray(surface.faces, dtype=np.uint32).reshape(-1, 4)[:, 1:]
+        _topologies[key] = {
+            "point_ids": point_ids,
+            "triangles": np.ascontiguousarray(triangles),
+        }
+    return _topologies[key]
+
+def vertex_normals(positions, triangles):
+    # Area-weighted vertex normals from the triangle cross products
+    p0, p1, p2 = (positions[triangles[:, i]] for i in range(3))
+    face_normals = np.cross(p1 - p0, p2 - p0)
+    normals = np.zeros_like(positions)
+    for i in range(3):
+        np.add.at(normals, triangles[:, i], face_normals)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.where(lengths > 0, lengths, 1)
+
+def scalar_colors(values, cmap="viridis", clim=None):
+    # RGBA vertex colors of a scalar field, the same colormap pyvista uses by default
+    import matplotlib
+    values = np.asarray(values, dtype=float)
+    vmin, vmax = clim if clim else (np.nanmin(values), np.nanmax(values))
+    scaled = (values - vmin) / (vmax - vmin) if vmax > vmin else np.zeros_like(values)
+    # The colormap registry replaced cm.get_cmap in Matplotlib 3.5
+    if hasattr(matplotlib, "colormaps"):
+        colormap = matplotlib.colormaps[cmap]
+    else:
+        from matplotlib import cm
+        colormap = cm.get_cmap(cmap)
+    return colormap(np.clip(scaled, 0, 1)).astype(np.float32)
+
+def quantize_positions(positions):
+    # Normalized int16 positions with the node translation and scale restoring them (KHR_mesh_quantization)
+    lower, upper = positions.min(axis=0), positions.max(axis=0)
+    center = (lower + upper) / 2
+    half_extent = np.max(upper - lower) / 2 or 1.0
+    quantized = np.zeros((len(positions), 4), dtype=np.int16)
+    quantized[:, :3] = np.round((positions - center) / half_extent * 32767)
+    return quantized, center, half_extent
+
+def quantize_normals(normals):
+    # Normalized int8 normals, padded to 4 bytes per vertex for alignment
+    quantized = np.zeros((len(normals), 4), dtype=np.int8)
+    quantized[:, :3] = np.round(normals * 127)
+    return quantized
+
+class GlbBuilder:
+    # Accumulates buffer views and accessors into one binary buffer
+    def __init__(self):
+        self.chunks = []
+        self.length = 0
+        self.buffer_views = []
+        self.accessors = []
+
+    def view(self, array, target=None, byte_stride=None):
+        # Buffer view over the bytes of one array, padded to a 4-byte boundary
+        data = np.ascontiguousarray(array).tobytes()
+        view = {"buffer": 0, "byteOffset": self.length, "byteLength": len(data)}
+        if target:
+            view["target"] = target
+        if byte_stride:
+            view["byteStride"] = byte_stride
+        self.buffer_views.append(view)
+        self.chunks.append(data)
+        self.length += len(data)
+        padding = -self.length % 4
+        if padding:
+            self.chunks.append(b"\x00" * padding)
+            self.length += padding
+        return len(self.buffer_views) - 1
+
+    def add(self, array, component_type, accessor_type, target, count=None, byte_stride=None, normalized=False, bounds=False):
+        accessor = {
+            "bufferView": self.view(array, target, byte_stride),
+            "componentType": component_type,
+            "count": count if count is not None else len(array),
+            "type": accessor_type,
+        }
+        if normalized:
+            accessor["normalized"] = True
+        if bounds:
+            # Bounds are the stored values, raw integers for quantized accessors whether normalized or not
+            accessor["min"] = np.atleast_1d(np.asarray(array).min(axis=0))[:3].tolist()
+            accessor["max"] = np.atleast_1d(np.asarray(array).max(axis=0))[:3].tolist()
+        self.accessors.append(accessor)
+        return len(self.accessors) - 1
+
+    def reserve(self, nbytes, component_type, accessor_type, target, count, bounds=None):
+        # Accessor whose data is streamed after the stored chunks, nothing is kept in memory
+        self.buffer_views.append({"buffer": 0, "byteOffset": self.length, "byteLength": nbytes, "target": target})
+        self.length += nbytes
+        accessor = {"bufferView": len(self.buffer_views) - 1, "componentType": component_type, "count": count, "type": accessor_type}
+        if bounds:
+            accessor["min"], accessor["max"] = bounds
+        self.accessors.append(accessor)
+        return len(self.accessors) - 1
+
+    def binary(self):
+        return b"".join(self.chunks)
+
+def glb_bytes(document, binary):
+    # Binary glTF container: header, JSON chunk padded with spaces, BIN chunk padded with zeros
+    json_chunk = json.dumps(document, separators=(",", ":")).encode()
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    binary += b"\x00" * (-len(binary) % 4)
+    length = 12 + 8 + len(json_chunk) + 8 + len(binary)
+    return b"".join([
+        struct.pack("<4sII", b"glTF", 2, length),
+        struct.pack("<I4s", len(json_chunk), b"JSON"), json_chunk,
+        struct.pack("<I4s", len(binary), b"BIN\x00"), binary,
+    ])
+
+def write_glb(grid, output_file, scalars=None, quantize=False, cmap="viridis", clim=None):
+    # Write the grid surface to .glb straight from its arrays, no render window involved
+    topology = surface_topology(grid)
+    point_ids, triangles = topology["point_ids"], topology["triangles"]
+    positions = np.asarray(grid.points, dtype=np.float64)[point_ids]
+    normals = vertex_normals(positions, triangles)
+    scalars = scalars if scalars is not None else grid.active_scalars_name
+
+    builder = GlbBuilder()
+    attributes = {}
+    node = {"mesh": 0}
+    document = {"asset": {"version": "2.0", "generator": "digital-twin direct glTF exporter"}}
+    if quantize:
+        quantized, center, half_extent = quantize_positions(positions)
+        attributes["POSITION"] = builder.add(quantized, SHORT, "VEC3", ARRAY_BUFFER, byte_stride=8, normalized=True, bounds=True)
+        attributes["NORMAL"] = builder.add(quantize_normals(normals), BYTE, "VEC3", ARRAY_BUFFER, byte_stride=4, normalized=True)
+        # Dequantization happens through the node transform
+        node["translation"] = center.tolist()
+        node["scale"] = [half_extent] * 3
+        document["extensionsUsed"] = ["KHR_mesh_quantization"]
+        document["extensionsRequired"] = ["KHR_mesh_quantization"]
+    else:
+        attributes["POSITION"] = builder.add(positions.astype(np.float32), FLOAT, "VEC3", ARRAY_BUFFER, bounds=True)
+        attributes["NORMAL"] = builder.add(normals.astype(np.float32), FLOAT, "VEC3", ARRAY_BUFFER)
+
+    if scalars is not None:
+        values = np.asarray(grid.point_data[scalars])[point_ids]
+        colors = scalar_colors(values, cmap=cmap, clim=clim)
+        if quantize:
+            attributes["COLOR_0"] = builder.add(np.round(colors * 255).astype(np.uint8), UNSIGNED_BYTE, "VEC4", ARRAY_BUFFER, normalized=True)
+        else:
+            attributes["COLOR_0"] = builder.add(colors, FLOAT, "VEC4", ARRAY_BUFFER)
+
+    # Raw values of every scalar point array as application-specific attributes
+    for name in grid.point_data.keys():
+        values = np.asarray(grid.point_data[name])
+        if values.ndim == 1:
+            attributes[f"_{name.upper()}"] = builder.add(values[point_ids].astype(np.float32), FLOAT, "SCALAR", ARRAY_BUFFER)
+
+    indices = builder.add(triangles.ravel(), UNSIGNED_INT, "SCALAR", ELEMENT_ARRAY_BUFFER)
+    document.update({
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [node],
+        "meshes": [{"primitives": [{"attributes": attributes, "indices": indices, "mode": 4, "material": 0}]}],
+        "materials": [{"pbrMetallicRoughness": {"baseColorFactor": [1, 1, 1, 1], "metallicFactor": 0, "roughnessFactor": 1}, "doubleSided": True}],
+        "buffers": [{"byteLength": builder.length}],
+        "bufferViews": builder.buffer_views,
+        "accessors": builder.accessors,
+    })
+
+    with open(output_file, "wb") as f:
+        f.write(glb_bytes(document, builder.binary()))
+    return output_file
+
+def write_animated_glb(grid, frames, n_frames, output_file, fps=10, scale=None, cmap="viridis", clim=None):
+    # One .glb holding every frame of a load sequence as a morph target of a single shared topology.
+    # frames yields (displacement (n_nodes, 3) in meters, scalar values (n_nodes,)) on the grid nodes;
+    # scale maps the largest displacement of the sequence to the deformation scale factor
+    topology = surface_topology(grid)
+    point_ids, triangles = topology["point_ids"], topology["triangles"]
+    n_vertices = len(point_ids)
+    positions = np.asarray(grid.points, dtype=np.float64)[point_ids]
+
+    scratch_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        # First pass: surface values of each frame are streamed to scratch arrays, one frame in memory
+        displacements = np.lib.format.open_memmap(os.path.join(scratch_dir, "displacements.npy"), mode="w+", dtype=np.float32, shape=(n_frames, n_vertices, 3))
+        values = np.lib.format.open_memmap(os.path.join(scratch_dir, "values.npy"), mode="w+", dtype=np.float32, shape=(n_frames, n_vertices))
+        lower = np.zeros((n_frames, 3))
+        upper = np.zeros((n_frames, 3))
+        max_displacement = 0.0
+        value_range = [np.inf, -np.inf]
+        count = 0
+        for index, (displacement, scalars) in enumerate(frames):
+            if index >= n_frames:
+                raise ValueError(f"More than the {n_frames} announced frames were produced.")
+            displacements[index] = np.asarray(displacement)[point_ids]
+            values[index] = np.asarray(scalars)[point_ids]
+            lower[index], upper[index] = displacements[index].min(axis=0), displacements[index].max(axis=0)
+            max_displacement = max(max_displacement, float(np.linalg.norm(displacements[index], axis=1).max()))
+            value_range = [min(value_range[0], float(np.nanmin(values[index]))), max(value_range[1], float(np.nanmax(values[index])))]
+            count += 1
+        if count != n_frames:
+            raise ValueError(f"Expected {n_frames} frames, got {count}.")
+
+        # The deformation scale and color range hold for the whole sequence
+        factor = scale(max_displacement) if scale else 1.0
+        clim = clim or value_range
+        base_colors = scalar_colors(values[0], cmap=cmap, clim=clim)
+
+        builder = GlbBuilder()
+        attributes = {
+            "POSITION": builder.add(positions.astype(np.float32), FLOAT, "VEC3", ARRAY_BUFFER, bounds=True),
+            "NORMAL": builder.add(vertex_normals(positions, triangles).astype(np.float32), FLOAT, "VEC3", ARRAY_BUFFER),
+            "COLOR_0": builder.add(base_colors, FLOAT, "VEC4", ARRAY_BUFFER),
+        }
+        indices = builder.add(triangles.ravel(), UNSIGNED_INT, "SCALAR", ELEMENT_ARRAY_BUFFER)
+
+        # Frame k shows target k alone: a sparse one-hot weight vector per keyframe
+        times = builder.add((np.arange(n_frames) / fps).astype(np.float32), FLOAT, "SCALAR", None, bounds=True)
+        hot = builder.view(np.arange(n_frames, dtype=np.uint32) * (n_frames + 1))
+        ones = builder.view(np.ones(n_frames, dtype=np.float32))
+        builder.accessors.append({
+            "componentType": FLOAT, "count": n_frames * n_frames, "type": "SCALAR",
+            "sparse": {
+                "count": n_frames,
+                "indices": {"bufferView": hot, "byteOffset": 0, "componentType": UNSIGNED_INT},
+                "values": {"bufferView": ones, "byteOffset": 0},
+            },
+        })
+        weights = len(builder.accessors) - 1
+        stored = builder.binary()
+
+        # Morph targets are reserved behind the stored data and streamed frame by frame
+        targets = []
+        for index in range(n_frames):
+            scaled = (lower[index] * factor, upper[index] * factor)
+            bounds = (np.minimum(*scaled).tolist(), np.maximum(*scaled).tolist())
+            targets.append({
+                "POSITION": builder.reserve(n_vertices * 12, FLOAT, "VEC3", ARRAY_BUFFER, n_vertices, bounds=bounds),
+                "COLOR_0": builder.reserve(n_vertices * 16, FLOAT, "VEC4", ARRAY_BUFFER, n_vertices),
+            })
+
+        document = {
+            "asset": {"version": "2.0", "generator": "digital-twin direct glTF exporter"},
+            "scene": 0,
+            "scenes": [{"nodes": [0]}],
+            "nodes": [{"mesh": 0}],
+            "meshes": [{
+                "primitives": [{"attributes": attributes, "indices": indices, "mode": 4, "material": 0, "targets": targets}],
+                "weights": [1.0] + [0.0] * (n_frames - 1),
+            }],
+            "materials": [{"pbrMetallicRoughness": {"baseColorFactor": [1, 1, 1, 1], "metallicFactor": 0, "roughnessFactor": 1}, "doubleSided": True}],
+            "animations": [{
+                "channels": [{"sampler": 0, "target": {"node": 0, "path": "weights"}}],
+                "samplers": [{"input": times, "output": weights, "interpolation": "LINEAR"}],
+            }],
+            "buffers": [{"byteLength": builder.length}],
+            "bufferViews": builder.buffer_views,
+            "accessors": builder.accessors,
+        }
+        json_chunk = json.dumps(document, separators=(",", ":")).encode()
+        json_chunk += b" " * (-len(json_chunk) % 4)
+
+        # Second pass: header, JSON and stored data, then every frame delta straight from the scratch arrays
+        with open(output_file, "wb") as f:
+            f.write(struct.pack("<4sII", b"glTF", 2, 12 + 8 + len(json_chunk) + 8 + builder.length))
+            f.write(struct.pack("<I4s", len(json_chunk), b"JSON"))
+            f.write(json_chunk)
+            f.write(struct.pack("<I4s", builder.length, b"BIN\x00"))
+            f.write(stored)
+            for index in range(n_frames):
+                f.write(np.ascontiguousarray(displacements[index] * np.float32(factor)).tobytes())
+                f.write((scalar_colors(values[index], cmap=cmap, clim=clim) - base_colors).tobytes())
+        del displacements, values
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return output_file
+
+def read_glb(glb_file):
+    # Parse a .glb back into its JSON document and binary chunk
+    with open(glb_file, "rb") as f:
+        data = f.read()
+    magic, version, length = struct.unpack_from("<4sII", data, 0)
+    if magic != b"glTF" or version != 2:
+        raise ValueError(f"{glb_file} is not a binary glTF 2.0 file.")
+    json_length, _ = struct.unpack_from("<I4s", data, 12)
+    document = json.loads(data[20:20 + json_length])
+    binary_length, _ = struct.unpack_from("<I4s", data, 20 + json_length)
+    binary = data[28 + json_length:28 + json_length + binary_length]
+    return document, binary
@@ -0,0 +1,302 @@
+from . import utility, sweep, miner
+import os
+import json
+import time
+import asyncio
+import numpy as np
+from contextlib import aclosing
+from concurrent.futures import ThreadPoolExecutor
+
+# Put on the queue once every source is exhausted
+_END = object()
+
+def ingest_settings(ingest_config):
+    # Ingest section of the input data, the source plus the batching and damage options
+    settings = dict(ingest_config or {})
+    settings.setdefault('source', 'file')
+    settings.setdefault('follow', False)
+    settings.setdefault('batch_size', 32)
+    # Seconds the first reading of a batch waits for the batch to fill
+    settings.setdefault('max_delay', 0.05)
+    # Readings buffered before the sources are paused
+    settings.setdefault('queue_size', 1024)
+    settings.setdefault('output_file', 'data/output/ingest_summary.jsonl')
+    settings.setdefault('damage', True)
+    settings.setdefault('state_dir', 'data/output/ingest_damage_state')
+    return settings
+
+def parse_reading(payload, config):
+    # Twin inputs of one reading, {"rom_inputs": {...}} or the inputs at top level, with an optional timestamp
+    reading = json.loads(payload) if isinstance(payload, (str, bytes)) else payload
+    if not isinstance(reading, dict):
+        raise ValueError(f"Reading should be a JSON object, got {type(reading).__name__}.")
+    rom_inputs = reading.get("rom_inputs") or {name: reading[name] for name in config['inputs'] if name in reading}
+    if not rom_inputs:
+        raise ValueError(f"Reading without twin inputs: {reading}")
+    try:
+        rom_inputs = {name: float(value) for name, value in rom_inputs.items()}
+    except (TypeError, ValueError):
+        raise ValueError(f"Twin inputs of the reading should be numbers: {rom_inputs}")
+    utility.validate_rom_inputs(rom_inputs, config)
+    return {"timestamp": reading.get("timestamp"), "rom_inputs": rom_inputs, "received": time.perf_counter()}
+
+async def file_source(path, follow=False, poll_interval=0.1):
+    # JSON lines of a file, lines appended later keep coming while following it like tail -f
+    partial = ""
+    with open(path, "r") as f:
+        while True:
+            line = f.readline()
+            if line.endswith("\n") or (line and not follow):
+                line, partial = partial + line, ""
+                if line.strip():
+                    yield line
+            elif line:
+                # The writer has not finished this line yet
+                partial += line
+            elif follow:
+                await asyncio.sleep(poll_interval)
+            else:
+                return
+
+async def socket_source(path):
+    # JSON lines sent by local clients on a UNIX socket, clients stop being read while the pipeline is saturated
+    lines = asyncio.Queue(maxsize=1)
+
+    async def handle(reader, writer):
+        try:
+            async for line in reader:
+                if line.strip():
+                    await lines.put(line)
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path)
+    server = await asyncio.start_unix_server(handle, path=path)
+    print(f"++ Listening for readings on {path}")
+    try:
+        async with server:
+            while True:
+                yield await lines.get()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+class LocalBroker:
+    # In-process stand-in for an MQTT broker: exact topic subscriptions, publishing waits for slow subscribers
+    def __init__(self, queue_size=1):
+        self.queue_size = queue_size
+        self.subscriptions = {}
+
+    def subscribe(self, topic):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscriptions.setdefault(topic, []).append(queue)
+        return queue
+
+    async def publish(self, topic, payload):
+        for queue in self.subscriptions.get(topic, []):
+            await queue.put(payload)
+
+    async def close(self, topic):
+        # End the streams of the topic subscribers
+        await self.publish(topic, None)
+
+async def broker_source(broker, topic):
+    queue = broker.subscribe(topic)
+    while True:
+        payload = await queue.get()
+        if payload is None:
+            return
+        yield payload
+
+async def mqtt_source(host, topic, port=1883):
+    # Messages of an MQTT topic, aiomqtt is only needed for this source
+    import aiomqtt
+    async with aiomqtt.Client(host, port=port) as client:
+        await client.subscribe(topic)
+        async for message in client.messages:
+            yield message.payload
+
+def make_source(settings, main_dir):
+    source = settings['source']
+    if source == "file":
+        return file_source(os.path.join(main_dir, settings['path']), follow=settings['follow'])
+    if source == "socket":
+        return socket_source(settings['path'])
+    if source == "mqtt":
+        return mqtt_source(settings['host'], settings['topic'], port=settings.get('port', 1883))
+    raise ValueError(f"Invalid ingest source: {source}. Available sources: file, socket, mqtt.")
+
+class BatchEvaluator:
+    # Evaluates a micro-batch of readings on the warm twin and summarizes it in one record
+    def __init__(self, config, input_data, twin_model, rom_name, scoping_twin, accumulator=None, load_input=None):
+        self.config = config
+        self.input_data = input_data
+        self.twin_model = twin_model
+        self.rom_name = rom_name
+        self.scoping_twin = scoping_twin
+        self.points = utility.unflatten_vector(twin_model.generate_points(rom_name, on_disk=False, named_selection=scoping_twin), 3)
+        self.unit = utility.get_unit(input_data, config)
+        self.accumulator = accumulator
+        self.load_input = load_input
+        self.batches = 0
+
+    def extreme(self, values, node, reading):
+        return {"points": self.points[node].tolist(), "result": float(values[node]), "inputs": reading["rom_inputs"]}
+
+    def __call__(self, readings):
+        record = {"batch": self.batches, "readings": len(readings), "unit": self.unit,
+                  "timestamps": [readings[0]["timestamp"], readings[-1]["timestamp"]]}
+        # (readings, points) results of the whole batch, see sweep.evaluate_cases
+        values = sweep.evaluate_cases(self.twin_model, self.rom_name, self.scoping_twin, self.config, self.input_data,
+                                      [reading["rom_inputs"] for reading in readings])
+        # The hot spot of the batch is the location of its max
+        max_reading, max_node = np.unravel_index(int(np.argmax(values)), values.shape)
+        min_reading, min_node = np.unravel_index(int(np.argmin(values)), values.shape)
+        record["max"] = self.extreme(values[max_reading], max_node, readings[max_reading])
+        record["min"] = self.extreme(values[min_reading], min_node, readings[min_reading])
+
+        if self.accumulator is not None:
+            # Damage of the load cycles closed by this batch, one rainflow update and one state save per batch;
+            # readings without the load input add no point to the load history
+            loads = [reading["rom_inputs"][self.load_input] for reading in readings if self.load_input in reading["rom_inputs"]]
+            increment = self.accumulator.consume(loads)
+            node = int(np.argmax(increment))
+            record["damage_increment"] = {"points": self.points[node].tolist(), "result": float(increment[node])}
+            record["damage"] = {"result": float(np.max(self.accumulator.damage)), "cycles": self.accumulator.cycles}
+            if len(loads) < len(readings):
+                record["damage"]["skipped_readings"] = len(readings) - len(loads)
+        self.batches += 1
+        return record
+
+class IngestPipeline:
+    # Sources -> bounded queue -> micro-batches -> twin evaluation in a worker thread -> summary records
+    def __init__(self, config, evaluate_batch, emit, batch_size=32, max_delay=0.05, queue_size=1024):
+        self.config = config
+        self.evaluate_batch = evaluate_batch
+        self.emit = emit
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.queue = None
+        self.done = False
+        self.readings = 0
+        self.rejected = 0
+        self.batches = 0
+        # Seconds from the receipt of every reading to the emission of its batch record
+        self.latencies = []
+
+    async def feed(self, source):
+        # The source is closed with its feeder, e.g. the socket file is removed when the pipeline stops
+        async with aclosing(source):
+            async for payload in source:
+                try:
+                    reading = parse_reading(payload, self.config)
+                except ValueError as e:
+                    self.rejected += 1
+                    print(f"Rejected reading: {e}")
+                    continue
+                # Waits while the queue is full, which stops reading from the source
+                await self.queue.put(reading)
+
+    async def close(self, feeders):
+        # End the batches once every feeder has returned, a failed feeder is raised after its readings are evaluated;
+        # cancelled while waiting, nothing is put on the queue
+        results = await asyncio.gather(*feeders, return_exceptions=True)
+        await self.queue.put(_END)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def next_batch(self):
+        # Readings available now, up to the batch size, waiting at most max_delay for more
+        loop = asyncio.get_running_loop()
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size and not self.done:
+            if not self.queue.empty():
+                reading = self.queue.get_nowait()
+            elif deadline is None:
+                reading = await self.queue.get()
+            else:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    reading = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if reading is _END:
+                self.done = True
+                break
+            batch.append(reading)
+            if deadline is None:
+                deadline = loop.time() + self.max_delay
+        return batch
+
+    async def run(self, sources):
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        feeders = [asyncio.create_task(self.feed(source)) for source in sources]
+        closer = asyncio.create_task(self.close(feeders))
+        start = time.perf_counter()
+        try:
+            # Readings keep queueing while the previous batch is evaluated
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                while not self.done:
+                    batch = await self.next_batch()
+                    if not batch:
+                        continue
+                    record = await loop.run_in_executor(executor, self.evaluate_batch, batch)
+                    now = time.perf_counter()
+                    self.latencies.extend(now - reading["received"] for reading in batch)
+                    self.readings += len(batch)
+                    self.batches += 1
+                    self.emit(record)
+            await closer
+        finally:
+            # Stop reading the sources when the pipeline stops early, cancelled or on a failed batch
+            for task in feeders + [closer]:
+                task.cancel()
+            await asyncio.gather(*feeders, closer, return_exceptions=True)
+        return self.stats(time.perf_counter() - start)
+
+    def stats(self, elapsed):
+        data = {"readings": self.readings, "rejected": self.rejected, "batches": self.batches,
+                "elapsed_s": elapsed, "readings_per_s": self.readings / elapsed if elapsed > 0 else 0.0}
+        if self.latencies:
+            p50, p95, p99 = np.percentile(np.array(self.latencies) * 1e3, [50, 95, 99])
+            data["latency_ms"] = {"p50": p50, "p95": p95, "p99": p99, "max": max(self.latencies) * 1e3}
+        return data
+
+def damage_accumulator(config, input_data, main_dir, twin_model, rom_name, scoping_twin, settings):
+    # Cumulative damage of the readings of one twin input, for stress based operations only
+    operation = input_data['input_parameters']['operation'][0]
+    if not settings['damage'] or operation not in ("stress", "fatigue"):
+        return None, None
+    load_input = settings.get('input_name', list(config['inputs'])[0])
+    unit_vm, _ = miner.unit_von_mises(twin_model, rom_name, scoping_twin, input_data, load_input)
+    named_selection = input_data['input_parameters']['named_selection']
+    state_dir = os.path.join(main_dir, settings['state_dir'])
+    return miner.DamageAccumulator(unit_vm, config, state_dir, named_selection=named_selection), load_input
+
+def run_ingest(context, twin_model, rom_name, scoping_twin, ingest_config):
+    config, main_dir = context.config, context.main_dir
+    # Ingestion evaluates one [operation, suboperation] pair
+    input_data = utility.operation_input(context.input_data, utility.operation_list(context.input_data)[0])
+    settings = ingest_settings(ingest_config)
+    source = make_source(settings, main_dir)
+    accumulator, load_input = damage_accumulator(config, input_data, main_dir, twin_model, rom_name, scoping_twin, settings)
+    evaluator = BatchEvaluator(config, input_data, twin_model, rom_name, scoping_twin, accumulator=accumulator, load_input=load_input)
+
+    # Summary records are appended as a JSON-lines stream, one line per batch
+    output_file = os.path.join(main_dir, settings['output_file'])
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, "a") as f:
+        def emit(record):
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+        pipeline = IngestPipeline(config, evaluator, emit, batch_size=settings['batch_size'],
+                                  max_delay=settings['max_delay'], queue_size=settings['queue_size'])
+        stats = asyncio.run(pipeline.run([source]))
+    return output_file, stats
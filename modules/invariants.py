@@ -0,0 +1,93 @@
+import numpy as np
+
+# Stress quantities derived from the six tensor components (xx, yy, zz, xy, yz, xz)
+STRESS_INVARIANTS = [
+    "von_mises",
+    "signed_von_mises",
+    "principal_1",
+    "principal_2",
+    "principal_3",
+    "max_shear",
+    "tresca",
+    "hydrostatic",
+]
+
+# Quantities that need the principal stresses (eigenvalues) of the tensor
+_PRINCIPAL_QUANTITIES = {"principal_1", "principal_2", "principal_3", "max_shear", "tresca"}
+
+DEFAULT_CHUNK_SIZE = 65536
+
+def as_components(stress_array, n_components=6):
+    # View a flat (N*6,) or (N, 6) snapshot as (N, 6) without copying contiguous data
+    return np.asarray(stress_array).reshape(-1, n_components)
+
+def _von_mises(xx, yy, zz, xy, yz, xz):
+    return np.sqrt(
+        0.5 * (
+            (xx - yy) ** 2 +
+            (yy - zz) ** 2 +
+            (zz - xx) ** 2 +
+            6 * (xy ** 2 + yz ** 2 + xz ** 2)
+        )
+    )
+
+def _principal_stresses(xx, yy, zz, xy, yz, xz):
+    # Closed-form eigenvalues of a symmetric 3x3 tensor (trigonometric solution)
+    mean = (xx + yy + zz) / 3
+    a, b, c = xx - mean, yy - mean, zz - mean
+    shear_sq = xy ** 2 + yz ** 2 + xz ** 2
+    p = np.sqrt((a ** 2 + b ** 2 + c ** 2 + 2 * shear_sq) / 6)
+
+    # Determinant of the deviatoric tensor, normalized by p^3
+    det = a * b * c + 2 * xy * yz * xz - a * yz ** 2 - b * xz ** 2 - c * xy ** 2
+    p_cubed = p ** 3
+    r = np.divide(det, 2 * p_cubed, out=np.zeros_like(det), where=p_cubed > 0)
+    phi = np.arccos(np.clip(r, -1, 1)) / 3
+
+    s1 = mean + 2 * p * np.cos(phi)
+    s3 = mean + 2 * p * np.cos(phi + 2 * np.pi / 3)
+    s2 = 3 * mean - s1 - s3
+    return s1, s2, s3
+
+def _evaluate_chunk(block, quantities, outputs, start, stop):
+    xx, yy, zz, xy, yz, xz = (block[:, i] for i in range(6))
+    values = {}
+
+    if "hydrostatic" in quantities or "signed_von_mises" in quantities:
+        values["hydrostatic"] = (xx + yy + zz) / 3
+    if "von_mises" in quantities or "signed_von_mises" in quantities:
+        values["von_mises"] = _von_mises(xx, yy, zz, xy, yz, xz)
+    if "signed_von_mises" in quantities:
+        # Sign of the hydrostatic stress distinguishes tension from compression
+        values["signed_von_mises"] = np.where(values["hydrostatic"] < 0, -values["von_mises"], values["von_mises"])
+    if _PRINCIPAL_QUANTITIES & set(quantities):
+        s1, s2, s3 = _principal_stresses(xx, yy, zz, xy, yz, xz)
+        values["principal_1"], values["principal_2"], values["principal_3"] = s1, s2, s3
+        values["tresca"] = s1 - s3
+        values["max_shear"] = values["tresca"] / 2
+
+    for name in quantities:
+        outputs[name][start:stop] = values[name]
+
+def stress_invariants(stress_array, quantities=None, dtype=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Compute the requested stress invariants in one batched pass over the field
+    components = as_components(stress_array)
+    quantities = STRESS_INVARIANTS if quantities is None else list(quantities)
+    for name in quantities:
+        if name not in STRESS_INVARIANTS:
+            raise ValueError(f"Invalid stress invariant: {name}. Available invariants: {STRESS_INVARIANTS}")
+
+    out_dtype = np.dtype(dtype) if dtype is not None else np.result_type(components.dtype, np.float32)
+    n_points = components.shape[0]
+    outputs = {name: np.empty(n_points, dtype=out_dtype) for name in quantities}
+
+    # Process in chunks so the temporaries of each pass stay cache-sized
+    chunk_size = chunk_size or n_points
+    for start in range(0, n_points, chunk_size):
+        stop = min(start + chunk_size, n_points)
+        block = components[start:stop]
+        if block.dtype != out_dtype:
+            block = block.astype(out_dtype)
+        _evaluate_chunk(block, quantities, outputs, start, stop)
+
+    return outputs
@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+
+MANIFEST_FILE = "twin_manifest.json"
+
+def file_sha256(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path):
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as file:
+            return json.load(file)
+    return {}
+
+def save_manifest(manifest_path, manifest):
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=4)
+
+def point_count(twin_model, rom_name):
+    # Number of TBROM points from the TBROM metadata read by pytwin, which only exposes it privately; None when unknown
+    tbrom = (getattr(twin_model, "_tbroms", None) or {}).get(rom_name)
+    return getattr(tbrom, "nb_points", None)
+
+def describe_twin(twin_model):
+    # Everything the pipeline needs to know about a twin without loading it again
+    return {
+        "tbroms": {
+            rom_name: {
+                "named_selections": list(twin_model.get_named_selections(rom_name)),
+                "n_points": point_count(twin_model, rom_name),
+            }
+            for rom_name in twin_model.tbrom_names
+        },
+        "inputs": list(twin_model.inputs),
+        "outputs": list(twin_model.outputs),
+        "parameters": list(twin_model.parameters),
+    }
+
+def twin_entry(manifest, twin_path, load_twin):
+    # Return the manifest entry of a twin file, rebuilding it only when the file content changed
+    stat = os.stat(twin_path)
+    entry = manifest.get(twin_path)
+    if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+        return entry, False
+
+    sha256 = file_sha256(twin_path)
+    if entry and entry["sha256"] == sha256:
+        # Touched but unchanged, only refresh the modification time
+        entry.update(mtime=stat.st_mtime, size=stat.st_size)
+        return entry, True
+
+    entry = {"sha256": sha256, "mtime": stat.st_mtime, "size": stat.st_size}
+    entry.update(describe_twin(load_twin(twin_path)))
+    manifest[twin_path] = entry
+    return entry, True
+
+def find_tbrom(twin_files, tbrom_name, manifest_path, load_twin):
+    # Find the twin file holding a TBROM, loading only twins missing from the manifest
+    manifest = load_manifest(manifest_path)
+    twin_file = None
+    changed = False
+    for twin_path in twin_files:
+        entry, updated = twin_entry(manifest, os.path.abspath(twin_path), load_twin)
+        changed = changed or updated
+        if tbrom_name in entry["tbroms"]:
+            twin_file = twin_path
+            break
+    if changed:
+        save_manifest(manifest_path, manifest)
+    return twin_file
@@ -0,0 +1,254 @@
+from . import utility, precision, reduced_basis
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+
+def memo_settings(config):
+    # Memo section of the config, memoization is off when it is missing
+    settings = dict(config.get('memo') or {})
+    settings.setdefault('enabled', False)
+    settings.setdefault('tolerance', 0)
+    settings.setdefault('max_entries', 32)
+    settings.setdefault('persist', False)
+    settings.setdefault('linear_scaling', False)
+    return settings
+
+def input_tolerance(tolerance, name):
+    # Quantization step of one rom input, a single number or a mapping per input
+    if isinstance(tolerance, dict):
+        return tolerance.get(name, tolerance.get('default', 0))
+    return tolerance
+
+def quantize_inputs(rom_inputs, tolerance):
+    # Inputs rounded to their tolerance bucket, inputs closer than the sensor noise share a key
+    quantized = []
+    for name, value in sorted((rom_inputs or {}).items()):
+        step = input_tolerance(tolerance, name)
+        quantized.append((name, int(np.floor(value / step + 0.5)) if step else float(value)))
+    return tuple(quantized)
+
+def scale_ratio(rom_inputs, cached_inputs):
+    # Common ratio between two collinear input vectors, None when they are not collinear
+    if set(rom_inputs) != set(cached_inputs):
+        return None
+    ratio = None
+    for name, cached_value in cached_inputs.items():
+        value = rom_inputs[name]
+        if cached_value == 0:
+            if value != 0:
+                return None
+            continue
+        if ratio is None:
+            ratio = value / cached_value
+        elif not np.isclose(value / cached_value, ratio, rtol=1e-9, atol=0):
+            return None
+    return ratio
+
+def model_stamp(twin_model, config):
+    # What a snapshot depends on besides the inputs: the twin file (a retrained twin has another size or mtime),
+    # the precision and the reduced-basis settings; pytwin only keeps the twin path privately
+    twin_file = getattr(twin_model, "_model_filepath", None)
+    twin_stamp = None
+    if twin_file and os.path.isfile(twin_file):
+        stat = os.stat(twin_file)
+        twin_stamp = [os.path.abspath(twin_file), stat.st_size, stat.st_mtime]
+    return json.dumps({
+        'twin': twin_stamp,
+        'dtype': str(precision.float_dtype(config)),
+        'reduced_basis': reduced_basis.reduced_basis_settings(config),
+    }, sort_keys=True)
+
+def snapshot_key(rom_name, named_selection, twin_inputs, tolerance, model=""):
+    # Key of one snapshot: TBROM, scoping, quantized rom inputs, the exact parameters and field inputs and the model stamp
+    fixed = json.dumps({key: twin_inputs.get(key) for key in ('rom_parameters', 'field_inputs')}, sort_keys=True)
+    return (rom_name, named_selection, quantize_inputs(twin_inputs.get('rom_inputs'), tolerance), fixed, model)
+
+def file_paths(files):
+    # Paths listed in an input files section, one path or a mapping of paths per entry
+    for value in (files or {}).values():
+        if isinstance(value, dict):
+            yield from file_paths(value)
+        elif isinstance(value, str):
+            yield value
+
+def file_stamps(paths, main_dir):
+    # Size and modification time of every input file, a replaced twin, RST or S-N curve changes the key
+    stamps = {}
+    for path in sorted(set(paths)):
+        file_path = os.path.join(main_dir, path)
+        if os.path.isfile(file_path):
+            stat = os.stat(file_path)
+            stamps[path] = (stat.st_size, stat.st_mtime)
+    return stamps
+
+def run_key(input_data, config, main_dir=""):
+    # Key of a whole run: quantized inputs, operations, scoping, every output setting, the config and the input files
+    tolerance = memo_settings(config)['tolerance']
+    twin_inputs = input_data.get('twin_inputs', {})
+    paths = list(file_paths(input_data['input_files'])) + list(file_paths(config.get('additional_files')))
+    key = {
+        'rom_inputs': quantize_inputs(twin_inputs.get('rom_inputs'), tolerance),
+        'rom_parameters': twin_inputs.get('rom_parameters'),
+        'field_inputs': twin_inputs.get('field_inputs'),
+        'input_parameters': input_data['input_parameters'],
+        'input_files': input_data['input_files'],
+        'output_files': input_data['output_files'],
+        'config': hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest(),
+        'files': file_stamps(paths, main_dir),
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+class SnapshotMemo:
+    # LRU of twin snapshots keyed on quantized inputs, optionally persisted under the cache directory
+    def __init__(self, tolerance=0, max_entries=32, cache_dir=None, linear_scaling=False):
+        self.tolerance = tolerance
+        self.max_entries = max_entries
+        self.cache_dir = os.path.join(cache_dir, "memo") if cache_dir else None
+        self.linear_scaling = linear_scaling
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.scaled = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config, cache_dir=None):
+        settings = memo_settings(config)
+        return cls(
+            tolerance=settings['tolerance'],
+            max_entries=settings['max_entries'],
+            cache_dir=cache_dir if settings['persist'] else None,
+            linear_scaling=settings['linear_scaling'],
+        )
+
+    def _file(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.npz")
+
+    def _insert(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _load(self, key):
+        # Snapshot persisted by an earlier run
+        if not self.cache_dir or not os.path.exists(self._file(key)):
+            return None
+        with np.load(self._file(key)) as data:
+            entry = {
+                'outfield': data['outfield'],
+                'points': data['points'],
+                'rom_inputs': json.loads(str(data['rom_inputs'])),
+                'twin_outputs': json.loads(str(data['twin_outputs'])),
+            }
+        self._insert(key, entry)
+        return entry
+
+    def _save(self, key, entry):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.savez(
+            self._file(key),
+            outfield=entry['outfield'],
+            points=entry['points'],
+            rom_inputs=json.dumps(entry['rom_inputs']),
+            twin_outputs=json.dumps(entry['twin_outputs']),
+        )
+        # Bound the disk store like the memory one, dropping the least recently written snapshots
+        files = sorted((os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".npz")), key=os.path.getmtime)
+        for path in files[:max(len(files) - self.max_entries, 0)]:
+            os.remove(path)
+
+    def _scaled(self, entry, rom_inputs):
+        # A linear TBROM scales with its load: derive the snapshot and outputs from a cached one
+        ratio = scale_ratio(rom_inputs or {}, entry['rom_inputs'])
+        if ratio is None:
+            return None
+        if ratio == 1:
+            return entry['outfield'], entry['points'], dict(entry['twin_outputs'])
+        twin_outputs = {name: value * ratio for name, value in entry['twin_outputs'].items()}
+        return entry['outfield'] * ratio, entry['points'], twin_outputs
+
+    def lookup(self, rom_name, named_selection, twin_inputs, model=""):
+        # Cached (outfield, points, twin_outputs) for these inputs, None on a miss; model: model_stamp of the twin
+        rom_inputs = twin_inputs.get('rom_inputs') or {}
+        key = snapshot_key(rom_name, named_selection, twin_inputs, self.tolerance, model)
+        with self.lock:
+            entry = self.entries.get(key) or self._load(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                # Within the tolerance bucket a linear TBROM is rescaled to the exact inputs
+                scaled = self._scaled(entry, rom_inputs) if self.linear_scaling else None
+                return scaled or (entry['outfield'], entry['points'], dict(entry['twin_outputs']))
+
+            if self.linear_scaling:
+                for cached_key, entry in reversed(self.entries.items()):
+                    # Only the rom inputs may differ
+                    if cached_key[:2] != key[:2] or cached_key[3:] != key[3:]:
+                        continue
+                    scaled = self._scaled(entry, rom_inputs)
+                    if scaled is not None:
+                        self.scaled += 1
+                        return scaled
+
+            self.misses += 1
+            return None
+
+    def store(self, rom_name, named_selection, twin_inputs, outfield, points, twin_outputs, model=""):
+        key = snapshot_key(rom_name, named_selection, twin_inputs, self.tolerance, model)
+        entry = {
+            'outfield': np.asarray(outfield),
+            'points': np.asarray(points),
+            'rom_inputs': dict(twin_inputs.get('rom_inputs') or {}),
+            'twin_outputs': dict(twin_outputs or {}),
+        }
+        with self.lock:
+            self._insert(key, entry)
+            if self.cache_dir:
+                self._save(key, entry)
+
+    def get_result(self, twin_model, rom_name, twin_inputs, named_selection, scoping_twin=None, config=None):
+        # Memoized utility.get_result, the twin is only asked for a snapshot on a miss
+        model = model_stamp(twin_model, config)
+        cached = self.lookup(rom_name, named_selection, twin_inputs, model)
+        if cached is not None:
+            outfield, points, _ = cached
+            return outfield, points
+        outfield, points = utility.get_result(twin_model, rom_name, scoping_twin=scoping_twin, config=config)
+        self.store(rom_name, named_selection, twin_inputs, outfield, points, twin_model.outputs, model)
+        return outfield, points
+
+    def stats(self):
+        lookups = self.hits + self.scaled + self.misses
+        return {
+            "hits": self.hits,
+            "scaled": self.scaled,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.scaled) / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+        }
+
+def run_record_file(cache_dir):
+    return os.path.join(cache_dir, "memo", "last_run.json")
+
+def recall_run(cache_dir, key):
+    # Exports of the previous run when it had the same key and its files are still in place
+    record_file = run_record_file(cache_dir)
+    if not os.path.exists(record_file):
+        return None
+    with open(record_file, 'r') as f:
+        record = json.load(f)
+    if record.get('key') != key or not all(os.path.exists(path) for path in record['exports']):
+        return None
+    return record['exports']
+
+def record_run(cache_dir, key, exports):
+    # Remember which exports the last run wrote, they are overwritten by the next different run
+    record_file = run_record_file(cache_dir)
+    os.makedirs(os.path.dirname(record_file), exist_ok=True)
+    with open(record_file, 'w') as f:
+        json.dump({'key': key, 'exports': [os.path.abspath(path) for path in exports]}, f, indent=4)
@@ -0,0 +1,155 @@
+from . import utility, manifest, precision
+import os
+import json
+import shutil
+import numpy as np
+
+# Bundles opened during this run, keyed by bundle directory
+_meshes = {}
+
+BUNDLE_ARRAYS = ("points", "offsets", "connectivity", "celltypes")
+
+def rst_key(rst_file, cache_dir):
+    # Content hash of the RST, recomputed only when its size or modification time changes
+    rst_path = os.path.abspath(rst_file)
+    index_file = os.path.join(cache_dir, "mesh", "index.json")
+    index = manifest.load_manifest(index_file)
+    stat = os.stat(rst_path)
+    entry = index.get(rst_path)
+    if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+        return entry["sha256"]
+    index[rst_path] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": manifest.file_sha256(rst_path)}
+    manifest.save_manifest(index_file, index)
+    return index[rst_path]["sha256"]
+
+def named_selection_nodes(mesh, connectivity, offsets):
+    # Grid node indices of every FEA named selection, elemental selections expanded to their nodes
+    if not mesh.available_named_selections:
+        return {}
+    node_ids = np.asarray(mesh.nodes.scoping.ids)
+    element_ids = np.asarray(mesh.elements.scoping.ids)
+    nodes = {}
+    for name in mesh.available_named_selections:
+        scoping = mesh.named_selection(name)
+        ids = np.asarray(scoping.ids)
+        if scoping.location == "Elemental":
+            elements = index_of(element_ids, ids)
+            counts = offsets[elements + 1] - offsets[elements]
+            positions = np.repeat(offsets[elements] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+            nodes[name] = np.unique(connectivity[positions]).astype(np.int64)
+        else:
+            nodes[name] = index_of(node_ids, ids)
+    return nodes
+
+def index_of(all_ids, ids):
+    # Positions of ids in all_ids, the grid follows the DPF index order
+    all_ids, ids = np.asarray(all_ids), np.asarray(ids)
+    sorter = np.argsort(all_ids)
+    found = np.searchsorted(all_ids, ids, sorter=sorter)
+    # Ids past the largest one have no position, they are reported with the ids that are not at their position
+    missing = found == len(all_ids)
+    positions = sorter[found[~missing]]
+    missing[~missing] = all_ids[positions] != ids[~missing]
+    if missing.any():
+        raise ValueError(f"{missing.sum()} ids are missing from the mesh, e.g. {ids[missing][:10].tolist()}")
+    return np.sort(positions).astype(np.int64)
+
+def cell_offsets(grid):
+    # Cell offsets of the grid, named `offset` before PyVista 0.45
+    return grid.cell_offsets if hasattr(grid, "cell_offsets") else grid.offset
+
+def cell_connectivity(grid):
+    # Point ids of the grid cells, read from the VTK cell array before PyVista 0.33
+    if hasattr(grid, "cell_connectivity"):
+        return grid.cell_connectivity
+    from vtkmodules.util.numpy_support import vtk_to_numpy
+    return vtk_to_numpy(grid.GetCells().GetConnectivityArray())
+
+def write_bundle(bundle_dir, grid, unit, named_selections, float_dtype=np.float64, index_dtype=np.int64):
+    # Store the grid (points already in meters), its cells, the named selection node sets and the unit as .npy files
+    staging_dir = f"{bundle_dir}.tmp"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    arrays = {
+        "points": np.asarray(grid.points, dtype=float_dtype),
+        "offsets": np.asarray(cell_offsets(grid), dtype=index_dtype),
+        "connectivity": np.asarray(cell_connectivity(grid), dtype=index_dtype),
+        "celltypes": np.asarray(grid.celltypes, dtype=np.uint8),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(staging_dir, f"{name}.npy"), array)
+    names = list(named_selections)
+    for index, name in enumerate(names):
+        np.save(os.path.join(staging_dir, f"named_selection_{index}.npy"), np.asarray(named_selections[name], dtype=np.int64))
+    with open(os.path.join(staging_dir, "meta.json"), "w") as f:
+        json.dump({"unit": unit, "named_selections": names}, f, indent=4)
+    # Readers only ever see a complete bundle
+    shutil.rmtree(bundle_dir, ignore_errors=True)
+    os.replace(staging_dir, bundle_dir)
+    return bundle_dir
+
+def zero_copy_grid(points, offsets, connectivity, celltypes):
+    # PyVista grid wrapping the (memory-mapped) arrays without copying them
+    import pyvista as pv
+    from vtkmodules.vtkCommonDataModel import vtkCellArray
+    from vtkmodules.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray
+    from vtkmodules.util.vtkConstants import VTK_UNSIGNED_CHAR
+    cells = vtkCellArray()
+    if offsets.dtype == np.int32:
+        # 32-bit cell storage, VTK reads it as is
+        cells.SetData(numpy_to_vtk(offsets, deep=False), numpy_to_vtk(connectivity, deep=False))
+    else:
+        cells.SetData(numpy_to_vtkIdTypeArray(offsets, deep=False), numpy_to_vtkIdTypeArray(connectivity, deep=False))
+    grid = pv.UnstructuredGrid()
+    grid.SetCells(numpy_to_vtk(celltypes, deep=False, array_type=VTK_UNSIGNED_CHAR), cells)
+    grid.points = points
+    return grid
+
+class CachedMesh:
+    # Stand-in for the DPF meshed region, backed by a memory-mapped bundle
+    def __init__(self, bundle_dir, node_indices=None):
+        self.bundle_dir = bundle_dir
+        with open(os.path.join(bundle_dir, "meta.json"), "r") as f:
+            meta = json.load(f)
+        self.unit = meta["unit"]
+        self.available_named_selections = meta["named_selections"]
+        # Copy-on-write maps: pages are read on demand and the bundle is never modified
+        self.arrays = {name: np.load(os.path.join(bundle_dir, f"{name}.npy"), mmap_mode="c") for name in BUNDLE_ARRAYS}
+        self.node_indices = node_indices
+        self._grid = None
+
+    def named_selection(self, name):
+        # Grid node indices of one FEA named selection
+        index = self.available_named_selections.index(name)
+        return np.load(os.path.join(self.bundle_dir, f"named_selection_{index}.npy"), mmap_mode="c")
+
+    def scoped(self, name):
+        # Mesh restricted to one named selection, its grid is only extracted when requested
+        return CachedMesh(self.bundle_dir, node_indices=self.named_selection(name))
+
+    @property
+    def grid(self):
+        if self._grid is None:
+            grid = zero_copy_grid(*(self.arrays[name] for name in BUNDLE_ARRAYS))
+            self._grid = grid if self.node_indices is None else grid.extract_points(self.node_indices, adjacent_cells=False)
+        return self._grid
+
+def load_mesh(rst_file, cache_dir, config=None):
+    # (mesh, grid in meters, unit) of the RST, parsed through DPF only when its bundle does not exist yet
+    key = rst_key(rst_file, cache_dir)
+    float_dtype, index_dtype = precision.float_dtype(config), precision.index_dtype(config)
+    # Bundles of the float32 policy hold float32 points and int32 cells, next to the full precision one
+    if float_dtype != np.float64:
+        key = f"{key}_{float_dtype.name}"
+    bundle_dir = os.path.join(cache_dir, "mesh", key)
+    if bundle_dir not in _meshes:
+        if not os.path.exists(os.path.join(bundle_dir, "meta.json")):
+            mesh, grid, unit = utility.extract_mesh(rst_file)
+            grid.points = utility.convert_to_meters(grid.points, unit)
+            named_selections = named_selection_nodes(mesh, np.asarray(cell_connectivity(grid)), np.asarray(cell_offsets(grid)))
+            if np.iinfo(index_dtype).max <= max(grid.n_points, len(cell_connectivity(grid))):
+                index_dtype = np.int64
+            write_bundle(bundle_dir, grid, unit, named_selections, float_dtype=float_dtype, index_dtype=index_dtype)
+        _meshes[bundle_dir] = CachedMesh(bundle_dir)
+    mesh = _meshes[bundle_dir]
+    return mesh, mesh.grid, mesh.unit
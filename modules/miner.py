@@ -0,0 +1,247 @@
+from . import utility, invariants, fatigue_curve
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from .field import ResultField
+
+class RainflowCounter:
+    # Streaming four-point rainflow counter, cycles are emitted as soon as they close
+    def __init__(self, stack=None, candidate=None, direction=0):
+        self.stack = list(stack or [])
+        self.candidate = candidate
+        self.direction = direction
+
+    def _reversals(self, readings):
+        # Turning points of the load history, the last extreme is kept until the direction changes
+        for value in readings:
+            value = float(value)
+            if self.candidate is None:
+                self.candidate = value
+                continue
+            step = np.sign(value - self.candidate)
+            if step == 0:
+                continue
+            if self.direction == 0 or step == self.direction:
+                if self.direction == 0:
+                    yield self.candidate
+                self.candidate = value
+            else:
+                yield self.candidate
+                self.candidate = value
+            self.direction = step
+
+    def feed(self, readings):
+        # Return the full cycles (range, mean) closed by the new readings
+        cycles = []
+        for reversal in self._reversals(readings):
+            self.stack.append(reversal)
+            while len(self.stack) >= 4:
+                a, b, c, d = self.stack[-4:]
+                inner = abs(b - c)
+                if inner <= abs(a - b) and inner <= abs(c - d):
+                    cycles.append((inner, (b + c) / 2))
+                    del self.stack[-3:-1]
+                else:
+                    break
+        return cycles
+
+    def residual_half_cycles(self):
+        # Half cycles of the residue, counted when the history is closed
+        residue = self.stack + ([self.candidate] if self.candidate is not None else [])
+        return [(abs(b - a), (a + b) / 2) for a, b in zip(residue[:-1], residue[1:])]
+
+    def state(self):
+        return {"stack": self.stack, "candidate": self.candidate, "direction": float(self.direction)}
+
+def file_digest(path, block_size=1 << 20):
+    # sha256 of a load history file, read block by block
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_load_chunks(input_file, input_name, chunk_size=10000, skip=0):
+    # Load readings of one twin input from a file, chunk by chunk, after the first skip readings
+    extension = os.path.splitext(input_file)[1].lower()
+    if extension == ".csv":
+        for chunk in pd.read_csv(input_file, usecols=[input_name], chunksize=chunk_size):
+            readings = chunk[input_name].to_numpy(dtype=float)
+            if skip >= len(readings):
+                skip -= len(readings)
+                continue
+            yield readings[skip:]
+            skip = 0
+    elif extension == ".npy":
+        readings = np.load(input_file, mmap_mode='r')
+        for start in range(skip, len(readings), chunk_size):
+            yield np.asarray(readings[start:start + chunk_size], dtype=float)
+    else:
+        raise ValueError(f"Invalid load history file: {input_file}. Please provide a '.csv' or '.npy' file.")
+
+class DamageAccumulator:
+    # Per-node cumulative Miner damage, kept in a memory-mapped array so it survives restarts
+    def __init__(self, unit_von_mises, config, state_dir, named_selection=None, range_resolution=1.0, stress_measure="range"):
+        self.unit_von_mises = np.asarray(unit_von_mises, dtype=float)
+        self.curve = fatigue_curve.load_sn_curve(fatigue_curve.sn_curve_file(config, named_selection))
+        self.range_resolution = range_resolution
+        # "range": a 0 -> F -> 0 cycle reads the S-N curve at the static von Mises of F, as the fatigue operation does;
+        # "amplitude" for S-N curves given in stress amplitude
+        if stress_measure not in ("range", "amplitude"):
+            raise ValueError(f"Invalid stress_measure: {stress_measure}. Please use 'range' or 'amplitude'.")
+        self.stress_factor = 0.5 if stress_measure == "amplitude" else 1.0
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+
+        damage_path = os.path.join(state_dir, "damage.npy")
+        state_path = os.path.join(state_dir, "state.json")
+        n_nodes = len(self.unit_von_mises)
+        self.digest = self.state_digest()
+        state = None
+        if os.path.exists(damage_path) and os.path.exists(state_path):
+            with open(state_path, 'r') as file:
+                state = json.load(file)
+            if state.get("digest") != self.digest:
+                print(f"Damage state in {state_dir} was accumulated with another stress field, S-N curve or counting options, starting over.")
+                state = None
+        if state is not None:
+            self.damage = np.load(damage_path, mmap_mode='r+')
+            if self.damage.shape != (n_nodes,):
+                raise ValueError(f"Damage state in {state_dir} has {self.damage.shape[0]} nodes, expected {n_nodes}.")
+        else:
+            self.damage = np.lib.format.open_memmap(damage_path, mode='w+', dtype=np.float64, shape=(n_nodes,))
+            state = {"counter": {}, "readings": 0, "cycles": 0.0}
+        self.counter = RainflowCounter(**state["counter"])
+        self.readings = state["readings"]
+        self.cycles = state["cycles"]
+        # Load history files fully consumed, and the one being consumed, by content hash
+        self.histories = state.get("histories", [])
+        self.current = state.get("current")
+
+    def state_digest(self):
+        # Everything the stored damage depends on besides the readings
+        digest = hashlib.sha1()
+        digest.update(np.ascontiguousarray(self.unit_von_mises).tobytes())
+        digest.update(np.ascontiguousarray(self.curve["log_stress"]).tobytes())
+        digest.update(np.ascontiguousarray(self.curve["log_cycles"]).tobytes())
+        digest.update(json.dumps([self.curve["max_cycle"], self.range_resolution, self.stress_factor]).encode())
+        return digest.hexdigest()
+
+    def _apply(self, cycles, count):
+        # Damage of a cycle batch, O(n_nodes) per distinct load range
+        if not cycles:
+            return np.zeros_like(self.unit_von_mises)
+        ranges = np.round(np.array([load_range for load_range, _ in cycles]) / self.range_resolution) * self.range_resolution
+        # Cycles with a zero range (after rounding) do no damage and are not counted
+        unique_ranges, counts = np.unique(ranges[ranges > 0], return_counts=True)
+        increment = np.zeros_like(self.unit_von_mises)
+        for load_range, n_cycles in zip(unique_ranges, counts):
+            stress = self.unit_von_mises * (load_range * self.stress_factor)
+            increment += n_cycles * count / fatigue_curve.evaluate_cycles(stress, self.curve)
+        self.damage += increment
+        self.cycles += count * int(counts.sum())
+        return increment
+
+    def begin(self, path, sha256):
+        # Readings of the file already consumed, None when the whole file was
+        if any(history["sha256"] == sha256 for history in self.histories):
+            return None
+        if self.current and self.current["sha256"] == sha256:
+            return self.current["readings"]
+        if self.current:
+            print(f"Load history {self.current['path']} was interrupted after {self.current['readings']} readings, its remaining readings are not counted.")
+        self.current = {"path": path, "sha256": sha256, "readings": 0}
+        self.save()
+        return 0
+
+    def finish(self):
+        if self.current:
+            self.histories.append(self.current)
+            self.current = None
+        self.save()
+
+    def consume(self, readings):
+        # Rainflow-count new readings and accumulate the damage of the cycles they close
+        readings = np.asarray(readings, dtype=float)
+        increment = self._apply(self.counter.feed(readings), 1.0)
+        self.readings += len(readings)
+        if self.current:
+            self.current["readings"] += len(readings)
+        self.save()
+        return increment
+
+    def close(self):
+        # Count the residue as half cycles at the end of the history
+        increment = self._apply(self.counter.residual_half_cycles(), 0.5)
+        self.counter = RainflowCounter()
+        self.save()
+        return increment
+
+    def save(self):
+        self.damage.flush()
+        state = {
+            "digest": self.digest, "counter": self.counter.state(), "readings": self.readings, "cycles": self.cycles,
+            "histories": self.histories, "current": self.current,
+        }
+        with open(os.path.join(self.state_dir, "state.json"), 'w') as file:
+            json.dump(state, file, indent=4)
+
+    def remaining_life(self):
+        # Remaining repeats of the load history consumed so far before failure (D = 1)
+        with np.errstate(divide='ignore'):
+            return np.where(self.damage > 0, (1 - self.damage) / self.damage, np.inf)
+
+def unit_von_mises(twin_model, rom_name, scoping_twin, input_data, load_input):
+    # Von Mises stress per unit load, the TBROM being linear in the load
+    reference_load = input_data['twin_inputs']['rom_inputs'][load_input]
+    outfields, points = utility.get_result(twin_model, rom_name, scoping_twin=scoping_twin)
+    unit_stress = invariants.as_components(outfields) / reference_load
+    return invariants.stress_invariants(unit_stress, ["von_mises"])["von_mises"], utility.unflatten_vector(points, 3)
+
+def run_load_history(context, twin_model, rom_name, scoping_twin, history_config):
+    config, input_data, main_dir = context.config, context.input_data, context.main_dir
+    load_input = history_config.get("input_name", list(config['inputs'])[0])
+    named_selection = input_data['input_parameters']['named_selection']
+    unit_vm, loc_xyz = unit_von_mises(twin_model, rom_name, scoping_twin, input_data, load_input)
+
+    state_dir = os.path.join(main_dir, history_config.get("state_dir", "data/output/damage_state"))
+    accumulator = DamageAccumulator(
+        unit_vm, config, state_dir,
+        named_selection=named_selection,
+        range_resolution=history_config.get("range_resolution", 1.0),
+        stress_measure=history_config.get("stress_measure", "range"),
+    )
+
+    # A history already ingested is not counted twice, an interrupted one resumes where it stopped
+    input_file = os.path.join(main_dir, history_config["input_file"])
+    consumed = accumulator.begin(history_config["input_file"], file_digest(input_file))
+    if consumed is None:
+        print(f"Load history {history_config['input_file']} was already ingested in {state_dir}, the stored damage is reported.")
+    else:
+        for chunk in read_load_chunks(input_file, load_input, history_config.get("chunk_size", 10000), skip=consumed):
+            utility.validate_rom_inputs({load_input: chunk.min()}, config)
+            utility.validate_rom_inputs({load_input: chunk.max()}, config)
+            accumulator.consume(chunk)
+        # The residue stays open by default, so the next history continues its cycles
+        if history_config.get("close_history", False):
+            accumulator.close()
+        accumulator.finish()
+
+    # Max damage location and remaining life through the usual script path
+    result_detail = "fatigue_cumulative_damage"
+    result_data = ResultField(loc_xyz, np.asarray(accumulator.damage), result_detail)
+    script_results = utility.run_script(input_data, config, result_data)
+    remaining_life = accumulator.remaining_life()
+    summary = {
+        "readings": accumulator.readings,
+        "cycles": accumulator.cycles,
+        "output_parameters": script_results,
+        "remaining_life": {
+            "points": loc_xyz[int(np.argmin(remaining_life))].tolist(),
+            "result": float(np.min(remaining_life)),
+            "unit": "load history repeats",
+        },
+    }
+    return result_data, summary
@@ -0,0 +1,32 @@
+import numpy as np
+
+# Floating point type of fields and coordinates, and index type of the cell connectivity, per precision policy
+PRECISIONS = {
+    "float64": (np.float64, np.int64),
+    "float32": (np.float32, np.int32),
+}
+
+def precision_settings(config):
+    # Precision section of the config, float64 keeps the twin outputs as they are
+    settings = dict((config or {}).get('precision') or {})
+    settings.setdefault('dtype', 'float64')
+    if settings['dtype'] not in PRECISIONS:
+        raise ValueError(f"Invalid precision: {settings['dtype']}. Available precisions: {list(PRECISIONS)}")
+    return settings
+
+def float_dtype(config):
+    return np.dtype(PRECISIONS[precision_settings(config)['dtype']][0])
+
+def index_dtype(config):
+    return np.dtype(PRECISIONS[precision_settings(config)['dtype']][1])
+
+def as_float(array, config):
+    # Array in the floating point type of the policy, not copied when it already is
+    return np.asarray(array, dtype=float_dtype(config))
+
+def compact_cells(grid, config):
+    # 32-bit cell storage of a VTK grid under the float32 policy, as long as the node ids and offsets fit
+    cells = grid.GetCells()
+    if index_dtype(config) == np.int32 and max(grid.n_points, cells.GetNumberOfConnectivityIds()) < np.iinfo(np.int32).max:
+        cells.ConvertTo32BitStorage()
+    return grid
@@ -0,0 +1,183 @@
+from . import utility, reduced_basis, fatigue_curve
+import io
+import os
+import pickle
+import hashlib
+import importlib
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Point indexes built during this run, keyed by TBROM, twin named selection and point content
+_indexes = {}
+
+PROBE_METHODS = ("nearest", "idw")
+
+def probe_settings(config):
+    # Probe section of the config: nearest ROM point, or inverse-distance weighting of the closest neighbours
+    settings = dict((config or {}).get('probe') or {})
+    settings.setdefault('method', 'nearest')
+    settings.setdefault('neighbours', 8)
+    settings.setdefault('power', 2)
+    # Queries farther than this from every ROM point (in meters) get NaN, e.g. a sensor off the part
+    settings.setdefault('max_distance', None)
+    return settings
+
+def points_key(points):
+    digest = hashlib.sha1()
+    points = np.ascontiguousarray(points, dtype=float)
+    digest.update(str(points.shape).encode())
+    digest.update(points.tobytes())
+    return digest.hexdigest()
+
+# Globals a pickled KD-tree may reference, per scipy and numpy version
+TREE_GLOBALS = {
+    ("scipy.spatial._ckdtree", "cKDTree"), ("scipy.spatial.ckdtree", "cKDTree"),
+    ("numpy._core.numeric", "_frombuffer"), ("numpy.core.numeric", "_frombuffer"),
+    ("numpy._core.multiarray", "_reconstruct"), ("numpy.core.multiarray", "_reconstruct"),
+    ("numpy", "dtype"), ("numpy", "ndarray"),
+}
+
+class TreeUnpickler(pickle.Unpickler):
+    # The cache directory is trusted like the twin files, still a cached tree can only build a cKDTree and arrays
+    def find_class(self, module, name):
+        if (module, name) not in TREE_GLOBALS:
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a cached point tree")
+        return super().find_class(module, name)
+
+def load_tree(cache_file, points):
+    # Cached KD-tree of these exact points, None when it is missing, unreadable or built on other points
+    try:
+        with open(cache_file, "rb") as f:
+            tree = TreeUnpickler(io.BytesIO(f.read())).load()
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError, TypeError) as e:
+        print(f"Ignoring cached point tree {cache_file}: {e}")
+        return None
+    if not isinstance(tree, cKDTree) or not np.array_equal(tree.data, points):
+        return None
+    return tree
+
+def point_tree(points, cache_dir=None, key=None):
+    # KD-tree of a point cloud, pickled under cache_dir/probe by point content
+    points = np.asarray(points, dtype=float)
+    cache_file = os.path.join(cache_dir, "probe", f"{key or points_key(points)}.pkl") if cache_dir else None
+    if cache_file and os.path.exists(cache_file):
+        tree = load_tree(cache_file, points)
+        if tree is not None:
+            return tree
+    tree = cKDTree(points)
+    if cache_file:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(cache_file, "wb") as f:
+            pickle.dump(tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return tree
+
+def index_entry(twin_model, rom_name, scoping_twin, cache_dir=None):
+    # KD-tree over the ROM points of one TBROM and named selection, another twin with the same names gets its own tree;
+    # the named selection masks over those points are added on first use
+    points = utility.unflatten_vector(np.asarray(twin_model.generate_points(rom_name, on_disk=False, named_selection=scoping_twin)), 3)
+    digest = points_key(points)
+    key = (rom_name, scoping_twin, digest)
+    if key not in _indexes:
+        _indexes[key] = {"tree": point_tree(points, cache_dir=cache_dir, key=digest), "masks": None}
+    return _indexes[key]
+
+def probe_index(twin_model, rom_name, scoping_twin, cache_dir=None):
+    return index_entry(twin_model, rom_name, scoping_twin, cache_dir=cache_dir)["tree"]
+
+def probe_operations(config, tbrom_name, operations=None):
+    # [operation, suboperation] pairs answered by one TBROM, an operation name stands for all its suboperations
+    if operations is None:
+        operations = [name for name, operation in config['available_operations'].items() if operation['tbrom'] == tbrom_name]
+    pairs = []
+    for operation in operations:
+        if isinstance(operation, str):
+            if operation not in config['available_operations']:
+                raise ValueError(f"Error: Operation '{operation}' is not valid. Available operations: {list(config['available_operations'])}")
+            pairs.extend([operation, suboperation] for suboperation in config['available_operations'][operation]['suboperations'])
+        else:
+            pairs.append(list(operation))
+    for operation, _ in pairs:
+        if config['available_operations'][operation]['tbrom'] != tbrom_name:
+            raise ValueError(f"Error: Operation '{operation}' is not computed from TBROM {tbrom_name}.")
+    return pairs
+
+def neighbours(tree, coordinates, method="nearest", k=8):
+    # (queries, k) distances and ROM point indices of the closest ROM points
+    if method not in PROBE_METHODS:
+        raise ValueError(f"Invalid probe method: {method}. Available methods: {list(PROBE_METHODS)}")
+    k = 1 if method == "nearest" else min(k, tree.n)
+    distances, indices = tree.query(coordinates, k=k, workers=-1)
+    return distances.reshape(len(coordinates), k), indices.reshape(len(coordinates), k)
+
+def idw_weights(distances, power=2):
+    # Normalized inverse-distance weights, a query on a ROM point takes its value
+    exact = distances[:, 0] == 0
+    weights = np.where(exact[:, None], 1.0, distances) ** -float(power)
+    weights[exact] = 0.0
+    weights[exact, 0] = 1.0
+    return weights / weights.sum(axis=1, keepdims=True)
+
+def snapshot_rows(config, twin_model, rom_name, scoping_twin, rows, n_points):
+    # Snapshot rows of the ROM points around the probes, only those rows are rebuilt when the reduced basis is usable
+    settings = reduced_basis.reduced_basis_settings(config)
+    if settings['enabled']:
+        basis = reduced_basis.load_basis(twin_model, rom_name)
+        if basis is not None and (basis.verified or not settings['verify']):
+            node_ids = basis.node_ids(scoping_twin)
+            return basis.field(basis.coefficients(twin_model.outputs), rows if node_ids is None else node_ids[rows])
+    outfield, _ = utility.get_result(twin_model, rom_name, scoping_twin=scoping_twin, config=config)
+    values = np.asarray(outfield).reshape(n_points, -1)[rows]
+    # Same layout as basis.field: flat for scalar fields
+    return values[:, 0] if values.shape[1] == 1 else values
+
+def probe(config, input_data, twin_model, rom_name, scoping_twin, coordinates, operations=None, method=None, cache_dir=None):
+    # Values of every requested suboperation at arbitrary coordinates (in meters) of the evaluated twin
+    settings = probe_settings(config)
+    method = method or settings['method']
+    coordinates = np.atleast_2d(np.asarray(coordinates, dtype=float))
+    if coordinates.shape[1] != 3:
+        raise ValueError(f"Probe coordinates should have three columns (x, y, z), got {coordinates.shape[1]}.")
+    tbrom_name = config['available_operations'][utility.operation_list(input_data)[0][0]]['tbrom']
+    pairs = probe_operations(config, tbrom_name, operations)
+
+    entry = index_entry(twin_model, rom_name, scoping_twin, cache_dir=cache_dir)
+    tree = entry["tree"]
+    distances, indices = neighbours(tree, coordinates, method, settings['neighbours'])
+    weights = np.ones_like(distances) if method == "nearest" else idw_weights(distances, settings['power'])
+
+    # Suboperations are evaluated on the neighbouring ROM points only, then weighted per query
+    rows, inverse = np.unique(indices, return_inverse=True)
+    outfield = snapshot_rows(config, twin_model, rom_name, scoping_twin, rows, tree.n)
+    points = tree.data[rows]
+    outside = distances[:, 0] > settings['max_distance'] if settings['max_distance'] is not None else None
+
+    # Damage applies the S-N curve of every named selection, through masks restricted to the evaluated rows
+    row_masks = None
+    if fatigue_curve.curves_per_named_selection(config) and any(config['available_operations'][operation]['module'] == "damage" for operation, _ in pairs):
+        if entry["masks"] is None:
+            entry["masks"] = utility.named_selection_masks(twin_model, rom_name, scoping_twin)
+        row_masks = {name: mask[rows] for name, mask in entry["masks"].items()}
+
+    values, units = {}, {}
+    for pair in pairs:
+        operation_config = config['available_operations'][pair[0]]
+        pair_input = utility.operation_input(input_data, pair)
+        module = importlib.import_module(f"modules.{operation_config['module']}")
+        options = {"masks": row_masks} if row_masks is not None and operation_config['module'] == "damage" else {}
+        result = getattr(module, operation_config['method'])(config, pair_input, outfield, points, **options)
+        probed = np.einsum("qk,qk->q", weights, np.asarray(result.values, dtype=float)[inverse.reshape(indices.shape)])
+        if outside is not None:
+            probed[outside] = np.nan
+        values[result.name] = probed
+        units[result.name] = utility.get_unit(pair_input, config)
+
+    return {"method": method, "distance": distances[:, 0], "values": values, "units": units}
+
+def probe_table(coordinates, probed):
+    # One row per probe: coordinates, distance to the closest ROM point and every probed value
+    import pandas as pd
+    coordinates = np.atleast_2d(np.asarray(coordinates, dtype=float))
+    table = pd.DataFrame({"x": coordinates[:, 0], "y": coordinates[:, 1], "z": coordinates[:, 2], "distance": probed["distance"]})
+    for name, values in probed["values"].items():
+        table[name] = values
+    return table
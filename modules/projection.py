@@ -0,0 +1,87 @@
+import os
+import hashlib
+import threading
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+# Operators built during this run, keyed by point content, kernel parameters and precision
+_operators = {}
+_locks = {}
+
+def operator_key(grid_points, rom_points, radius, sharpness):
+    # The operator only depends on both point clouds and the kernel, hash them together
+    digest = hashlib.sha1()
+    for points in (grid_points, rom_points):
+        points = np.ascontiguousarray(points, dtype=float)
+        digest.update(str(points.shape).encode())
+        digest.update(points.tobytes())
+    digest.update(f"{radius}|{sharpness}".encode())
+    return digest.hexdigest()
+
+def build_operator(grid_points, rom_points, radius=0.0001, sharpness=5):
+    # Sparse (n_nodes x n_rom_points) map reproducing grid.interpolate(strategy="closest_point"):
+    # Gaussian weights for ROM points within the radius, closest ROM point otherwise
+    grid_points = np.asarray(grid_points, dtype=float)
+    rom_points = np.asarray(rom_points, dtype=float)
+    n_nodes, n_rom = len(grid_points), len(rom_points)
+    rom_tree = cKDTree(rom_points)
+
+    pairs = cKDTree(grid_points).sparse_distance_matrix(rom_tree, radius, output_type='ndarray')
+    rows, cols = pairs['i'], pairs['j']
+    weights = np.exp(-(sharpness * pairs['v'] / radius) ** 2)
+    row_sums = np.bincount(rows, weights=weights, minlength=n_nodes)
+    weights = weights / row_sums[rows]
+
+    # Nodes without any ROM point in the radius take the closest one
+    lonely = np.flatnonzero(row_sums == 0)
+    if len(lonely):
+        _, nearest = rom_tree.query(grid_points[lonely], k=1)
+        rows = np.concatenate([rows, lonely])
+        cols = np.concatenate([cols, nearest])
+        weights = np.concatenate([weights, np.ones(len(lonely))])
+
+    return sparse.csr_matrix((weights, (rows, cols)), shape=(n_nodes, n_rom))
+
+def projection_operator(grid_points, rom_points, radius=0.0001, sharpness=5, cache_dir=None):
+    # Operator built once per point clouds, kept in memory and optionally on disk as .npz
+    key = operator_key(grid_points, rom_points, radius, sharpness)
+    # Weights in the precision of the ROM points, float32 points project float32 fields
+    dtype = np.result_type(np.asarray(rom_points).dtype, np.float32)
+    # Stages projecting on the same point clouds in parallel wait for the first one to build the operator
+    with _locks.setdefault(key, threading.Lock()):
+        if (key, dtype.name) in _operators:
+            return _operators[(key, dtype.name)]
+
+        cache_file = os.path.join(cache_dir, "projection", f"{key}.npz") if cache_dir else None
+        if cache_file and os.path.exists(cache_file):
+            operator = sparse.load_npz(cache_file)
+        else:
+            operator = build_operator(grid_points, rom_points, radius, sharpness)
+            if cache_file:
+                # Written aside then renamed, so other processes never read a partial file
+                os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                staging_file = f"{cache_file[:-4]}.{os.getpid()}.tmp.npz"
+                sparse.save_npz(staging_file, operator)
+                os.replace(staging_file, cache_file)
+
+        operator = operator.astype(dtype, copy=False)
+        _operators[(key, dtype.name)] = operator
+        return operator
+
+def apply_operator(operator, fields):
+    # Project (n_rom,) or (n_rom, k) fields onto the grid nodes with one sparse product, in the precision of the operator
+    return operator @ np.asarray(fields, dtype=operator.dtype)
+
+def project_fields(grid, operator, fields, target=None):
+    # Project several named fields in one batched product and attach them to a copy of the grid
+    # (or to an existing target grid, to gather fields projected with different operators)
+    names = list(fields)
+    stacked = np.column_stack([np.asarray(fields[name], dtype=operator.dtype) for name in names])
+    projected = apply_operator(operator, stacked)
+
+    inter_grid = grid.copy() if target is None else target
+    for index, name in enumerate(names):
+        inter_grid[name] = projected[:, index]
+    inter_grid.set_active_scalars(names[0])
+    return inter_grid
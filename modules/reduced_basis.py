@@ -0,0 +1,172 @@
+import os
+import json
+import numpy as np
+
+# TBROM files as laid out in the ROM resource directory by the twin runtime
+OUTPUT_FIELD_DIR = "binaryOutputField"
+BASIS_FILE = "basis.svd"
+POINTS_FILE = "points.bin"
+SETTINGS_FILE = "settings.json"
+PROPERTIES_FILE = "properties.json"
+
+# Basis of every TBROM read during this run keyed by ROM resource directory, None when it cannot be used
+_bases = {}
+
+def reduced_basis_settings(config):
+    # Reduced basis section of the config, snapshots come from the twin when it is missing
+    settings = dict((config or {}).get('reduced_basis') or {})
+    settings.setdefault('enabled', False)
+    # Compare the first reconstruction of every TBROM with the twin snapshot
+    settings.setdefault('verify', True)
+    return settings
+
+def read_basis(basis_file):
+    # Memory-mapped (modes, values) basis: a 16-byte tag, the value and mode counts, then one float64 row per mode
+    with open(basis_file, "rb") as f:
+        f.seek(16)
+        n_values, n_modes = (int(count) for count in np.fromfile(f, dtype=np.uint64, count=2))
+    return np.memmap(basis_file, dtype=np.float64, mode="r", offset=32, shape=(n_modes, n_values))
+
+def read_points(points_file):
+    # Memory-mapped (points, 3) coordinates after the 8-byte value count
+    return np.memmap(points_file, dtype=np.float64, mode="r", offset=8).reshape(-1, 3)
+
+def decode_ids(ids):
+    # Point indices of a named selection, "a, -1, b" stands for every index from a to b
+    ids = np.asarray(ids, dtype=np.int64)
+    markers = np.flatnonzero(ids == -1)
+    ranges = [np.arange(ids[marker - 1] + 1, ids[marker + 1]) for marker in markers]
+    return np.sort(np.concatenate([ids[ids != -1]] + ranges))
+
+def field_dimension(settings):
+    # Components per point, tensors are stored as 6 (symmetrical) or 9 components
+    dimensionality = settings.get("dimensionality", [1])
+    if len(dimensionality) > 1:
+        return 6 if settings.get("symmetricalDim") else 9
+    return int(dimensionality[0])
+
+def inverse_transform(values, transformation):
+    # Undo the constraint transformation applied to the field when the TBROM was built
+    if transformation is None:
+        return values
+    function = transformation["function"]
+    if function == "min":
+        return np.square(values) + transformation["minValue"]
+    if function == "max":
+        return transformation["maxValue"] - np.square(values)
+    if function == "minMax":
+        min_value, max_value = transformation["minValue"], transformation["maxValue"]
+        span = max_value - min_value
+        if span > 1.0:
+            eps1, eps2 = 1e-08 / span, span * 1e-08
+        else:
+            eps1, eps2 = span * 1e-08, span ** 3 * 1e-08
+        alpha = 1.0 / (span + eps1 + eps2)
+        return np.clip(1.0 / (np.exp(values) + alpha) + min_value - eps1, min_value, max_value)
+    raise ValueError(f"Unsupported TBROM transformation: {function}")
+
+def coefficient_names(output_names, rom_name, n_modes, n_tbroms):
+    # Twin outputs carrying the mode coefficients, outField_mode_<i> with a _<rom_name> suffix when the twin has several TBROMs
+    names = []
+    for mode in range(1, n_modes + 1):
+        port = f"outField_mode_{mode}" + (f"_{rom_name}" if n_tbroms > 1 else "")
+        # The twin may prefix its output names, so fall back to the first output containing the port name
+        name = port if port in output_names else next((name for name in output_names if port in name), None)
+        if name is None:
+            raise ValueError(f"Mode coefficient output {port} of TBROM {rom_name} is not connected.")
+        names.append(name)
+    return names
+
+class ReducedBasis:
+    # Basis, points and named selections of one TBROM, fields are rebuilt as coefficients @ basis
+    def __init__(self, resource_dir, rom_name, output_names, n_tbroms=1):
+        self.rom_name = rom_name
+        with open(os.path.join(resource_dir, PROPERTIES_FILE), "r") as f:
+            fields = json.load(f)["fields"]
+        properties = next(field for field in fields.values() if field["fieldType"] == "binaryOutputField")
+        transformation = properties.get("transformation")
+        self.transformation = None if not transformation or transformation["function"] in ("", "neutral") else transformation
+
+        with open(os.path.join(resource_dir, OUTPUT_FIELD_DIR, SETTINGS_FILE), "r") as f:
+            settings = json.load(f)
+        if "timeSeries" in settings:
+            raise ValueError(f"TBROM {rom_name} is a parametric field history, its basis depends on the evaluation time.")
+        self.dimension = field_dimension(settings)
+        self.named_selections = {name: decode_ids(ids) for name, ids in settings.get("namedSelections", {}).items()}
+
+        self.basis = read_basis(os.path.join(resource_dir, OUTPUT_FIELD_DIR, BASIS_FILE))
+        self.n_modes = self.basis.shape[0]
+        self.n_points = self.basis.shape[1] // self.dimension
+        points_file = os.path.join(resource_dir, OUTPUT_FIELD_DIR, POINTS_FILE)
+        self.points = read_points(points_file) if os.path.exists(points_file) else np.zeros((self.n_points, 3))
+        self.coefficient_names = coefficient_names(list(output_names), rom_name, self.n_modes, n_tbroms)
+        self.verified = False
+
+    def coefficients(self, outputs):
+        return np.array([outputs[name] for name in self.coefficient_names], dtype=np.float64)
+
+    def node_ids(self, named_selection=None):
+        return None if named_selection is None else self.named_selections[named_selection]
+
+    def field(self, coefficients, node_ids=None):
+        # Field at the given TBROM point indices (all points by default), O(points x modes x components)
+        if node_ids is None:
+            values = coefficients @ self.basis
+        else:
+            columns = (np.asarray(node_ids, dtype=np.int64)[:, None] * self.dimension + np.arange(self.dimension)).ravel()
+            values = coefficients @ self.basis[:, columns]
+        values = inverse_transform(values, self.transformation).reshape(-1, self.dimension)
+        # Same layout as the twin snapshot: one column per component, flat for scalar fields
+        return values[:, 0] if self.dimension == 1 else values
+
+    def snapshot(self, outputs, named_selection=None):
+        return self.field(self.coefficients(outputs), self.node_ids(named_selection))
+
+    def points_of(self, named_selection=None):
+        node_ids = self.node_ids(named_selection)
+        return np.asarray(self.points if node_ids is None else self.points[node_ids])
+
+def rom_resource_directory(twin_model, rom_name):
+    # ROM resource directory extracted by the twin runtime, pytwin only exposes it privately
+    get_directory = getattr(twin_model, "_tbrom_resource_directory", None)
+    return get_directory(rom_name) if get_directory else None
+
+def load_basis(twin_model, rom_name):
+    # Reduced basis of a TBROM of the twin, read once per run, or None when its files cannot be used
+    resource_dir = rom_resource_directory(twin_model, rom_name)
+    if resource_dir is None:
+        return None
+    if resource_dir not in _bases:
+        try:
+            _bases[resource_dir] = ReducedBasis(resource_dir, rom_name, twin_model.outputs, n_tbroms=len(twin_model.tbrom_names))
+        except (OSError, KeyError, ValueError, StopIteration) as e:
+            print(f"Reduced basis of {rom_name} unavailable, using the twin snapshots: {e}")
+            _bases[resource_dir] = None
+    return _bases[resource_dir]
+
+def verify(basis, twin_model, rom_name, named_selection=None):
+    # Compare one reconstruction with the twin snapshot, the basis is dropped when they differ
+    expected = np.asarray(twin_model.generate_snapshot(rom_name, on_disk=False, named_selection=named_selection))
+    actual = basis.snapshot(twin_model.outputs, named_selection)
+    scale = max(float(np.abs(expected).max()), 1.0) if expected.size else 1.0
+    basis.verified = expected.shape == actual.shape and np.allclose(actual, expected, rtol=1e-6, atol=1e-9 * scale)
+    if not basis.verified:
+        print(f"Reduced basis of {rom_name} does not reproduce the twin snapshot, using the twin snapshots.")
+    return basis.verified
+
+def get_result(twin_model, rom_name, named_selection=None, check=True):
+    # (field, points) of the current twin state rebuilt from the basis, None to fall back on generate_snapshot
+    basis = load_basis(twin_model, rom_name)
+    if basis is None:
+        return None
+    if check and not basis.verified and not verify(basis, twin_model, rom_name, named_selection):
+        _bases[rom_resource_directory(twin_model, rom_name)] = None
+        return None
+    return basis.snapshot(twin_model.outputs, named_selection), basis.points_of(named_selection)
+
+def field_at(twin_model, rom_name, node_ids):
+    # Field at a few TBROM point indices (virtual sensors) without rebuilding the whole snapshot
+    basis = load_basis(twin_model, rom_name)
+    if basis is None:
+        raise ValueError(f"Reduced basis of TBROM {rom_name} is not available.")
+    return basis.field(basis.coefficients(twin_model.outputs), node_ids)
@@ -0,0 +1,187 @@
+import time
+import multiprocessing
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# thread: I/O, DPF and VTK work releasing the GIL; process: CPU-bound NumPy stages (picklable function and inputs);
+# main: stages that must stay on the main thread, e.g. on-screen plotting
+EXECUTORS = ("thread", "process", "main")
+
+def cpu_timed(func, *args):
+    # Result and CPU time of a stage run in a worker process, the worker runs one stage at a time
+    cpu = time.process_time()
+    result = func(*args)
+    return result, time.process_time() - cpu
+
+def scheduler_settings(config):
+    # Scheduler section of the config, one worker thread runs the stages one after another
+    settings = dict((config or {}).get('scheduler') or {})
+    settings.setdefault('thread_workers', 4)
+    settings.setdefault('process_workers', 2)
+    # Kinds of stages sent to the process pool, e.g. [scripts, operation]
+    settings.setdefault('process_stages', [])
+    return settings
+
+def executor_for(kind, settings):
+    return "process" if kind in settings['process_stages'] and settings['process_workers'] > 0 else "thread"
+
+class Stage:
+    # One pipeline stage: func is called with the values of its inputs and returns its outputs
+    def __init__(self, name, func, inputs=(), outputs=(), executor="thread"):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Invalid executor for stage {name}: {executor}. Available executors: {list(EXECUTORS)}")
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.executor = executor
+
+class StageGraph:
+    # Stages with declared inputs and outputs, each one started as soon as its inputs exist
+    def __init__(self):
+        self.stages = {}
+        self.timings = {}
+
+    def add(self, name, func, inputs=(), outputs=(), executor="thread"):
+        if name in self.stages:
+            raise ValueError(f"Stage {name} is already in the pipeline.")
+        self.stages[name] = Stage(name, func, inputs, outputs, executor)
+
+    def producers(self):
+        # Stage producing every output
+        producers = {}
+        for stage in self.stages.values():
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"Output {output} is produced by both {producers[output]} and {stage.name}.")
+                producers[output] = stage.name
+        return producers
+
+    def dependencies(self, available=()):
+        # Stages every stage waits for, inputs given to run() need no stage
+        producers = self.producers()
+        dependencies = {}
+        for stage in self.stages.values():
+            missing = [name for name in stage.inputs if name not in producers and name not in available]
+            if missing:
+                raise ValueError(f"Inputs {missing} of stage {stage.name} are not produced by any stage.")
+            dependencies[stage.name] = {producers[name] for name in stage.inputs if name in producers}
+        return dependencies
+
+    def order(self, available=()):
+        # Topological order of the stages, in insertion order among ready stages
+        dependencies = self.dependencies(available)
+        order, done = [], set()
+        while len(order) < len(self.stages):
+            ready = [name for name in self.stages if name not in done and dependencies[name] <= done]
+            if not ready:
+                raise ValueError(f"Stages {[name for name in self.stages if name not in done]} depend on each other.")
+            order.extend(ready)
+            done.update(ready)
+        return order
+
+    def run(self, values=None, thread_workers=4, process_workers=2, trace=None):
+        # Run every stage once its inputs are available and return all values
+        values = dict(values or {})
+        dependencies = self.dependencies(values)
+        self.order(values)
+        trace = trace or (lambda name: nullcontext())
+        self.timings = {}
+        start = time.perf_counter()
+
+        process_pool = None
+        if any(stage.executor == "process" for stage in self.stages.values()):
+            # Spawned workers, forking a process that runs DPF and twin runtime threads is not safe
+            process_pool = ProcessPoolExecutor(max_workers=process_workers, mp_context=multiprocessing.get_context("spawn"))
+        thread_pool = ThreadPoolExecutor(max_workers=thread_workers)
+
+        def execute(stage, args):
+            with trace(stage.name) as record:
+                began = time.perf_counter()
+                if stage.executor == "process":
+                    result, cpu = process_pool.submit(cpu_timed, stage.func, *args).result()
+                    if record is not None:
+                        record.cpu_s = cpu
+                else:
+                    result = stage.func(*args)
+                ended = time.perf_counter()
+                outputs = self.outputs_of(stage, result)
+                if record is not None:
+                    record.record(**outputs)
+            return outputs, began - start, ended - start
+
+        pending, done, failed = {}, set(), None
+        try:
+            while len(done) < len(self.stages) and failed is None:
+                started = set(pending.values()) | done
+                for name, stage in self.stages.items():
+                    if name in started or not dependencies[name] <= done:
+                        continue
+                    args = [values[input_name] for input_name in stage.inputs]
+                    if stage.executor == "main":
+                        # Main thread stages run here while the pools keep working
+                        outputs, began, ended = execute(stage, args)
+                        values.update(outputs)
+                        self.timings[name] = (began, ended)
+                        done.add(name)
+                    else:
+                        pending[thread_pool.submit(execute, stage, args)] = name
+                if not pending:
+                    continue
+                finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = pending.pop(future)
+                    if future.exception() is not None:
+                        failed = failed or future.exception()
+                        continue
+                    outputs, began, ended = future.result()
+                    values.update(outputs)
+                    self.timings[name] = (began, ended)
+                    done.add(name)
+        finally:
+            # A failed stage stops the run, stages already started are waited for
+            for future in pending:
+                future.cancel()
+            thread_pool.shutdown(wait=True)
+            if process_pool is not None:
+                process_pool.shutdown(wait=True, cancel_futures=True)
+        if failed is not None:
+            raise failed
+        self.wall_s = time.perf_counter() - start
+        return values
+
+    @staticmethod
+    def outputs_of(stage, result):
+        # A stage returns nothing, the value of its only output, or a tuple of its outputs
+        if not stage.outputs:
+            return {}
+        if len(stage.outputs) == 1:
+            return {stage.outputs[0]: result}
+        if len(result) != len(stage.outputs):
+            raise ValueError(f"Stage {stage.name} returned {len(result)} values for the outputs {stage.outputs}.")
+        return dict(zip(stage.outputs, result))
+
+    def critical_path(self):
+        # Chain of dependent stages with the longest total duration, the lower bound of the run time
+        dependencies = self.dependencies(set().union(*(stage.inputs for stage in self.stages.values())))
+        finish, previous = {}, {}
+        for name in self.order(set().union(*(stage.inputs for stage in self.stages.values()))):
+            began, ended = self.timings[name]
+            before = max(dependencies[name], key=lambda dependency: finish[dependency], default=None)
+            finish[name] = (finish[before] if before else 0.0) + (ended - began)
+            previous[name] = before
+        name = max(finish, key=finish.get)
+        path = [name]
+        while previous[path[-1]]:
+            path.append(previous[path[-1]])
+        return {
+            "stages": path[::-1],
+            "critical_path_s": finish[name],
+            "wall_s": self.wall_s,
+            "stage_sum_s": sum(ended - began for began, ended in self.timings.values()),
+        }
+
+def print_critical_path(report):
+    print(f"critical path ({report['critical_path_s']:.3f} s): {' -> '.join(report['stages'])}")
+    print(f"wall {report['wall_s']:.3f} s for {report['stage_sum_s']:.3f} s of stage time, "
+          f"{report['stage_sum_s'] / report['wall_s'] if report['wall_s'] > 0 else 1.0:.2f}x overlap")
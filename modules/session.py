@@ -0,0 +1,209 @@
+from . import utility
+from . import tracing
+from . import precision
+from . import memo
+from . import fatigue_curve
+import os
+import copy
+import time
+import importlib
+import threading
+import numpy as np
+
+def load_mesh_artifacts(input_data, main_dir, config=None):
+    # Load the FEA mesh and its grid (in meters) once, to be shared by every session
+    rst_file = input_data['input_files']['rst_file']
+    rst_file_dir = os.path.join(main_dir, rst_file)
+    cache_dir = config.get('cache_dir') if config else None
+    if cache_dir:
+        from . import mesh_cache
+        mesh, grid, mesh_unit = mesh_cache.load_mesh(rst_file_dir, os.path.join(main_dir, cache_dir), config=config)
+    else:
+        mesh, grid, mesh_unit = utility.extract_mesh(rst_file_dir)
+        grid.points = utility.convert_to_meters(precision.as_float(grid.points, config), mesh_unit)
+        precision.compact_cells(grid, config)
+    return {
+        "mesh": mesh,
+        "grid": grid,
+        # VTK locators are not safe to build concurrently on a shared grid
+        "lock": threading.Lock(),
+    }
+
+def json_values(values):
+    # NaN (probe off the part) is not valid JSON, it goes out as null
+    nan = np.isnan(values)
+    return np.where(nan, None, values).tolist() if nan.any() else values.tolist()
+
+class TwinSession:
+    # Warm twin session: twin models, TBROM bases, mesh and grid stay in memory between requests
+    def __init__(self, config, input_data, main_dir, mesh_artifacts=None, memo=None, stage_metrics=None):
+        self.config = config
+        self.input_data = input_data
+        self.main_dir = main_dir
+        # The mesh is only loaded when a request projects on it, probes and point fields never need it
+        self._mesh_artifacts = mesh_artifacts
+        self._mesh_lock = threading.Lock()
+        # Snapshot memo, shared by the sessions of a service
+        self.memo = memo
+        # Stage timings aggregated over the requests of a service
+        self.stage_metrics = stage_metrics
+        self.lock = threading.Lock()
+        self._twins = {}
+        self._scopings = {}
+        self._masks = {}
+
+    @property
+    def mesh_artifacts(self):
+        with self._mesh_lock:
+            if self._mesh_artifacts is None:
+                self._mesh_artifacts = load_mesh_artifacts(self.input_data, self.main_dir, self.config)
+        return self._mesh_artifacts
+
+    def request_input_data(self, request):
+        # Overlay a request (rom_inputs, operation, named_selection) on the base input data
+        run_input = copy.deepcopy(self.input_data)
+        if "rom_inputs" in request:
+            run_input["twin_inputs"]["rom_inputs"] = request["rom_inputs"]
+        for key in ("operation", "named_selection"):
+            if key in request:
+                run_input["input_parameters"][key] = request[key]
+        if len(utility.operation_list(run_input)) > 1:
+            raise ValueError("A service request evaluates a single operation.")
+        return run_input
+
+    def twin(self, run_input):
+        # Twin model holding the TBROM of the requested operation, loaded on first use
+        operation = run_input['input_parameters']['operation'][0]
+        tbrom_name = self.config['available_operations'][operation]['tbrom']
+        if tbrom_name not in self._twins:
+            twin_file, rom_name = utility.twin_file_handler(run_input, self.config, self.main_dir)
+            # Every session owns its twin instance so sessions can evaluate concurrently
+            twin_model, _ = utility.initiate_twin(run_input, os.path.join(self.main_dir, twin_file), reuse=False)
+            self._twins[tbrom_name] = (twin_model, rom_name)
+        return self._twins[tbrom_name]
+
+    def scoping(self, twin_model, rom_name, named_selection):
+        # Twin named selection matching the requested scoping, resolved once per twin
+        key = (rom_name, named_selection)
+        if key not in self._scopings:
+            self._scopings[key] = utility.twin_scoping(twin_model, rom_name, named_selection)
+        return self._scopings[key]
+
+    def masks(self, twin_model, rom_name, named_selection):
+        # Node masks of the twin named selections over the scoped ROM points, built once per twin and scoping
+        key = (rom_name, named_selection)
+        if key not in self._masks:
+            scoping_twin = self.scoping(twin_model, rom_name, named_selection)
+            self._masks[key] = utility.named_selection_masks(twin_model, rom_name, scoping_twin)
+        return self._masks[key]
+
+    def evaluate(self, request):
+        start = time.perf_counter()
+        tracer = tracing.Tracer()
+        run_input = self.request_input_data(request)
+        utility.validate_parameters(run_input, self.config, verbose=False)
+        utility.validate_rom_inputs(run_input["twin_inputs"].get("rom_inputs"), self.config)
+
+        named_selection = run_input['input_parameters']['named_selection']
+        with self.lock, tracer.stage("twin evaluation") as stage:
+            twin_model, rom_name = self.twin(run_input)
+            # Inputs within the memo tolerance skip the twin evaluation altogether
+            model = memo.model_stamp(twin_model, self.config)
+            cached = self.memo.lookup(rom_name, named_selection, run_input['twin_inputs'], model) if self.memo else None
+            if cached is not None:
+                outfields, points, twin_outputs = cached
+            else:
+                twin_model.initialize_evaluation(
+                    parameters=run_input['twin_inputs'].get('rom_parameters'),
+                    inputs=run_input['twin_inputs'].get('rom_inputs'),
+                    field_inputs=run_input['twin_inputs'].get('field_inputs')
+                )
+                scoping_twin = self.scoping(twin_model, rom_name, named_selection)
+                outfields, points = utility.get_result(twin_model, rom_name, scoping_twin=scoping_twin, config=self.config)
+                twin_outputs = dict(twin_model.outputs)
+                if self.memo:
+                    self.memo.store(rom_name, named_selection, run_input['twin_inputs'], outfields, points, twin_outputs, model)
+            stage.record(outfields=outfields, points=points)
+
+        # Get the result based on operation, damage applies the S-N curve of every named selection through the masks
+        operation = run_input["input_parameters"]["operation"][0]
+        operation_config = self.config["available_operations"][operation]
+        module = importlib.import_module(f"modules.{operation_config['module']}")
+        operation_masks = operation_config["module"] == "damage" and fatigue_curve.curves_per_named_selection(self.config)
+        masks = None
+        if operation_masks or utility.scripts_need_masks(run_input, self.config):
+            with self.lock:
+                masks = self.masks(twin_model, rom_name, named_selection)
+        with tracer.stage("operation") as stage:
+            options = {"masks": masks} if operation_masks else {}
+            result_data = getattr(module, operation_config["method"])(self.config, run_input, outfields, points, **options)
+            stage.record(result=result_data)
+        with tracer.stage("scripts"):
+            script_results = utility.run_script(run_input, self.config, result_data, masks=masks)
+
+        response = {
+            "twin_outputs": twin_outputs,
+            "output_parameters": script_results,
+            "unit": utility.get_unit(run_input, self.config),
+            "named_selection": named_selection,
+        }
+
+        return_field = request.get("return_field")
+        if return_field == "points":
+            response["field"] = result_data.to_array().tolist()
+        elif return_field == "mesh":
+            result_detail = "_".join(run_input["input_parameters"]["operation"])
+            with self.mesh_artifacts["lock"], tracer.stage("projection"):
+                _, result_load_val = utility.project_result_on_mesh(result_data, self.mesh_artifacts["grid"], result_detail)
+            response["field"] = result_load_val.tolist()
+
+        if self.stage_metrics is not None:
+            self.stage_metrics.add(tracer.records)
+        response["evaluation_ms"] = (time.perf_counter() - start) * 1000
+        return response
+
+    def probe(self, request):
+        # Values of every suboperation at the request coordinates, twin evaluated at the request inputs
+        from . import probe
+        start = time.perf_counter()
+        tracer = tracing.Tracer()
+        if "coordinates" not in request:
+            raise ValueError("A probe request needs coordinates, a list of [x, y, z] in meters.")
+        # A probe covers whole operations, "operation" only selects the twin
+        operations = request.get("operations")
+        evaluate_request = {key: value for key, value in request.items() if key in ("rom_inputs", "named_selection")}
+        if operations:
+            first = operations[0]
+            operation = first if isinstance(first, str) else first[0]
+            evaluate_request["operation"] = [operation, self.config["available_operations"][operation]["suboperations"][0]]
+        run_input = self.request_input_data(evaluate_request)
+        utility.validate_parameters(run_input, self.config, verbose=False)
+        utility.validate_rom_inputs(run_input["twin_inputs"].get("rom_inputs"), self.config)
+
+        named_selection = run_input['input_parameters']['named_selection']
+        cache_dir = os.path.join(self.main_dir, self.config['cache_dir']) if self.config.get('cache_dir') else None
+        with self.lock:
+            with tracer.stage("twin evaluation"):
+                twin_model, rom_name = self.twin(run_input)
+                twin_model.initialize_evaluation(
+                    parameters=run_input['twin_inputs'].get('rom_parameters'),
+                    inputs=run_input['twin_inputs'].get('rom_inputs'),
+                    field_inputs=run_input['twin_inputs'].get('field_inputs')
+                )
+                scoping_twin = self.scoping(twin_model, rom_name, named_selection)
+                twin_outputs = dict(twin_model.outputs)
+            with tracer.stage("probe"):
+                probed = probe.probe(self.config, run_input, twin_model, rom_name, scoping_twin, request["coordinates"],
+                                     operations=operations, method=request.get("method"), cache_dir=cache_dir)
+
+        if self.stage_metrics is not None:
+            self.stage_metrics.add(tracer.records)
+        return {
+            "twin_outputs": twin_outputs,
+            "named_selection": named_selection,
+            "method": probed["method"],
+            "distance": probed["distance"].tolist(),
+            "values": {name: json_values(values) for name, values in probed["values"].items()},
+            "units": probed["units"],
+            "evaluation_ms": (time.perf_counter() - start) * 1000,
+        }
@@ -0,0 +1,152 @@
+from . import utility, projection, precision
+import os
+import json
+import importlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scripts.field_statistics import FieldStatistics
+
+def load_input_table(input_file, config):
+    # Read the input vectors of the sweep, one load case per row
+    extension = os.path.splitext(input_file)[1].lower()
+    if extension == ".csv":
+        table = pd.read_csv(input_file)
+    elif extension == ".parquet":
+        table = pd.read_parquet(input_file)
+    elif extension == ".npy":
+        # Plain arrays follow the order of the inputs declared in the config
+        values = np.atleast_2d(np.load(input_file))
+        table = pd.DataFrame(values, columns=list(config['inputs'])[:values.shape[1]])
+    else:
+        raise ValueError(f"Invalid sweep input file: {input_file}. Please provide a '.csv', '.parquet' or '.npy' file.")
+    return table.to_dict(orient='records')
+
+def operation_method(config, input_data):
+    operation = input_data["input_parameters"]["operation"][0]
+    operation_config = config["available_operations"][operation]
+    module = importlib.import_module(f"modules.{operation_config['module']}")
+    return getattr(module, operation_config["method"])
+
+def evaluate_case(twin_model, rom_name, scoping_twin, config, input_data, rom_inputs):
+    # Evaluate one load case on an already loaded twin and return the result at the ROM points
+    twin_model.initialize_evaluation(
+        parameters=input_data['twin_inputs'].get('rom_parameters'),
+        inputs=rom_inputs,
+        field_inputs=input_data['twin_inputs'].get('field_inputs')
+    )
+    outfields, points = utility.get_result(twin_model, rom_name, scoping_twin=scoping_twin, config=config)
+    result_data = operation_method(config, input_data)(config, input_data, outfields, points)
+    return np.asarray(result_data.values)
+
+def evaluate_cases(twin_model, rom_name, scoping_twin, config, input_data, cases, chunk_size=8):
+    # (n_cases, n_points) results of several load cases. With the reduced basis enabled the twin only evaluates
+    # the mode coefficients of each case and the fields of chunk_size cases are rebuilt in one product with the basis,
+    # otherwise every case asks the twin for its snapshot
+    from . import reduced_basis
+    if not cases:
+        return np.empty((0, 0))
+    # The first case goes through utility.get_result, which verifies the basis against the twin snapshot once
+    rows = [evaluate_case(twin_model, rom_name, scoping_twin, config, input_data, cases[0])]
+    basis = reduced_basis.load_basis(twin_model, rom_name) if reduced_basis.reduced_basis_settings(config)['enabled'] else None
+    if basis is None:
+        rows += [evaluate_case(twin_model, rom_name, scoping_twin, config, input_data, rom_inputs) for rom_inputs in cases[1:]]
+        return np.stack(rows)
+
+    method = operation_method(config, input_data)
+    node_ids = basis.node_ids(scoping_twin)
+    points = precision.as_float(basis.points_of(scoping_twin), config)
+    for start in range(1, len(cases), chunk_size):
+        coefficients = []
+        for rom_inputs in cases[start:start + chunk_size]:
+            twin_model.initialize_evaluation(
+                parameters=input_data['twin_inputs'].get('rom_parameters'),
+                inputs=rom_inputs,
+                field_inputs=input_data['twin_inputs'].get('field_inputs')
+            )
+            coefficients.append(basis.coefficients(twin_model.outputs))
+        # Stacked fields of the chunk, the operations are pointwise so they run on them at once
+        outfields = precision.as_float(basis.field(np.stack(coefficients), node_ids), config)
+        rows.extend(np.asarray(method(config, input_data, outfields, points).values).reshape(len(coefficients), -1))
+    return np.stack(rows)
+
+def store_case(store, index, operator, values):
+    # Project one case on the mesh, write it to the store and return its max and min
+    node_values = projection.apply_operator(operator, values)
+    store[index] = node_values
+    return index, float(node_values.max()), int(node_values.argmax()), float(node_values.min()), int(node_values.argmin())
+
+# State of a sweep worker process
+_worker = {}
+
+def _init_worker(config, input_data, twin_file_dir, rom_name, scoping_twin, operator, store_path):
+    # Every worker process loads its own twin once
+    _worker.update(
+        config=config,
+        input_data=input_data,
+        twin_model=utility.load_twin(twin_file_dir),
+        rom_name=rom_name,
+        scoping_twin=scoping_twin,
+        operator=operator,
+        store=np.load(store_path, mmap_mode='r+'),
+    )
+
+def _run_cases(cases):
+    statistics = []
+    for index, rom_inputs in cases:
+        values = evaluate_case(_worker["twin_model"], _worker["rom_name"], _worker["scoping_twin"], _worker["config"], _worker["input_data"], rom_inputs)
+        statistics.append(store_case(_worker["store"], index, _worker["operator"], values))
+    _worker["store"].flush()
+    return statistics
+
+def run_sweep(context, twin_model, rom_name, scoping_twin, twin_file_dir, sweep_config):
+    config, input_data, main_dir = context.config, context.input_data, context.main_dir
+    cases = load_input_table(os.path.join(main_dir, sweep_config["input_file"]), config)
+    for rom_inputs in cases:
+        utility.validate_rom_inputs(rom_inputs, config)
+
+    # One projection operator for every case, ROM points never change between evaluations
+    _, grid, _ = context.mesh()
+    points = precision.as_float(utility.unflatten_vector(twin_model.generate_points(rom_name, on_disk=False, named_selection=scoping_twin), 3), config)
+    operator = projection.projection_operator(grid.points, points, cache_dir=context.cache_dir())
+
+    # Stacked (n_cases x n_nodes) result store, filled case by case
+    result_detail = "_".join(input_data["input_parameters"]["operation"])
+    output_dir = os.path.join(main_dir, input_data["output_files"]["output_dir"])
+    store_path = os.path.join(output_dir, f"{result_detail}_sweep.npy")
+    store = np.lib.format.open_memmap(store_path, mode='w+', dtype=precision.float_dtype(config), shape=(len(cases), operator.shape[0]))
+
+    workers = sweep_config.get("workers", 1)
+    indexed_cases = list(enumerate(cases))
+    if workers > 1:
+        store.flush()
+        chunks = [indexed_cases[i::workers] for i in range(workers)]
+        init_args = (config, input_data, twin_file_dir, rom_name, scoping_twin, operator, store_path)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as executor:
+            statistics = [item for chunk in executor.map(_run_cases, chunks) for item in chunk]
+    else:
+        statistics = []
+        for index, rom_inputs in indexed_cases:
+            values = evaluate_case(twin_model, rom_name, scoping_twin, config, input_data, rom_inputs)
+            statistics.append(store_case(store, index, operator, values))
+            print(f"case {index + 1}/{len(cases)}: {rom_inputs}")
+        store.flush()
+
+    # Statistics over every case, streamed row by row from the store
+    field_statistics = FieldStatistics(**sweep_config.get("statistics", {}))
+    for index in range(len(cases)):
+        field_statistics.update(grid.points, store[index])
+
+    # Per-case max and min with their node locations
+    summary = []
+    for index, max_value, max_node, min_value, min_node in sorted(statistics):
+        summary.append({
+            "inputs": cases[index],
+            "max": {"points": grid.points[max_node].tolist(), "result": max_value},
+            "min": {"points": grid.points[min_node].tolist(), "result": min_value},
+        })
+    summary_path = os.path.join(output_dir, f"{result_detail}_sweep_summary.json")
+    with open(summary_path, "w") as f:
+        json.dump({"unit": utility.get_unit(input_data, config), "statistics": field_statistics.result(), "cases": summary}, f, indent=4)
+
+    return store_path, summary_path
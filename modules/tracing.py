@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import threading
+import numpy as np
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak RSS is then not reported
+    resource = None
+
+def peak_rss_mb():
+    # Peak resident set size of the process so far (ru_maxrss is in kB on Linux, in bytes on macOS)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+def array_size(value):
+    # Shape and size in bytes of an array-like stage output: NumPy arrays, ResultField and PyVista meshes
+    if isinstance(value, np.ndarray):
+        return {"shape": list(value.shape), "mb": value.nbytes / 1e6}
+    if hasattr(value, "points") and hasattr(value, "values"):
+        nbytes = np.asarray(value.points).nbytes + np.asarray(value.values).nbytes
+        return {"shape": [len(value.points)], "mb": nbytes / 1e6}
+    if hasattr(value, "n_points") and hasattr(value, "point_data"):
+        nbytes = np.asarray(value.points).nbytes + sum(np.asarray(value.point_data[name]).nbytes for name in value.point_data.keys())
+        return {"shape": [value.n_points, value.n_cells], "mb": nbytes / 1e6}
+    return None
+
+def profiling_settings(config):
+    # Profiling section of the config: off, or cProfile/pyinstrument dumps for the listed stages ('all' for every stage)
+    settings = dict((config or {}).get('profiling') or {})
+    settings.setdefault('profiler', None)
+    settings.setdefault('stages', 'all')
+    settings.setdefault('output_dir', 'data/output/profiles')
+    return settings
+
+class StageRecord:
+    # Measurements of one stage, array sizes are added by the stage body
+    def __init__(self, name):
+        self.name = name
+        self.arrays = {}
+        self.data = {}
+        # CPU time measured elsewhere, a stage run in a worker process reports the CPU time of the worker
+        self.cpu_s = None
+
+    def record(self, **arrays):
+        for key, value in arrays.items():
+            size = array_size(value)
+            if size is not None:
+                self.arrays[key] = size
+
+class Tracer:
+    # Wall time, CPU time, peak RSS and array sizes of every stage, with optional per-stage profiles
+    def __init__(self, profiler=None, profile_stages='all', profile_dir=None):
+        self.profiler = profiler
+        self.profile_stages = profile_stages
+        self.profile_dir = profile_dir
+        self.records = []
+
+    @classmethod
+    def from_config(cls, config, main_dir):
+        settings = profiling_settings(config)
+        return cls(
+            profiler=settings['profiler'],
+            profile_stages=settings['stages'],
+            profile_dir=os.path.join(main_dir, settings['output_dir']),
+        )
+
+    def _profiled(self, name):
+        return self.profiler and (self.profile_stages == 'all' or name in self.profile_stages)
+
+    @contextmanager
+    def stage(self, name):
+        record = StageRecord(name)
+        profiler = self._start_profiler() if self._profiled(name) else None
+        rss_before = peak_rss_mb()
+        # CPU time of the calling thread, stages running in parallel threads do not count each other
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield record
+        finally:
+            record.data = {
+                "stage": name,
+                "wall_s": time.perf_counter() - wall,
+                "cpu_s": time.thread_time() - cpu if record.cpu_s is None else record.cpu_s,
+                "peak_rss_mb": peak_rss_mb(),
+            }
+            if rss_before is not None:
+                record.data["peak_rss_growth_mb"] = record.data["peak_rss_mb"] - rss_before
+            if record.arrays:
+                record.data["arrays"] = record.arrays
+            if profiler is not None:
+                record.data["profile"] = self._dump_profiler(profiler, name)
+            self.records.append(record.data)
+
+    def _start_profiler(self):
+        # pyinstrument is optional, cProfile ships with Python
+        if self.profiler == "pyinstrument":
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def _dump_profiler(self, profiler, name):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        file_name = name.replace(" ", "_").replace("/", "_")
+        if self.profiler == "pyinstrument":
+            profiler.stop()
+            profile_file = os.path.join(self.profile_dir, f"{file_name}.html")
+            with open(profile_file, "w") as f:
+                f.write(profiler.output_html())
+        else:
+            profiler.disable()
+            profile_file = os.path.join(self.profile_dir, f"{file_name}.prof")
+            profiler.dump_stats(profile_file)
+        return profile_file
+
+    def summary(self):
+        return {
+            "stages": self.records,
+            "total_wall_s": sum(record["wall_s"] for record in self.records),
+            "total_cpu_s": sum(record["cpu_s"] for record in self.records),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def write_jsonl(self, output_file, **run_info):
+        # One JSON line per stage, tagged with the run, appended so runs can be compared
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        with open(output_file, "a") as f:
+            for record in self.records:
+                f.write(json.dumps(dict(run_info, **record)) + "\n")
+        return output_file
+
+class StageMetrics:
+    # Stage counters aggregated over service requests, exported in the Prometheus text format
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def add(self, records):
+        with self.lock:
+            for record in records:
+                totals = self.stages.setdefault(record["stage"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0})
+                totals["count"] += 1
+                totals["wall_s"] += record["wall_s"]
+                totals["cpu_s"] += record["cpu_s"]
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(totals) for name, totals in self.stages.items()}
+
+def prometheus_metric(lines, name, metric_type, help_text, samples):
+    # One metric family: HELP and TYPE lines followed by its (labels, value) samples
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {metric_type}")
+    for labels, value in samples:
+        label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+def prometheus_text(stage_totals, requests=0, errors=0, latency_quantiles=None, memo_stats=None):
+    lines = []
+    prometheus_metric(lines, "twin_requests_total", "counter", "Evaluated requests.", [({}, requests)])
+    prometheus_metric(lines, "twin_request_errors_total", "counter", "Requests failed with a server error.", [({}, errors)])
+    if latency_quantiles:
+        prometheus_metric(lines, "twin_request_latency_seconds", "summary", "Request latency.",
+                          [({"quantile": quantile}, value) for quantile, value in latency_quantiles.items()])
+    prometheus_metric(lines, "twin_stage_calls_total", "counter", "Stage executions.",
+                      [({"stage": name}, totals["count"]) for name, totals in stage_totals.items()])
+    prometheus_metric(lines, "twin_stage_wall_seconds_total", "counter", "Wall time spent per stage.",
+                      [({"stage": name}, totals["wall_s"]) for name, totals in stage_totals.items()])
+    prometheus_metric(lines, "twin_stage_cpu_seconds_total", "counter", "CPU time spent per stage.",
+                      [({"stage": name}, totals["cpu_s"]) for name, totals in stage_totals.items()])
+    rss = peak_rss_mb()
+    if rss is not None:
+        prometheus_metric(lines, "twin_peak_rss_bytes", "gauge", "Peak resident set size of the service.", [({}, int(rss * (1 << 20)))])
+    if memo_stats:
+        prometheus_metric(lines, "twin_memo_lookups_total", "counter", "Snapshot memo lookups by outcome.",
+                          [({"outcome": outcome}, memo_stats[outcome]) for outcome in ("hits", "scaled", "misses")])
+    return "\n".join(lines) + "\n"
@@ -1,12 +1,13 @@
-from pytwin import TwinModel
-import ansys.dpf.core as dpf
-import pyvista as pv
+# pytwin, DPF, PyVista and the projection stack are imported in the functions that use them,
+# so loading the config and validating the inputs stays fast
 import yaml
 import os
 import numpy as np
 import json
 import importlib
-from . import deflect_mesh
+import inspect
+import numbers
+from . import manifest, precision
 
 
 # from pydpf import Model  # Example import, adjust as needed for PyDPF/PyTwin
@@ -21,60 +22,128 @@ def load_json(json_path):
     with open(json_path, 'r') as file:
         return json.load(file)
 
-def validate_parameters(json_data, yaml_config):
+def validate_parameters(json_data, yaml_config, verbose=True):
     input_params = json_data['input_parameters']
     
     # Validate 'named_selection'
     named_selection = input_params['named_selection']
     if named_selection not in yaml_config['available_named_selections']:
-        raise ValueError(f"Error: Named selection '{named_selection}' is not valid. Available named selections: {yaml_config['availabe_named_selections']}")
+        raise ValueError(f"Error: Named selection '{named_selection}' is not valid. Available named selections: {yaml_config['available_named_selections']}")
     
-    # Validate 'operation'
-    operation = input_params['operation']
-    if len(operation) != 2:
-        raise ValueError(f"Error: Operation '{operation}' should have two parts.")
-    
-    parent_operation, child_operation = operation
-    valid_operation = False
-    if parent_operation in yaml_config['available_operations']:
-        if child_operation in yaml_config['available_operations'][parent_operation]['suboperations']:
-            valid_operation = True
-    
-    if not valid_operation:
-        raise ValueError(f"Error: Operation '{parent_operation}_{child_operation}' is not valid. Available operations: {yaml_config['available_operations']}")
+    # Validate 'operation', a single [operation, suboperation] pair or a list of pairs
+    for operation in operation_list(json_data):
+        if len(operation) != 2:
+            raise ValueError(f"Error: Operation '{operation}' should have two parts.")
+        
+        parent_operation, child_operation = operation
+        valid_operation = False
+        if parent_operation in yaml_config['available_operations']:
+            if child_operation in yaml_config['available_operations'][parent_operation]['suboperations']:
+                valid_operation = True
+        
+        if not valid_operation:
+            raise ValueError(f"Error: Operation '{parent_operation}_{child_operation}' is not valid. Available operations: {yaml_config['available_operations']}")
     
     # Validate 'deformation_scale'
     deformation_scale = input_params['deformation_scale']
     if deformation_scale not in yaml_config['available_deformation_scales']:
-        raise ValueError(f"Error: Deformation scale '{deformation_scale}' is not valid. Available deformation scale: {yaml_config['available_deformation_scale']}")
+        raise ValueError(f"Error: Deformation scale '{deformation_scale}' is not valid. Available deformation scale: {yaml_config['available_deformation_scales']}")
     
-    print("All input parameters are valid.")
+    if verbose:
+        print("All input parameters are valid.")
+    return True
+
+def operation_list(input_data):
+    # Requested operations as a list of [operation, suboperation] pairs
+    operation = input_data['input_parameters']['operation']
+    if operation and isinstance(operation[0], (list, tuple)):
+        return [list(pair) for pair in operation]
+    return [list(operation)]
+
+def operation_input(input_data, operation):
+    # Input data restricted to one [operation, suboperation] pair
+    single_input = dict(input_data)
+    single_input['input_parameters'] = dict(input_data['input_parameters'], operation=list(operation))
+    return single_input
+
+def derived_quantities(operations, config):
+    # Stress invariants needed by more than one operation of a TBROM, computed once per snapshot and shared
+    from . import invariants
+    needed = []
+    for operation in operations:
+        module = config['available_operations'][operation[0]]['module']
+        if module == "damage":
+            needed.append("von_mises")
+        elif module == "stress" and operation[1] in invariants.STRESS_INVARIANTS:
+            needed.append(operation[1])
+    return sorted(set(needed)) if len(needed) > 1 else []
+
+def run_operation(get_result, config, input_data, keywords, outfields, points, *values):
+    # Operation stage: the extra stage inputs (masks, derived invariants) are passed under their keyword
+    return get_result(config, input_data, outfields, points, **dict(zip(keywords, values)))
+
+def group_operations(operations, config):
+    # Operations grouped by TBROM, so each snapshot is generated once
+    groups = {}
+    for operation in operations:
+        tbrom_name = config['available_operations'][operation[0]]['tbrom']
+        groups.setdefault(tbrom_name, []).append(operation)
+    return groups
+
+def result_detail(input_data):
+    # Name of the result(s) of a run, e.g. 'stress_von_mises' or 'stress_von_mises__fatigue_damage'
+    return "__".join("_".join(operation) for operation in operation_list(input_data))
+
+def validate_rom_inputs(rom_inputs, yaml_config):
+    # Validate twin inputs against the bounds declared in the config
+    available_inputs = yaml_config.get('inputs') or {}
+    if not isinstance(rom_inputs or {}, dict):
+        raise ValueError(f"Error: Twin inputs should be a mapping of input names to values, got {type(rom_inputs).__name__}.")
+    for name, value in (rom_inputs or {}).items():
+        if name not in available_inputs:
+            raise ValueError(f"Error: Twin input '{name}' is not valid. Available inputs: {list(available_inputs)}")
+        if isinstance(value, bool) or not isinstance(value, numbers.Real):
+            raise ValueError(f"Error: Twin input '{name}' = {value!r} should be a number.")
+        minimum_value = available_inputs[name].get('minimum_value')
+        maximum_value = available_inputs[name].get('maximum_value')
+        if minimum_value is not None and value < minimum_value:
+            raise ValueError(f"Error: Twin input '{name}' = {value} is below its minimum value {minimum_value}.")
+        if maximum_value is not None and value > maximum_value:
+            raise ValueError(f"Error: Twin input '{name}' = {value} is above its maximum value {maximum_value}.")
     return True
 
 def twin_file_handler(input_data, config, file_dir):
     # Implement logic to handle input file
     operation = input_data['input_parameters']['operation'][0]
-    twin_file = None
-    tbrom_name = None
+    tbrom_name = config['available_operations'][operation]['tbrom']
     
-    for twin in config['twin_files']:
-        twin_dir = os.path.join(file_dir, twin)
-        twin_model = TwinModel(twin_dir)
-        tbrom_names = twin_model.tbrom_names
-        
-        if config['available_operations'][operation]['tbrom'] in tbrom_names:
-            twin_file = twin
-            tbrom_name = config['available_operations'][operation]['tbrom']
-            break
+    # Look the TBROM up in the twin manifest instead of loading every twin file
+    twin_dirs = [os.path.join(file_dir, twin) for twin in config['twin_files']]
+    manifest_path = os.path.join(file_dir, config.get('cache_dir', 'data/cache'), manifest.MANIFEST_FILE)
+    twin_dir = manifest.find_tbrom(twin_dirs, tbrom_name, manifest_path, load_twin)
     
-    if twin_file is None:
+    if twin_dir is None:
         raise ValueError(f"Operation '{operation}' is not supported by any twin file.")
+    twin_file = config['twin_files'][twin_dirs.index(twin_dir)]
 
     return twin_file, tbrom_name
+
+# Twin models loaded during this run, keyed by absolute twin file path
+_twin_models = {}
+
+def load_twin(twin_file, reuse=True):
+    # Load a twin once and reuse it for the rest of the run
+    from pytwin import TwinModel
+    twin_path = os.path.abspath(twin_file)
+    if not reuse:
+        return TwinModel(twin_path)
+    if twin_path not in _twin_models:
+        _twin_models[twin_path] = TwinModel(twin_path)
+    return _twin_models[twin_path]
     
-def initiate_twin(input_data, twin_file):
+def initiate_twin(input_data, twin_file, reuse=True):
     # Initialize other parameters to None)
-    twin_model = TwinModel(twin_file)
+    twin_model = load_twin(twin_file, reuse=reuse)
     try:
         rom_parameters = input_data['twin_inputs'].get('rom_parameters')
         rom_inputs = input_data['twin_inputs'].get('rom_inputs')
@@ -94,6 +163,7 @@ def initiate_twin(input_data, twin_file):
 def extract_mesh(rst_file):  
     
     # Load the Mechanical rst file through PyDPF and extract the mesh
+    import ansys.dpf.core as dpf
     ds = dpf.DataSources()
     ds.set_result_file_path(rst_file)
     streams = dpf.operators.metadata.streams_provider(data_sources=ds)
@@ -107,17 +177,15 @@ def extract_mesh(rst_file):
 def convert_to_meters(grid_coord, mesh_unit):
   # Conversion factors
     conversion_factors = {'mm': 0.001, 'cm': 0.01, 'm': 1, 'km': 1000}
+    factor = conversion_factors.get(mesh_unit, 1)
+    if factor == 1:
+        return grid_coord
 
-    if mesh_unit == 'mm':
-        grid_coord = grid_coord * conversion_factors['mm']
-    elif mesh_unit == 'cm':
-        grid_coord = grid_coord * conversion_factors['cm']
-    elif mesh_unit == 'm':
-        grid_coord = grid_coord * conversion_factors['m']
-    elif mesh_unit == 'km':
-        grid_coord = grid_coord * conversion_factors['km']
-      
-    return grid_coord
+    # Float arrays are scaled in place, in their own precision, scalars and other arrays into a new value
+    if isinstance(grid_coord, np.ndarray) and grid_coord.dtype.kind == 'f' and grid_coord.flags.writeable:
+        grid_coord *= grid_coord.dtype.type(factor)
+        return grid_coord
+    return grid_coord * factor
 
 def named_selections(twin_model, rom_name, mesh):
     # Checking available named selections from twin
@@ -148,6 +216,11 @@ def scoping(named_selections_twin, named_selections_fea, mesh, scoping=None):
         if scoping_lower in named_selections_fea_lower:
             scoping_fea_index = named_selections_fea_lower.index(scoping_lower)
     
+        # Cached meshes are scoped from their stored node sets, without DPF
+        if hasattr(mesh, "scoped"):
+            return scoping_twin_index, scoping_fea_index, mesh.scoped(named_selections_fea[scoping_fea_index])
+        
+        import ansys.dpf.core as dpf
         scoping_fea = mesh.named_selection(named_selections_fea[scoping_fea_index])
         # Mapping mesh from scoping
         mesh_scoping = dpf.operators.mesh.from_scoping(
@@ -160,42 +233,65 @@ def scoping(named_selections_twin, named_selections_fea, mesh, scoping=None):
     
     return scoping_twin_index, scoping_fea_index, mesh
 
-def get_result(twin_model, rom_name, scoping_twin=None):
-    # Get result data and point coordinates
+def twin_scoping(twin_model, rom_name, scoping=None):
+    # Twin named selection matching the scoping (case-insensitive), without the FEA mesh
+    if not scoping or scoping == "All Body":
+        return None
+    named_selections_twin = twin_model.get_named_selections(rom_name)
+    named_selections_twin_lower = [name.lower() for name in named_selections_twin]
+    if scoping.lower() not in named_selections_twin_lower:
+        raise ValueError(f"Named selection '{scoping}' is not available in the twin. Available named selections: {named_selections_twin}")
+    return named_selections_twin[named_selections_twin_lower.index(scoping.lower())]
+
+def get_result(twin_model, rom_name, scoping_twin=None, config=None):
+    # Get result data and point coordinates, rebuilt from the TBROM basis when the config enables it
+    if config is not None:
+        from . import reduced_basis
+        settings = reduced_basis.reduced_basis_settings(config)
+        if settings['enabled']:
+            result = reduced_basis.get_result(twin_model, rom_name, named_selection=scoping_twin, check=settings['verify'])
+            if result is not None:
+                return precision.as_float(result[0], config), precision.as_float(result[1], config)
     outfield = twin_model.generate_snapshot(rom_name, on_disk=False, named_selection=scoping_twin)
     points = twin_model.generate_points(rom_name, on_disk=False, named_selection=scoping_twin)
-    return outfield, points
+    # Every later stage works in the precision of the policy
+    return precision.as_float(outfield, config), precision.as_float(points, config)
 
 def unflatten_vector(vector: np.ndarray, dimensionality: int):
     # Unflatten a vector to array with specified number of columns
     return vector.reshape(-1, dimensionality)
 
-def project_result_on_mesh(result, grid, result_type):
-    # Convert imported data into NumPy array
-    result_data = result.values
-    nd_result_data = result_data[:,:].astype(float) 
+def project_result_on_mesh(result, grid, result_type, cache_dir=None):
+    # Map the result to MAPDL grid through the cached projection operator, straight from its buffers
+    from . import projection
+    operator = projection.projection_operator(grid.points, result.points, cache_dir=cache_dir)
+    inter_grid = projection.project_fields(grid, operator, {result_type: result.values})
     
-    # Convert imported data into PolyData format
-    wrapped = pv.PolyData(nd_result_data[:, :3])  
-    wrapped[result_type] = nd_result_data[:, 3]  
-
-    # Map the imported data to MAPDL grid
-    inter_grid = grid.interpolate(
-    wrapped, sharpness=5, radius=0.0001, strategy="closest_point", progress_bar=True)  # Map the imported data to MAPDL grid
-    
-    result_load_val = pv.convert_array(
-        pv.convert_array(inter_grid.active_scalars)
-    )  # Save result interpolated to each node as a NumPy array
+    result_load_val = inter_grid[result_type]  # Save result interpolated to each node as a NumPy array
     return inter_grid, result_load_val
 
-def deflection_handler(input_data, config, main_dir, result_mesh):
+def project_results_on_mesh(grouped_results, grid, cache_dir=None):
+    # Project the results of every TBROM group together onto one multi-field grid
+    from . import projection
+    inter_grid = None
+    for results in grouped_results.values():
+        # Results of one group share the ROM points, hence one operator and one batched product
+        operator = projection.projection_operator(grid.points, results[0].points, cache_dir=cache_dir)
+        fields = {result.name: result.values for result in results}
+        inter_grid = projection.project_fields(grid, operator, fields, target=inter_grid)
+    first_result = next(iter(grouped_results.values()))[0]
+    inter_grid.set_active_scalars(first_result.name)
+    return inter_grid
+
+def deflection_handler(input_data, config, main_dir, result_mesh, context=None):
+    from . import deflect_mesh
     deformation_scale = input_data["input_parameters"]["deformation_scale"]
     if deformation_scale  == "Undeformed":
         pass
     elif deformation_scale in config["available_deformation_scales"]:
         scale_parameter = 0
         scale_factor_ow = False
-        def_result_load_val, disp_mesh = deflect_mesh.get_disp_result(input_data, main_dir)
+        def_result_load_val, disp_mesh = deflect_mesh.get_disp_result(input_data, main_dir, context=context)
         if deformation_scale == "True Scale":
             scale_factor_ow = True
         elif deformation_scale == "0.5 Auto":
@@ -206,7 +302,9 @@ def deflection_handler(input_data, config, main_dir, result_mesh):
             scale_parameter = 2
         elif deformation_scale == "5x Auto":
             scale_parameter = 5
-        result_mesh = deflect_mesh.get_deflected_mesh(result_mesh, config, input_data, def_result_load_val, scale_parameter, scale_factor_ow)
+        cache_dir = context.cache_dir() if context is not None else None
+        result_mesh = deflect_mesh.get_deflected_mesh(result_mesh, config, input_data, def_result_load_val, scale_parameter, scale_factor_ow,
+                                                      main_dir=main_dir, cache_dir=cache_dir)
     else:
         raise ValueError(f"Invalid deformation scale: {input_data['input_parameters']['deformation_scale']}. Avalailable deformation scales: {config['available_deformation_scales']}")
 
@@ -219,23 +317,33 @@ def plot_result (inter_grid, show_edges=True):
 def export_to_3d_file(inter_grid, output_dir, input_data):
     # Get input parameters
     output_type = input_data["output_files"]["3d_file"]["output_format"]
-    result_detail = "_".join(input_data["input_parameters"]["operation"])
     show_edges = input_data["output_files"]["3d_file"]["show_edges"]
     
+    output_file = os.path.join(output_dir, result_detail(input_data))
+    
+    # Binary glTF is written straight from the arrays, without a render window
+    if output_type == 'glb':
+        from . import gltf
+        quantize = input_data["output_files"]["3d_file"].get("quantize", False)
+        return gltf.write_glb(inter_grid, f"{output_file}.glb", quantize=quantize)
+    
     # Export to 3D file
-    plotter = pv.Plotter()
+    import pyvista as pv
+    plotter = pv.Plotter(off_screen=True)
     plotter.add_mesh(inter_grid, show_edges=show_edges)
     
-    output_file = os.path.join(output_dir, result_detail)
-    
     if output_type == 'gltf':
-        plotter.export_gltf(f"{output_file}.gltf")
+        output_file = f"{output_file}.gltf"
+        plotter.export_gltf(output_file)
     elif output_type == 'vrml':
-        plotter.export_vrml(f"{output_file}.wrl")
+        output_file = f"{output_file}.wrl"
+        plotter.export_vrml(output_file)
     elif output_type == 'obj':
-        plotter.export_obj(f"{output_file}.obj")
+        output_file = f"{output_file}.obj"
+        plotter.export_obj(output_file)
     else:
-        raise ValueError("Invalid output type. Please provide 'gltf', 'vrml', or 'obj'.") 
+        raise ValueError("Invalid output type. Please provide 'glb', 'gltf', 'vrml', or 'obj'.") 
+    return output_file
 
 def get_unit(input_data, config):
     available_operations = config["available_operations"]
@@ -256,7 +364,33 @@ def get_unit(input_data, config):
     
     return None
 
-def run_script(input_data, config, result_data):
+def scripts_need_masks(input_data, config):
+    # Whether any requested script reports per named selection
+    return any(config["scripts"].get(script_key, {}).get("per_named_selection") for script_key in input_data["output_files"]["scripts"])
+
+def named_selection_masks(twin_model, rom_name, scoping_twin=None):
+    # Boolean mask of every twin named selection over the (scoped) ROM points, matched by coordinates
+    from scipy.spatial import cKDTree
+    points = unflatten_vector(twin_model.generate_points(rom_name, on_disk=False, named_selection=scoping_twin), 3)
+    tree = cKDTree(points)
+    masks = {}
+    for name in twin_model.get_named_selections(rom_name):
+        ns_points = unflatten_vector(twin_model.generate_points(rom_name, on_disk=False, named_selection=name), 3)
+        distances, indices = tree.query(ns_points, k=1)
+        mask = np.zeros(len(points), dtype=bool)
+        mask[indices[np.isclose(distances, 0)]] = True  # Points outside the scoping are dropped
+        masks[name] = mask
+    return masks
+
+def method_options(method, options):
+    # Options accepted by a script method, all of them if it takes **kwargs
+    parameters = inspect.signature(method).parameters.values()
+    if any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters):
+        return options
+    names = {parameter.name for parameter in parameters}
+    return {name: value for name, value in options.items() if name in names}
+
+def run_script(input_data, config, result_data, masks=None):
     # Store results for all scripts and their methods
     script_results = {}
 
@@ -272,20 +406,25 @@ def run_script(input_data, config, result_data):
         # Dynamically import the script module
         script_module = importlib.import_module(f"scripts.{script_name}")
         
+        # Keyword options of the script, plus the named selection masks if it reports per named selection
+        options = dict(script_config.get("options") or {})
+        if script_config.get("per_named_selection"):
+            options["masks"] = masks
+        
         # Collect results for all methods in this script
         method_results = {}
         for method_name in script_config["methods"]:
             # Dynamically get the method from the script module
             method = getattr(script_module, method_name)
-            # Execute the method and store the result (if the method takes arguments, you may need to pass them)
-            method_results[method_name] = method(result_data)  # Adjust if you need to pass arguments
+            # Execute the method with the options it accepts and store the result
+            method_results[method_name] = method(result_data, **method_options(method, options))
         
         # Store the method results for the script
         script_results[script_name] = method_results
     
     return script_results
 
-def export_output_data_to_json(output_file, result_unit, named_selection, twin_outputs=None, output_parameters=None):
+def export_output_data_to_json(output_file, result_unit, named_selection, twin_outputs=None, output_parameters=None, timings=None):
     # Structure the data in a dictionary
     data = {
         "twin_outputs": twin_outputs,
@@ -294,6 +433,10 @@ def export_output_data_to_json(output_file, result_unit, named_selection, twin_o
         "named_selection": named_selection
     }
     
+    # Stage timings of the run, when traced
+    if timings is not None:
+        data["timings"] = timings
+    
     # Write the dictionary to a JSON file
     with open(output_file, "w") as f:
         json.dump(data, f, indent=4)
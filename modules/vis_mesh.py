@@ -0,0 +1,104 @@
+from . import gltf
+import os
+import json
+import time
+import numpy as np
+import pyvista as pv
+
+# Surface levels of detail built during this run, keyed by mesh topology and reduction
+_levels = {}
+
+def visualization_settings(config):
+    # Visualization section of the config, the full volumetric grid is exported when it is missing
+    settings = dict(config.get('visualization') or {})
+    settings.setdefault('surface_formats', [])
+    settings.setdefault('lod_levels', [0.0])
+    settings.setdefault('format_lod', {})
+    settings.setdefault('lod_report', False)
+    return settings
+
+def surface_level(grid, reduction=0.0, cache_dir=None):
+    # Grid node ids and triangles of the outer surface, decimated by the target reduction
+    key = f"{gltf.topology_key(grid)}_{reduction}"
+    if key in _levels:
+        return _levels[key]
+
+    cache_file = os.path.join(cache_dir, "vis_mesh", f"{key}.npz") if cache_dir else None
+    if cache_file and os.path.exists(cache_file):
+        with np.load(cache_file) as data:
+            level = {"point_ids": data["point_ids"], "triangles": data["triangles"]}
+    else:
+        topology = gltf.surface_topology(grid)
+        level = topology
+        if reduction > 0:
+            # Decimation keeps a subset of the surface nodes, so fields and deflections map back by node id
+            surface = triangle_mesh(np.asarray(grid.points)[topology["point_ids"]], topology["triangles"])
+            surface.point_data["node_ids"] = topology["point_ids"]
+            decimated = surface.decimate_pro(reduction)
+            level = {
+                "point_ids": np.asarray(decimated.point_data["node_ids"], dtype=np.int64),
+                "triangles": np.ascontiguousarray(np.asarray(decimated.faces, dtype=np.uint32).reshape(-1, 4)[:, 1:]),
+            }
+        if cache_file:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            np.savez(cache_file, **level)
+
+    _levels[key] = level
+    return level
+
+def triangle_mesh(points, triangles):
+    faces = np.column_stack([np.full(len(triangles), 3, dtype=np.int64), triangles]).ravel()
+    return pv.PolyData(np.asarray(points), faces)
+
+def visualization_mesh(grid, reduction=0.0, cache_dir=None):
+    # Surface mesh of one level of detail carrying the current point positions and every point field
+    level = surface_level(grid, reduction, cache_dir=cache_dir)
+    point_ids = level["point_ids"]
+    mesh = triangle_mesh(np.asarray(grid.points)[point_ids], level["triangles"])
+    for name in grid.point_data.keys():
+        mesh.point_data[name] = np.asarray(grid.point_data[name])[point_ids]
+    if grid.active_scalars_name:
+        mesh.set_active_scalars(grid.active_scalars_name)
+    return mesh
+
+def export_reduction(config, input_data):
+    # Target reduction of the level of detail selected by the output format, or by the 3d_file input
+    settings = visualization_settings(config)
+    file_settings = input_data["output_files"]["3d_file"]
+    level = file_settings.get("lod", settings['format_lod'].get(file_settings["output_format"], 0))
+    if not 0 <= level < len(settings['lod_levels']):
+        raise ValueError(f"Invalid level of detail: {level}. Available levels: 0 to {len(settings['lod_levels']) - 1}.")
+    return settings['lod_levels'][level]
+
+def prepare(result_mesh, config, input_data, cache_dir=None):
+    # Mesh sent to plotting and 3D export: the full grid, or its surface at the selected level of detail
+    if input_data["output_files"]["3d_file"]["output_format"] not in visualization_settings(config)['surface_formats']:
+        return result_mesh
+    return visualization_mesh(result_mesh, export_reduction(config, input_data), cache_dir=cache_dir)
+
+def lod_report(grid, reductions, output_dir, cache_dir=None):
+    # Vertex and triangle counts, .glb size and preparation time of every level of detail, saved as lod_report.json
+    os.makedirs(output_dir, exist_ok=True)
+    rows = []
+    for index, reduction in enumerate(reductions):
+        start = time.perf_counter()
+        mesh = visualization_mesh(grid, reduction, cache_dir=cache_dir)
+        prepare_s = time.perf_counter() - start
+        output_file = gltf.write_glb(mesh, os.path.join(output_dir, f"lod_{index}.glb"))
+        rows.append({
+            "level": index,
+            "reduction": reduction,
+            "vertices": mesh.n_points,
+            "triangles": mesh.n_cells,
+            "size_mb": os.path.getsize(output_file) / 1e6,
+            "prepare_ms": prepare_s * 1e3,
+        })
+    with open(os.path.join(output_dir, "lod_report.json"), "w") as f:
+        json.dump(rows, f, indent=4)
+    return rows
+
+def print_lod_report(rows):
+    print(f"{'level':<12} {'vertices':>10} {'triangles':>10} {'size [MB]':>10} {'prepare [ms]':>13}")
+    for row in rows:
+        label = f"lod {row['level']} ({row['reduction']:.0%})"
+        print(f"{label:<12} {row['vertices']:>10} {row['triangles']:>10} {row['size_mb']:10.2f} {row['prepare_ms']:13.1f}")
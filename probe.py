@@ -0,0 +1,35 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from modules import utility, session, probe
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual sensors: twin results at the coordinates of a CSV file")
+    parser.add_argument("coordinates", help="CSV file with x, y and z columns, in meters")
+    parser.add_argument("--operation", action="append", dest="operations", default=None,
+                        help="Operation to probe, repeatable (default: every operation of the input TBROM)")
+    parser.add_argument("--method", choices=probe.PROBE_METHODS, default=None, help="Default: probe method of config.yaml")
+    parser.add_argument("--output", default="data/output/probe_results.csv")
+    args = parser.parse_args()
+
+    file_dir = os.path.dirname(os.path.abspath(__file__))
+    config = utility.load_config(os.path.join(file_dir, 'config.yaml'))
+    input_data = utility.load_json(os.path.join(file_dir, "data/input/", 'input_data.json'))
+    utility.validate_parameters(input_data, config)
+    coordinates = pd.read_csv(args.coordinates)[["x", "y", "z"]].to_numpy(dtype=float)
+
+    twin_session = session.TwinSession(config, input_data, file_dir)
+    response = twin_session.probe({"coordinates": coordinates, "operations": args.operations, "method": args.method})
+    probed = {
+        "distance": np.asarray(response["distance"]),
+        "values": {name: np.asarray(values, dtype=float) for name, values in response["values"].items()},
+    }
+
+    output_file = os.path.join(file_dir, args.output)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    probe.probe_table(coordinates, probed).to_csv(output_file, index=False)
+    print(f"{len(coordinates)} probe(s) evaluated in {response['evaluation_ms']:.1f} ms, results written to {output_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import numpy as np
+from .obtain_max_min import result_arrays
+
+DEFAULT_PERCENTILES = [50, 90, 95, 99]
+
+class QuantileSketch:
+    # Mergeable log-bucket histogram (DDSketch): every quantile is within relative_accuracy of an actual value,
+    # memory grows with the log of the value range instead of the number of values
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def update(self, values):
+        self.zeros += int(np.count_nonzero(values == 0))
+        for buckets, magnitudes in ((self.positive, values[values > 0]), (self.negative, -values[values < 0])):
+            if len(magnitudes):
+                keys, counts = np.unique(np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64), return_counts=True)
+                for key, count in zip(keys.tolist(), counts.tolist()):
+                    buckets[key] = buckets.get(key, 0) + count
+        self.count += len(values)
+        return self
+
+    def bucket_value(self, key):
+        # Value with the same relative distance to both bucket bounds
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantiles(self, percentiles):
+        # Buckets in increasing order of value: negatives by decreasing magnitude, zeros, positives
+        buckets = [(-self.bucket_value(key), count) for key, count in sorted(self.negative.items(), reverse=True)]
+        buckets += [(0.0, self.zeros)] if self.zeros else []
+        buckets += [(self.bucket_value(key), count) for key, count in sorted(self.positive.items())]
+        values = np.array([value for value, _ in buckets])
+        cumulative = np.cumsum([count for _, count in buckets])
+        ranks = np.asarray(percentiles, dtype=float) / 100 * (self.count - 1)
+        return values[np.searchsorted(cumulative, ranks, side='right')].tolist()
+
+class FieldStatistics:
+    # Running statistics of a result field, updated batch by batch (e.g. the cases of a sweep)
+    def __init__(self, percentiles=DEFAULT_PERCENTILES, top_k=10, thresholds=(), relative_accuracy=0.01):
+        self.percentiles = list(percentiles)
+        self.top_k = top_k
+        self.thresholds = list(thresholds)
+        self.count = 0
+        self.total = 0.0
+        self.max = {'points': None, 'result': -np.inf}
+        self.min = {'points': None, 'result': np.inf}
+        self.top_values = np.empty(0)
+        self.top_points = np.empty((0, 3))
+        self.exceedances = np.zeros(len(self.thresholds), dtype=np.int64)
+        self.batches = 0
+        # Exact percentiles of the first batch, the sketch over every batch
+        self.first_percentiles = None
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def update(self, points, values):
+        points, values = np.asarray(points), np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        if not valid.all():
+            points, values = points[valid], values[valid]
+        if len(values) == 0:
+            return self
+
+        self.count += len(values)
+        self.total += float(values.sum())
+
+        max_index, min_index = int(values.argmax()), int(values.argmin())
+        if values[max_index] > self.max['result']:
+            self.max = {'points': points[max_index].tolist(), 'result': float(values[max_index])}
+        if values[min_index] < self.min['result']:
+            self.min = {'points': points[min_index].tolist(), 'result': float(values[min_index])}
+
+        # Top-k hot spots: merge the previous top-k with the k largest values of the batch
+        k = min(self.top_k, len(values))
+        batch_top = np.argpartition(values, -k)[-k:] if k else np.empty(0, dtype=int)
+        merged_values = np.concatenate([self.top_values, values[batch_top]])
+        merged_points = np.concatenate([self.top_points, points[batch_top]])
+        order = np.argsort(merged_values)[::-1][:self.top_k]
+        self.top_values, self.top_points = merged_values[order], merged_points[order]
+
+        if self.thresholds:
+            self.exceedances += (values[:, None] > np.asarray(self.thresholds)[None, :]).sum(axis=0)
+        if self.percentiles:
+            if self.batches == 0:
+                self.first_percentiles = np.percentile(values, self.percentiles).tolist()
+            self.sketch.update(values)
+        self.batches += 1
+        return self
+
+    def result(self):
+        data = {
+            'count': self.count,
+            'max': self.max,
+            'min': self.min,
+            'mean': self.total / self.count if self.count else None,
+            'top_k': [
+                {'points': point.tolist(), 'result': float(value)}
+                for point, value in zip(self.top_points, self.top_values)
+            ],
+            'exceedances': {str(threshold): int(count) for threshold, count in zip(self.thresholds, self.exceedances)},
+        }
+        if self.percentiles and self.batches == 1:
+            # Exact percentiles of a single field
+            data['percentiles'] = dict(zip(map(str, self.percentiles), self.first_percentiles))
+        elif self.percentiles and self.batches:
+            # Percentiles over every batch, within relative_accuracy
+            data['percentiles'] = dict(zip(map(str, self.percentiles), self.sketch.quantiles(self.percentiles)))
+            data['percentile_relative_accuracy'] = self.sketch.relative_accuracy
+        return data
+
+def obtain_statistics(result_data, percentiles=DEFAULT_PERCENTILES, top_k=10, thresholds=(), masks=None):
+    # Statistics of the whole field, and of every named selection when node masks are given
+    points, values = result_arrays(result_data)
+    statistics = {'All Body': FieldStatistics(percentiles, top_k, thresholds).update(points, values).result()}
+    for name, mask in (masks or {}).items():
+        statistics[name] = FieldStatistics(percentiles, top_k, thresholds).update(points[mask], values[mask]).result()
+    return statistics
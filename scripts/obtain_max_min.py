@@ -1,30 +1,37 @@
+import numpy as np
+
+def result_arrays(result_data):
+    # Coordinates (N, 3) and result values (N,) of an operation result, without row lookups
+    if isinstance(result_data, tuple):
+        points, values = result_data
+        return np.asarray(points), np.asarray(values)
+    if hasattr(result_data, "points"):
+        return np.asarray(result_data.points), np.asarray(result_data.values)
+    # Legacy x, y, z, result DataFrame
+    values = result_data.values
+    return values[:, :3], values[:, 3]
+
 def obtain_max(result_data):
     # Find the row with the maximum value in the result column 
-    max_row = result_data.loc[result_data.iloc[:, 3].idxmax()]
-    
-    # Extract location (columns 1, 2, and 3) and the result (column 4)
-    max_location = max_row.iloc[:3].tolist()  # Convert to list for easier handling
-    max_result = max_row.iloc[3]
+    points, values = result_arrays(result_data)
+    max_index = int(np.nanargmax(values))
    
     max_result_info = {
-        'points': max_location,
-        'result': max_result
+        'points': points[max_index].tolist(),
+        'result': values[max_index].item()
     } 
     
     return max_result_info
 
 
 def obtain_min(result_data):
-    # Find the row with the maximum value in the result column 
-    min_row = result_data.loc[result_data.iloc[:, 3].idxmin()]
-    
-    # Extract location (columns 1, 2, and 3) and the result (column 4)
-    min_location = min_row.iloc[:3].tolist()  # Convert to list for easier handling
-    min_result = min_row.iloc[3]
+    # Find the row with the minimum value in the result column 
+    points, values = result_arrays(result_data)
+    min_index = int(np.nanargmin(values))
    
     min_result_info = {
-        'points': min_location,
-        'result': min_result
+        'points': points[min_index].tolist(),
+        'result': values[min_index].item()
     } 
     
-    return min_result_info
\ No newline at end of file
+    return min_result_info
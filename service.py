@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from modules import utility, session, memo, tracing
+
+class TwinService:
+    # Long-running twin service: a pool of warm sessions behind an asyncio front end
+    def __init__(self, config, input_data, main_dir, workers=2, max_pending=32):
+        print("++ Loading the FEA mesh")
+        mesh_artifacts = session.load_mesh_artifacts(input_data, main_dir, config)
+
+        # One snapshot memo for all sessions, so repeated inputs hit whichever session serves them
+        self.memo = None
+        if memo.memo_settings(config)['enabled']:
+            cache_dir = os.path.join(main_dir, config['cache_dir']) if config.get('cache_dir') else None
+            self.memo = memo.SnapshotMemo.from_config(config, cache_dir=cache_dir)
+
+        # Stage timings of every session, exported on /metrics
+        self.stage_metrics = tracing.StageMetrics()
+
+        print(f"++ Initializing {workers} twin session(s)")
+        self.sessions = queue.Queue()
+        for _ in range(workers):
+            twin_session = session.TwinSession(config, input_data, main_dir, mesh_artifacts=mesh_artifacts, memo=self.memo, stage_metrics=self.stage_metrics)
+            # Warm up the twin of the default operation so the first request is not a cold start
+            twin_session.twin(input_data)
+            self.sessions.put(twin_session)
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = asyncio.Semaphore(max_pending)
+        self.max_pending = max_pending
+        self.latencies = []
+        self.errors = 0
+
+    def _evaluate(self, request):
+        twin_session = self.sessions.get()
+        try:
+            return twin_session.evaluate(request)
+        finally:
+            self.sessions.put(twin_session)
+
+    def _probe(self, request):
+        twin_session = self.sessions.get()
+        try:
+            return twin_session.probe(request)
+        finally:
+            self.sessions.put(twin_session)
+
+    async def evaluate(self, request, handler=None):
+        # Reject instead of queueing without bound when every slot is busy
+        if self.pending.locked():
+            return 503, {"error": f"Service busy, {self.max_pending} requests already pending."}
+
+        start = time.perf_counter()
+        async with self.pending:
+            loop = asyncio.get_running_loop()
+            try:
+                response = await loop.run_in_executor(self.executor, handler or self._evaluate, request)
+                status = 200
+            except ValueError as e:
+                response, status = {"error": str(e)}, 400
+            except Exception as e:
+                response, status = {"error": str(e)}, 500
+                self.errors += 1
+        latency_ms = (time.perf_counter() - start) * 1000
+        response["latency_ms"] = latency_ms
+        if status == 200:
+            self.latencies.append(latency_ms)
+        print(f"request status={status} latency={latency_ms:.1f} ms")
+        return status, response
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        data = {"requests": len(latencies), "errors": self.errors}
+        if latencies:
+            data["latency_ms"] = {
+                "mean": statistics.mean(latencies),
+                "p50": latencies[int(0.50 * (len(latencies) - 1))],
+                "p95": latencies[int(0.95 * (len(latencies) - 1))],
+                "p99": latencies[int(0.99 * (len(latencies) - 1))],
+                "max": latencies[-1],
+            }
+        if self.memo:
+            data["memo"] = self.memo.stats()
+        return data
+
+    def metrics(self):
+        # Prometheus text exposition of the request, stage and memo counters
+        latencies = sorted(self.latencies)
+        quantiles = None
+        if latencies:
+            quantiles = {q: latencies[int(q * (len(latencies) - 1))] / 1000 for q in (0.5, 0.95, 0.99)}
+        return tracing.prometheus_text(
+            self.stage_metrics.snapshot(),
+            requests=len(latencies),
+            errors=self.errors,
+            latency_quantiles=quantiles,
+            memo_stats=self.memo.stats() if self.memo else None,
+        )
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/stats":
+            return 200, self.stats()
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics()
+        handlers = {"/evaluate": self._evaluate, "/probe": self._probe}
+        if method == "POST" and path in handlers:
+            try:
+                request = json.loads(body or b"{}")
+            except json.JSONDecodeError as e:
+                return 400, {"error": f"Invalid JSON body: {e}"}
+            if not isinstance(request, dict):
+                return 400, {"error": f"The JSON body must be an object, got {type(request).__name__}."}
+            return await self.evaluate(request, handler=handlers[path])
+        return 404, {"error": f"Unknown route {method} {path}"}
+
+    async def read_request(self, reader):
+        # (method, path, body) of one HTTP request, None when the client sent nothing; ValueError when malformed
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.decode().split(" ", 2)
+        if len(parts) != 3:
+            raise ValueError(f"Malformed request line: {request_line[:80]!r}")
+        method, path, _ = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, separator, value = line.decode().partition(":")
+            if not separator:
+                raise ValueError(f"Malformed header: {line[:80]!r}")
+            headers[name.strip().lower()] = value.strip()
+        content_length = int(headers.get("content-length", 0))
+        if content_length < 0:
+            raise ValueError(f"Invalid Content-Length: {content_length}")
+        try:
+            body = await reader.readexactly(content_length)
+        except asyncio.IncompleteReadError as e:
+            raise ValueError(f"Body shorter than Content-Length: {len(e.partial)} of {content_length} bytes") from None
+        return method, path, body
+
+    async def handle_connection(self, reader, writer):
+        # Minimal HTTP/1.1 handling, one request per connection
+        try:
+            try:
+                request = await self.read_request(reader)
+            except ValueError as e:
+                # Also covers undecodable bytes and a non-numeric Content-Length
+                request, status, response = None, 400, {"error": f"Bad request: {e}"}
+            else:
+                if request is None:
+                    return
+                status, response = await self.route(*request)
+            # Text responses (metrics) go out as is, everything else as JSON
+            if isinstance(response, str):
+                payload, content_type = response.encode(), "text/plain; version=0.0.4"
+            else:
+                payload, content_type = json.dumps(response).encode(), "application/json"
+            reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error", 503: "Service Unavailable"}[status]
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+async def serve(service, host=None, port=None, socket_path=None):
+    if socket_path:
+        server = await asyncio.start_unix_server(service.handle_connection, path=socket_path)
+        print(f"++ Twin service listening on {socket_path}")
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+        print(f"++ Twin service listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm digital twin service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", default=None, help="Serve on a local UNIX socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=2, help="Number of warm twin sessions")
+    parser.add_argument("--max-pending", type=int, default=32, help="Requests accepted before answering 503")
+    args = parser.parse_args()
+
+    file_dir = os.path.dirname(os.path.abspath(__file__))
+    config = utility.load_config(os.path.join(file_dir, 'config.yaml'))
+    input_data = utility.load_json(os.path.join(file_dir, "data/input/", 'input_data.json'))
+    utility.validate_parameters(input_data, config)
+
+    async def run():
+        service = TwinService(config, input_data, file_dir, workers=args.workers, max_pending=args.max_pending)
+        await serve(service, args.host, args.port, args.socket)
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
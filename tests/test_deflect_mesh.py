@@ -0,0 +1,20 @@
+import os
+import numpy as np
+from modules import utility, deflect_mesh
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_auto_scale_with_the_shipped_config():
+    config = utility.load_config(os.path.join(ROOT, "config.yaml"))
+    input_data = utility.load_json(os.path.join(ROOT, "data/input/input_data.json"))
+    # Unit cube in meters, the displacement in the TBROM unit (mm)
+    points = np.array([[x, y, z] for x in (0.0, 1.0) for y in (0.0, 1.0) for z in (0.0, 1.0)])
+    displacement = np.zeros((len(points), 3))
+    displacement[:, 0] = 1.0
+    displacement[-1, 2] = -4.0
+    extent = np.sqrt(3)
+    for operation, max_mm in ((["displacement", "ux"], 1.0), (["displacement", "uz"], 4.0), (["displacement", "norm"], np.sqrt(17))):
+        operation_input = utility.operation_input(input_data, operation)
+        scale = deflect_mesh.deflection_scale(config, operation_input, points, displacement)
+        assert np.isclose(scale, config["autoscale"] / 100 * extent / (max_mm / 1000))
+    assert deflect_mesh.deflection_scale(config, operation_input, points, np.zeros_like(points)) == 0.0
@@ -0,0 +1,13 @@
+import numpy as np
+from scipy.spatial.distance import pdist
+from modules import extent
+
+def test_farthest_pair_is_exact_with_small_blocks():
+    rng = np.random.default_rng(0)
+    sphere = rng.normal(size=(2000, 3))
+    sphere /= np.linalg.norm(sphere, axis=1)[:, None]
+    beam = rng.random((2000, 3)) * [20.0, 1.0, 0.5]
+    for points in (sphere, beam):
+        # Blocks of a few rows exercise the byte budget
+        assert np.isclose(extent.farthest_pair_distance(points, max_bytes=1 << 16), pdist(points).max())
+        assert np.isclose(extent.hull_diameter(points), pdist(points).max())
@@ -0,0 +1,22 @@
+import numpy as np
+from scripts.field_statistics import FieldStatistics
+from scripts import obtain_max_min
+from modules.utility import method_options
+
+def test_percentiles_merge_every_batch():
+    rng = np.random.default_rng(0)
+    statistics = FieldStatistics(relative_accuracy=0.01)
+    batches = [rng.normal(0, 1e6, 1000) for _ in range(10)]
+    for values in batches:
+        statistics.update(rng.random((len(values), 3)), values)
+    result = statistics.result()
+    exact = np.percentile(np.concatenate(batches), [50, 90, 95, 99])
+    # The sketch is within the relative accuracy of a value near the rank, the median lies in a dense region
+    assert np.allclose(list(result['percentiles'].values())[1:], exact[1:], rtol=0.03)
+    assert result['count'] == 10000
+
+def test_options_are_passed_to_the_methods_that_accept_them():
+    options = {"percentiles": [50], "masks": None}
+    assert method_options(obtain_max_min.obtain_max, options) == {}
+    assert method_options(lambda result_data, masks=None: None, options) == {"masks": None}
+    assert method_options(lambda result_data, **kwargs: None, options) == options
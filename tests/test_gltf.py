@@ -0,0 +1,18 @@
+import numpy as np
+import pyvista as pv
+from modules import gltf
+
+def test_quantized_position_bounds_are_the_stored_integers(tmp_path):
+    grid = pv.Sphere(radius=2.0, center=(1.0, 0.0, -3.0)).cast_to_unstructured_grid()
+    grid["result"] = grid.points[:, 0]
+    output_file = str(tmp_path / "sphere.glb")
+    gltf.write_glb(grid, output_file, scalars="result", quantize=True)
+    document, binary = gltf.read_glb(output_file)
+    position = document["accessors"][document["meshes"][0]["primitives"][0]["attributes"]["POSITION"]]
+    assert position["componentType"] == gltf.SHORT and position["normalized"]
+
+    # glTF bounds are not affected by `normalized`: they are the raw int16 values of the buffer
+    view = document["bufferViews"][position["bufferView"]]
+    stored = np.frombuffer(binary, dtype=np.int16, count=position["count"] * 4, offset=view["byteOffset"]).reshape(-1, 4)[:, :3]
+    assert position["min"] == stored.min(axis=0).tolist()
+    assert position["max"] == stored.max(axis=0).tolist()
@@ -0,0 +1,111 @@
+import json
+import asyncio
+import threading
+import pytest
+from modules import ingest
+
+CONFIG = {"inputs": {"Force_Magnitude": {"minimum_value": 2900, "maximum_value": 3100}}}
+TOPIC = "sensors/load"
+
+def reading(index):
+    return json.dumps({"timestamp": index, "Force_Magnitude": 3000 + index % 50})
+
+class StubEvaluator:
+    # Records the size of every batch, blocks while `release` is cleared and fails on the batch `fail_on`
+    def __init__(self, fail_on=None):
+        self.sizes = []
+        self.release = threading.Event()
+        self.release.set()
+        self.fail_on = fail_on
+
+    def __call__(self, readings):
+        self.release.wait(5)
+        if len(self.sizes) == self.fail_on:
+            raise RuntimeError("batch failed")
+        self.sizes.append(len(readings))
+        return {"readings": len(readings)}
+
+async def subscribed(broker):
+    # broker_source subscribes when its feeder starts iterating
+    while not broker.subscriptions.get(TOPIC):
+        await asyncio.sleep(0)
+
+def test_batches_and_rejections():
+    evaluator = StubEvaluator()
+    records = []
+
+    async def scenario():
+        broker = ingest.LocalBroker(queue_size=16)
+        pipeline = ingest.IngestPipeline(CONFIG, evaluator, records.append, batch_size=4, max_delay=1.0, queue_size=16)
+        run = asyncio.create_task(pipeline.run([ingest.broker_source(broker, TOPIC)]))
+        await subscribed(broker)
+        for index in range(10):
+            await broker.publish(TOPIC, reading(index))
+        # Not JSON, out of range and without twin inputs
+        for payload in ("not json", json.dumps({"Force_Magnitude": 5000}), json.dumps({"timestamp": 1})):
+            await broker.publish(TOPIC, payload)
+        await broker.close(TOPIC)
+        return await run
+
+    with pytest.raises(ValueError):
+        ingest.parse_reading("not json", CONFIG)
+    stats = asyncio.run(scenario())
+    assert evaluator.sizes == [4, 4, 2]
+    assert [record["readings"] for record in records] == [4, 4, 2]
+    assert stats["readings"] == 10
+    assert stats["rejected"] == 3
+    assert stats["batches"] == 3
+
+def test_backpressure_pauses_the_source():
+    evaluator = StubEvaluator()
+    evaluator.release.clear()
+    batch_size, queue_size, total = 2, 2, 20
+    published = []
+
+    async def publisher(broker):
+        for index in range(total):
+            await broker.publish(TOPIC, reading(index))
+            published.append(index)
+        await broker.close(TOPIC)
+
+    async def scenario():
+        broker = ingest.LocalBroker(queue_size=1)
+        pipeline = ingest.IngestPipeline(CONFIG, evaluator, lambda record: None, batch_size=batch_size, max_delay=0.01, queue_size=queue_size)
+        run = asyncio.create_task(pipeline.run([ingest.broker_source(broker, TOPIC)]))
+        await subscribed(broker)
+        publishing = asyncio.create_task(publisher(broker))
+        await asyncio.sleep(0.2)
+        # The first batch is being evaluated: the pipeline queue, the reading held by the feeder
+        # and the broker queue are full, so publishing waits
+        stalled = len(published)
+        assert pipeline.queue.qsize() == queue_size
+        evaluator.release.set()
+        stats = await run
+        await publishing
+        return stalled, stats
+
+    stalled, stats = asyncio.run(scenario())
+    assert stalled <= batch_size + queue_size + 2
+    assert len(published) == total
+    assert stats["readings"] == total
+    assert sum(evaluator.sizes) == total
+    assert max(evaluator.sizes) <= batch_size
+
+def test_failed_batch_stops_every_task():
+    evaluator = StubEvaluator(fail_on=1)
+
+    async def scenario():
+        broker = ingest.LocalBroker(queue_size=16)
+        pipeline = ingest.IngestPipeline(CONFIG, evaluator, lambda record: None, batch_size=2, max_delay=0.01, queue_size=2)
+        run = asyncio.create_task(pipeline.run([ingest.broker_source(broker, TOPIC)]))
+        await subscribed(broker)
+        for index in range(8):
+            await broker.publish(TOPIC, reading(index))
+        await broker.close(TOPIC)
+        with pytest.raises(RuntimeError):
+            await run
+        # Feeders and the closer, waiting for room in the full queue, are cancelled and awaited with the failed run
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert asyncio.run(scenario()) == []
+    assert evaluator.sizes == [2]
@@ -0,0 +1,26 @@
+import os
+import numpy as np
+from modules import memo
+
+class StubTwin:
+    outputs = {}
+
+    def __init__(self, model_filepath):
+        self._model_filepath = model_filepath
+
+def test_persisted_snapshots_are_keyed_by_the_model(tmp_path):
+    twin_file = tmp_path / "model.twin"
+    twin_file.write_bytes(b"trained")
+    twin_inputs = {"rom_inputs": {"Force_Magnitude": 3000.0}}
+    stamp = memo.model_stamp(StubTwin(str(twin_file)), {})
+    memo.SnapshotMemo(cache_dir=str(tmp_path)).store("rom", "All Body", twin_inputs, np.ones(6), np.zeros((1, 3)), {}, stamp)
+
+    # A new run reads the snapshot back from cache_dir/memo
+    assert memo.SnapshotMemo(cache_dir=str(tmp_path)).lookup("rom", "All Body", twin_inputs, stamp) is not None
+    # Another precision or a retrained twin misses
+    float32 = memo.model_stamp(StubTwin(str(twin_file)), {"precision": {"dtype": "float32"}})
+    assert memo.SnapshotMemo(cache_dir=str(tmp_path)).lookup("rom", "All Body", twin_inputs, float32) is None
+    twin_file.write_bytes(b"retrained")
+    os.utime(twin_file, (0, 0))
+    retrained = memo.model_stamp(StubTwin(str(twin_file)), {})
+    assert memo.SnapshotMemo(cache_dir=str(tmp_path)).lookup("rom", "All Body", twin_inputs, retrained) is None
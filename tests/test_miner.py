@@ -0,0 +1,64 @@
+import numpy as np
+from modules import miner
+
+def write_curve(path, stress_scale=1.0):
+    with open(path, "w") as f:
+        f.write("Cycles;Stress\n")
+        for cycles, stress in ((1e3, 400.0), (1e5, 200.0), (1e7, 100.0)):
+            f.write(f"{cycles};{stress * stress_scale}\n")
+    return str(path)
+
+def accumulator(tmp_path, curve_file):
+    config = {"additional_files": {"sn_curve_file": curve_file}}
+    return miner.DamageAccumulator(np.array([0.4, 0.6]), config, str(tmp_path / "state"))
+
+def test_zero_range_cycles_are_not_counted(tmp_path):
+    damage = accumulator(tmp_path, write_curve(tmp_path / "sn.csv"))
+    damage._apply([(0.0, 1000.0), (0.2, 1000.0), (1000.0, 1500.0)], 1.0)
+    # Both small ranges round to zero with the default resolution of 1
+    assert damage.cycles == 1
+    assert damage.damage[1] > damage.damage[0] > 0
+
+def test_state_resets_when_the_curve_changes(tmp_path):
+    curve_file = write_curve(tmp_path / "sn.csv")
+    damage = accumulator(tmp_path, curve_file)
+    damage.consume([1000, 3000, 1000, 3000, 1000])
+    assert damage.cycles > 0
+
+    resumed = accumulator(tmp_path, curve_file)
+    assert resumed.cycles == damage.cycles
+    assert np.array_equal(resumed.damage, damage.damage)
+
+    other_curve = accumulator(tmp_path, write_curve(tmp_path / "sn_weld.csv", stress_scale=0.5))
+    assert other_curve.cycles == 0
+    assert other_curve.readings == 0
+    assert not other_curve.damage.any()
+
+def test_replayed_history_is_not_counted_twice(tmp_path):
+    curve_file = write_curve(tmp_path / "sn.csv")
+    history = tmp_path / "history.npy"
+    np.save(history, np.array([1000.0, 3000.0, 1000.0, 3000.0, 1000.0, 2000.0]))
+    sha256 = miner.file_digest(str(history))
+
+    damage = accumulator(tmp_path, curve_file)
+    assert damage.begin("history.npy", sha256) == 0
+    # Interrupted after the first chunk, the next run resumes after it
+    damage.consume(next(miner.read_load_chunks(str(history), None, chunk_size=4)))
+    resumed = accumulator(tmp_path, curve_file)
+    assert resumed.begin("history.npy", sha256) == 4
+    for chunk in miner.read_load_chunks(str(history), None, chunk_size=4, skip=4):
+        resumed.consume(chunk)
+    resumed.finish()
+    assert resumed.readings == 6
+
+    replay = accumulator(tmp_path, curve_file)
+    assert replay.begin("history.npy", sha256) is None
+    assert np.array_equal(replay.damage, resumed.damage)
+
+def test_range_measure_matches_the_static_damage(tmp_path):
+    # A 0 -> F -> 0 cycle does the damage of the static fatigue operation at F
+    curve_file = write_curve(tmp_path / "sn.csv")
+    damage = accumulator(tmp_path, curve_file)
+    damage._apply([(500.0, 250.0)], 1.0)
+    static = 1 / miner.fatigue_curve.evaluate_cycles(np.array([0.4, 0.6]) * 500.0, damage.curve)
+    assert np.allclose(damage.damage, static)
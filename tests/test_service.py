@@ -0,0 +1,43 @@
+import asyncio
+import pytest
+import service
+from modules import utility
+
+class StubWriter:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+def respond(raw):
+    # Status line of the response to raw request bytes, without loading any twin
+    async def scenario():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        writer = StubWriter()
+        await service.TwinService.__new__(service.TwinService).handle_connection(reader, writer)
+        return writer.data.split(b"\r\n", 1)[0]
+    return asyncio.run(scenario())
+
+def test_malformed_requests_get_400():
+    assert respond(b"GET /health HTTP/1.1\r\n\r\n") == b"HTTP/1.1 200 OK"
+    assert respond(b"garbage\r\n\r\n") == b"HTTP/1.1 400 Bad Request"
+    assert respond(b"POST /evaluate HTTP/1.1\r\nno colon\r\n\r\n") == b"HTTP/1.1 400 Bad Request"
+    assert respond(b"POST /evaluate HTTP/1.1\r\nContent-Length: many\r\n\r\n") == b"HTTP/1.1 400 Bad Request"
+    assert respond(b"POST /evaluate HTTP/1.1\r\nContent-Length: 50\r\n\r\n{}") == b"HTTP/1.1 400 Bad Request"
+    assert respond(b"POST /evaluate HTTP/1.1\r\nContent-Length: 6\r\n\r\n[1, 2]") == b"HTTP/1.1 400 Bad Request"
+
+def test_non_numeric_rom_inputs_are_invalid():
+    config = {"inputs": {"Force_Magnitude": {"minimum_value": 0, "maximum_value": 10}}}
+    assert utility.validate_rom_inputs({"Force_Magnitude": 5}, config)
+    for rom_inputs in ({"Force_Magnitude": "5"}, {"Force_Magnitude": None}, {"Force_Magnitude": True}, [5]):
+        with pytest.raises(ValueError):
+            utility.validate_rom_inputs(rom_inputs, config)
@@ -0,0 +1,25 @@
+import os
+import sys
+import json
+import subprocess
+
+# Backends that must only load in the stages that need them, as checked by benchmarks/bench_startup.py
+HEAVY_MODULES = ["ansys.dpf", "pytwin", "pyvista", "vtk", "vtkmodules"]
+
+LOADED_MODULES = """
+import json, sys
+import main
+from modules import utility
+config = utility.load_config('config.yaml')
+input_data = utility.load_json('data/input/input_data.json')
+utility.validate_parameters(input_data, config, verbose=False)
+print(json.dumps(sorted(sys.modules)))
+"""
+
+def test_cli_import_loads_no_heavy_backend():
+    # A fresh interpreter, modules imported by other tests must not hide a regression
+    main_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", LOADED_MODULES], cwd=main_dir, capture_output=True, text=True, check=True)
+    modules = json.loads(result.stdout.strip().splitlines()[-1])
+    loaded = [name for name in modules if any(name == heavy or name.startswith(heavy + ".") for heavy in HEAVY_MODULES)]
+    assert not loaded